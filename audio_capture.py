@@ -0,0 +1,298 @@
+# 麦克风采集
+# 使用PyAudio回调模式采集音频，写入预分配的环形缓冲区，由发送线程批量取出。
+# 设备按原生采样率和通道数打开，取出时再转换为识别需要的格式
+import logging
+import threading
+
+from audio_sources import AudioSource, AudioSourceError, SOURCE_MICROPHONE
+from speech_metrics import registry
+
+logger = logging.getLogger('speech_server')
+
+FRAMES_CAPTURED = registry.counter('speech_audio_frames_captured_total', '麦克风采集回调收到的音频块数')
+
+# PyAudio模块，第一次使用时导入（导入时加载PortAudio动态库，服务启动时不等待）
+pyaudio = None
+
+# 进程内共享的PyAudio实例
+_pyaudio_instance = None
+_pyaudio_lock = threading.Lock()
+
+
+def load_pyaudio():
+    """导入并返回PyAudio模块"""
+    global pyaudio
+    if pyaudio is None:
+        import pyaudio as module
+        pyaudio = module
+    return pyaudio
+
+
+def get_pyaudio():
+    """返回共享的PyAudio实例，首次调用时初始化PortAudio"""
+    global _pyaudio_instance
+    with _pyaudio_lock:
+        if _pyaudio_instance is None:
+            _pyaudio_instance = load_pyaudio().PyAudio()
+        return _pyaudio_instance
+
+
+def terminate_pyaudio():
+    global _pyaudio_instance, _input_devices
+    with _pyaudio_lock:
+        if _pyaudio_instance is not None:
+            _pyaudio_instance.terminate()
+            _pyaudio_instance = None
+        _input_devices = None
+
+
+# 输入设备列表，枚举设备较慢，第一次使用后缓存
+_input_devices = None
+
+
+def list_input_devices(refresh=False):
+    """返回输入设备列表，refresh 为True时重新枚举（例如插拔设备后）"""
+    global _input_devices
+    devices = _input_devices
+    if devices is not None and not refresh:
+        return devices
+    audio = get_pyaudio()
+    try:
+        default_index = audio.get_default_input_device_info()['index']
+    except (IOError, OSError):
+        default_index = None
+    devices = []
+    for index in range(audio.get_device_count()):
+        info = audio.get_device_info_by_index(index)
+        if info.get('maxInputChannels', 0) <= 0:
+            continue
+        try:
+            host_api = audio.get_host_api_info_by_index(info['hostApi'])['name']
+        except Exception:
+            host_api = None
+        devices.append({
+            'index': index,
+            'name': info.get('name'),
+            'channels': int(info['maxInputChannels']),
+            'default_rate': int(info.get('defaultSampleRate') or 0),
+            'host_api': host_api,
+            'is_default': index == default_index,
+        })
+    _input_devices = devices
+    return devices
+
+
+def find_input_device(device_index=None):
+    """按索引查找输入设备，未指定时返回默认输入设备；找不到时抛出 AudioSourceError"""
+    devices = list_input_devices()
+    for device in devices:
+        if (device['index'] == device_index) if device_index is not None else device['is_default']:
+            return device
+    if device_index is None and devices:
+        return devices[0]
+    raise AudioSourceError(f'找不到输入设备: {device_index}' if device_index is not None else '没有可用的输入设备')
+
+
+class AudioRingBuffer:
+    """单生产者/单消费者的字节环形缓冲区
+
+    写入方只修改写位置，读取方只修改读位置，两个位置都是单调递增的整数，
+    在GIL下赋值是原子的，因此数据读写不需要加锁。缓冲区满时丢弃新数据并计为溢出。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._view = memoryview(self._buffer)
+        self._write_pos = 0
+        self._read_pos = 0
+        self._data_ready = threading.Event()
+        self.overruns = 0
+        self.dropped_bytes = 0
+        self.high_watermark = 0
+
+    def available(self):
+        return self._write_pos - self._read_pos
+
+    def write(self, data):
+        """写入数据（仅限生产者线程调用），空间不足时丢弃整块并返回False"""
+        data = memoryview(data)
+        size = len(data)
+        used = self._write_pos - self._read_pos
+        if size > self.capacity - used:
+            self.overruns += 1
+            self.dropped_bytes += size
+            self._data_ready.set()
+            return False
+        start = self._write_pos % self.capacity
+        first = min(size, self.capacity - start)
+        self._view[start:start + first] = data[:first]
+        if first < size:
+            self._view[0:size - first] = data[first:]
+        self._write_pos += size
+        if used + size > self.high_watermark:
+            self.high_watermark = used + size
+        self._data_ready.set()
+        return True
+
+    def read(self, max_bytes, align=1):
+        """取出最多 max_bytes 字节（仅限消费者线程调用），长度按 align 对齐"""
+        size = min(max_bytes, self._write_pos - self._read_pos)
+        size -= size % align
+        if size <= 0:
+            return b''
+        start = self._read_pos % self.capacity
+        first = min(size, self.capacity - start)
+        if first == size:
+            data = bytes(self._view[start:start + size])
+        else:
+            data = bytes(self._view[start:]) + bytes(self._view[0:size - first])
+        self._read_pos += size
+        return data
+
+    def wait(self, timeout):
+        """等待生产者写入新数据"""
+        self._data_ready.clear()
+        if self._write_pos > self._read_pos:
+            return True
+        return self._data_ready.wait(timeout)
+
+    def wake(self):
+        self._data_ready.set()
+
+
+class MicrophoneCapture(AudioSource):
+    """回调模式的麦克风采集器
+
+    PortAudio回调线程只把数据拷贝进环形缓冲区，read() 在发送线程上按批次取出数据，
+    上游发送变慢时数据在缓冲区中积压而不会阻塞设备读取。
+    native 为True时按设备的默认采样率和通道数（最多2个）打开，read() 中转换为 rate/channels；
+    设备不支持原生格式时退回直接以目标格式打开。
+    """
+
+    kind = SOURCE_MICROPHONE
+
+    def __init__(self, rate=16000, channels=1, frames_per_buffer=1600,
+                 batch_bytes=6400, buffer_seconds=10.0, read_timeout=0.5,
+                 device_index=None, name='microphone', native=True):
+        self.rate = rate
+        self.channels = channels
+        self.out_frame_bytes = 2 * channels  # 16位采样
+        self.batch_bytes = batch_bytes - batch_bytes % self.out_frame_bytes
+        self.read_timeout = read_timeout
+        self.name = name
+        self.device = None
+        self.underruns = 0
+        self.input_overflows = 0
+        self.bytes_captured = 0
+        self.bytes_read = 0
+        self.callbacks = 0
+        self._closed = False
+
+        formats = [(rate, channels)]
+        if native:
+            self.device = find_input_device(device_index)
+            device_format = (self.device['default_rate'] or rate, min(2, self.device['channels']) or channels)
+            if device_format != formats[0]:
+                formats.insert(0, device_format)
+        error = None
+        for device_rate, device_channels in formats:
+            try:
+                self._open(device_rate, device_channels, frames_per_buffer, buffer_seconds,
+                           self.device['index'] if self.device is not None else device_index)
+                break
+            except (IOError, OSError, ValueError) as e:
+                logger.warning(f'以 {device_rate}Hz/{device_channels}声道 打开麦克风({name})失败: {e}')
+                error = e
+        else:
+            raise error
+        logger.info(f'已打开麦克风({name})，设备: {self.device["name"] if self.device else "默认"}, '
+                    f'采样率: {self.device_rate}Hz, 通道数: {self.device_channels}, 16位, 回调模式'
+                    + ('' if self.resampler.passthrough else f'，转换为 {rate}Hz/{channels}声道'))
+
+    def _open(self, device_rate, device_channels, frames_per_buffer, buffer_seconds, device_index):
+        from audio_resample import PolyphaseResampler  # 依赖numpy，第一次打开麦克风（或预热）时导入
+        self.device_rate = int(device_rate)
+        self.device_channels = device_channels
+        self.frame_bytes = 2 * device_channels
+        if self.channels == 1:
+            self.resampler = PolyphaseResampler(device_rate, self.rate, device_channels)
+        elif device_rate == self.rate and device_channels == self.channels:
+            self.resampler = PolyphaseResampler(device_rate, self.rate, 1)  # 不转换
+        else:
+            raise ValueError('只支持转换为单声道')
+        self.ring = AudioRingBuffer(int(device_rate * buffer_seconds) * self.frame_bytes)
+        # 回调块的时长与目标格式下的 frames_per_buffer 相同
+        device_frames = max(1, int(frames_per_buffer * device_rate / self.rate))
+        self._stream = get_pyaudio().open(
+            format=load_pyaudio().paInt16,
+            channels=device_channels,
+            rate=self.device_rate,
+            input=True,
+            input_device_index=device_index,
+            frames_per_buffer=device_frames,
+            stream_callback=self._on_audio
+        )
+        self._stream.start_stream()
+        self._device_batch_bytes = self.resampler.input_bytes_for(self.batch_bytes)
+
+    def _on_audio(self, in_data, frame_count, time_info, status_flags):
+        # PortAudio回调线程：只做拷贝，不做日志和网络操作
+        self.callbacks += 1
+        if status_flags & pyaudio.paInputOverflow:
+            self.input_overflows += 1
+        if in_data:
+            self.bytes_captured += len(in_data)
+            self.ring.write(in_data)
+            FRAMES_CAPTURED.inc()
+        return (None, pyaudio.paContinue)
+
+    def read(self):
+        """返回一批音频数据；超时没有数据时返回空字节串，关闭后返回None"""
+        while not self._closed:
+            if self.ring.available() >= self._device_batch_bytes:
+                break
+            if not self.ring.wait(self.read_timeout):
+                # 设备在超时时间内没有产生任何数据
+                if self.ring.available() == 0:
+                    self.underruns += 1
+                break
+        if self._closed and self.ring.available() == 0:
+            return None
+        data = self.ring.read(self._device_batch_bytes, self.frame_bytes)
+        if data:
+            data = self.resampler.process(data)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.ring.wake()
+        try:
+            self._stream.stop_stream()
+            self._stream.close()
+        finally:
+            logger.info(f'已关闭麦克风({self.name})')
+
+    def stats(self):
+        return {
+            'type': self.kind,
+            'rate': self.rate,
+            'channels': self.channels,
+            'device': self.device,
+            'device_rate': self.device_rate,
+            'device_channels': self.device_channels,
+            'resampler': self.resampler.stats(),
+            'callbacks': self.callbacks,
+            'bytes_captured': self.bytes_captured,
+            'bytes_read': self.bytes_read,
+            'buffered_bytes': self.ring.available(),
+            'buffer_capacity': self.ring.capacity,
+            'buffer_high_watermark': self.ring.high_watermark,
+            'overruns': self.ring.overruns,
+            'dropped_bytes': self.ring.dropped_bytes,
+            'underruns': self.underruns,
+            'input_overflows': self.input_overflows,
+        }
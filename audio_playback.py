@@ -0,0 +1,285 @@
+# 本地音频播放
+# 所有TTS会话共用一个输出流和一个播放线程，每个会话有独立的抖动缓冲区。
+# 合成回调只把数据放入缓冲区，不会因为声卡写入而阻塞网络接收
+import logging
+import threading
+import time
+from collections import deque
+
+from audio_capture import get_pyaudio, load_pyaudio
+from tts_stream import find_wav_data_offset
+
+logger = logging.getLogger('speech_server')
+
+MODE_QUEUE = 'queue'  # 按会话开始的先后依次播放
+MODE_MIX = 'mix'      # 多个会话同时播放，混音输出
+
+
+class PlaybackChannel:
+    """单个会话的抖动缓冲区
+
+    缓冲的数据达到 prebuffer_bytes 或数据已全部到达后才开始播放，吸收网络抖动。
+    write() 从不阻塞，超过 max_bytes 时丢弃最早的数据并计为溢出。
+    """
+
+    def __init__(self, engine, name, prebuffer_bytes, max_bytes):
+        self.engine = engine
+        self.name = name
+        self.prebuffer_bytes = prebuffer_bytes
+        self.max_bytes = max_bytes
+        self._chunks = deque()
+        self._buffered = 0
+        self._header = b''
+        self._header_done = False
+        self.started = False   # 已开始播放
+        self.ended = False     # 数据已全部到达
+        self.cancelled = False
+        self.created_at = time.monotonic()
+        self.bytes_written = 0
+        self.bytes_played = 0
+        self.bytes_dropped = 0
+        self.overflows = 0
+        self.underruns = 0
+        self.first_audio_latency = None  # 从创建到开始播放的秒数
+
+    @property
+    def buffered(self):
+        return self._buffered
+
+    @property
+    def finished(self):
+        return self.cancelled or (self.ended and self._buffered == 0)
+
+    def write(self, data):
+        """放入一块音频（仅由合成回调线程调用），流开头的WAV头会被去掉"""
+        if self.cancelled or self.ended or not data:
+            return
+        if not self._header_done:
+            self._header += data
+            offset = find_wav_data_offset(self._header)
+            if offset is None:
+                return
+            data = self._header[offset:]
+            self._header = b''
+            self._header_done = True
+            if not data:
+                return
+        with self.engine._cond:
+            self._chunks.append(data)
+            self._buffered += len(data)
+            self.bytes_written += len(data)
+            while self._buffered > self.max_bytes and len(self._chunks) > 1:
+                dropped = self._chunks.popleft()
+                self._buffered -= len(dropped)
+                self.bytes_dropped += len(dropped)
+                self.overflows += 1
+            self.engine._cond.notify_all()
+
+    def end(self):
+        """数据已全部到达，缓冲区播放完后通道自动移除"""
+        with self.engine._cond:
+            self.ended = True
+            self.engine._cond.notify_all()
+
+    def cancel(self):
+        """立即停止播放并清空缓冲区"""
+        with self.engine._cond:
+            self.cancelled = True
+            self._chunks.clear()
+            self._buffered = 0
+            self.engine._cond.notify_all()
+
+    def ready(self):
+        # 调用方必须持有引擎的锁
+        if self.started:
+            return True
+        if self._buffered >= self.prebuffer_bytes or (self.ended and self._buffered > 0):
+            self.started = True
+            self.first_audio_latency = time.monotonic() - self.created_at
+            return True
+        return False
+
+    def read(self, size):
+        """取出最多 size 字节（调用方必须持有引擎的锁）"""
+        parts = []
+        needed = size
+        while needed > 0 and self._chunks:
+            chunk = self._chunks[0]
+            if len(chunk) <= needed:
+                parts.append(self._chunks.popleft())
+                needed -= len(chunk)
+            else:
+                parts.append(chunk[:needed])
+                self._chunks[0] = chunk[needed:]
+                needed = 0
+        data = b''.join(parts)
+        self._buffered -= len(data)
+        self.bytes_played += len(data)
+        return data
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'started': self.started,
+            'ended': self.ended,
+            'cancelled': self.cancelled,
+            'buffered_bytes': self._buffered,
+            'bytes_written': self.bytes_written,
+            'bytes_played': self.bytes_played,
+            'bytes_dropped': self.bytes_dropped,
+            'overflows': self.overflows,
+            'underruns': self.underruns,
+            'first_audio_latency_ms': self.first_audio_latency * 1000 if self.first_audio_latency is not None else None,
+        }
+
+
+class PlaybackEngine:
+    """共享的播放引擎：一个输出流 + 一个播放线程
+
+    mode 为 'queue' 时各会话依次播放，为 'mix' 时同时播放的会话混音输出。
+    输出流在第一次有数据时打开，空闲超过 idle_close_seconds 后关闭以释放声卡。
+    """
+
+    def __init__(self, rate=16000, frame_ms=40, prebuffer_ms=200, max_buffer_seconds=120.0,
+                 mode=MODE_QUEUE, idle_close_seconds=10.0):
+        if mode not in (MODE_QUEUE, MODE_MIX):
+            raise ValueError(f'未知的播放模式: {mode}')
+        self.rate = rate
+        self.frame_bytes = rate * frame_ms // 1000 * 2
+        self.prebuffer_bytes = rate * prebuffer_ms // 1000 * 2
+        self.max_buffer_bytes = int(rate * max_buffer_seconds) * 2
+        self.mode = mode
+        self.idle_close_seconds = idle_close_seconds
+        self._cond = threading.Condition()
+        self._channels = []
+        self._stream = None
+        self._thread = None
+        self._closed = False
+        self._silence = bytes(self.frame_bytes)
+        self.frames_written = 0
+        self.underruns = 0
+        self.overflows = 0
+        self.device_errors = 0
+        self.channels_opened = 0
+
+    def open_channel(self, name):
+        with self._cond:
+            channel = PlaybackChannel(self, name, self.prebuffer_bytes, self.max_buffer_bytes)
+            self._channels.append(channel)
+            self.channels_opened += 1
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='tts-playback', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            return channel
+
+    def _open_stream(self):
+        if self._stream is None:
+            self._stream = get_pyaudio().open(
+                format=load_pyaudio().paInt16,
+                channels=1,
+                rate=self.rate,
+                output=True,
+                frames_per_buffer=self.frame_bytes // 2
+            )
+            logger.info(f'已打开音频输出流，采样率: {self.rate}Hz, 模式: {self.mode}')
+
+    def _close_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop_stream()
+                self._stream.close()
+            except Exception as e:
+                logger.warning(f'关闭音频输出流出错: {e}')
+            self._stream = None
+            logger.info('已关闭音频输出流')
+
+    def _retire_finished(self):
+        # 调用方必须持有 self._cond
+        for channel in [c for c in self._channels if c.finished]:
+            self._channels.remove(channel)
+            self.underruns += channel.underruns
+            self.overflows += channel.overflows
+
+    def _next_frame(self):
+        """组装下一帧输出，没有任何会话在播放时返回None（调用方必须持有 self._cond）"""
+        self._retire_finished()
+        if self.mode == MODE_QUEUE:
+            # 只播放最早的会话，它播放完之前后面的会话只缓冲
+            playing = self._channels[:1]
+        else:
+            playing = self._channels
+        playing = [c for c in playing if c.ready()]
+        if not playing:
+            return None
+        frames = []
+        for channel in playing:
+            data = channel.read(self.frame_bytes)
+            if len(data) < self.frame_bytes and not channel.ended:
+                # 数据还没到达：用静音补齐，记为欠载
+                channel.underruns += 1
+            if data:
+                frames.append(data.ljust(self.frame_bytes, b'\0'))
+        if not frames:
+            return self._silence
+        if len(frames) == 1:
+            return frames[0]
+        import numpy as np  # 只有混音模式需要，启动时不导入
+        mixed = np.sum([np.frombuffer(f, dtype=np.int16).astype(np.int32) for f in frames], axis=0)
+        return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+
+    def _run(self):
+        idle_since = None
+        while True:
+            with self._cond:
+                if self._closed:
+                    break
+                frame = self._next_frame()
+                if frame is None:
+                    if idle_since is None:
+                        idle_since = time.monotonic()
+                    if self._stream is not None and time.monotonic() - idle_since >= self.idle_close_seconds:
+                        self._close_stream()
+                    self._cond.wait(0.5)
+                    continue
+            idle_since = None
+            try:
+                self._open_stream()
+                # 写入在锁外进行，声卡阻塞不影响回调放入数据
+                self._stream.write(frame)
+                self.frames_written += 1
+            except Exception as e:
+                self.device_errors += 1
+                logger.error(f'音频输出出错: {e}')
+                self._close_stream()
+                time.sleep(1.0)
+        self._close_stream()
+
+    def cancel_all(self):
+        with self._cond:
+            channels = list(self._channels)
+        for channel in channels:
+            channel.cancel()
+
+    def close(self):
+        self.cancel_all()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(2.0)
+
+    def stats(self):
+        with self._cond:
+            channels = [c.stats() for c in self._channels]
+            return {
+                'mode': self.mode,
+                'device_open': self._stream is not None,
+                'channels': channels,
+                'channels_opened': self.channels_opened,
+                'frames_written': self.frames_written,
+                'underruns': self.underruns + sum(c['underruns'] for c in channels),
+                'overflows': self.overflows + sum(c['overflows'] for c in channels),
+                'device_errors': self.device_errors,
+            }
@@ -0,0 +1,134 @@
+# 采样率转换
+# 把设备原生格式（如48kHz/44.1kHz立体声）的16位PCM转换为识别服务需要的单声道16位PCM。
+# 多相FIR重采样，按块向量化计算，块之间保留滤波器历史，连续调用的输出与一次处理整段相同
+import math
+import time
+
+import numpy as np
+
+from speech_metrics import registry
+
+RESAMPLE_SECONDS = registry.counter('speech_audio_resample_seconds_total', '采集音频格式转换占用的CPU时间（秒）')
+
+DEFAULT_TAPS_PER_PHASE = 16  # 每个相位的滤波器长度，越长阻带衰减越好、计算量越大
+KAISER_BETA = 8.0
+ROLLOFF = 0.9                # 截止频率相对于输出奈奎斯特频率的比例
+INDEX_CACHE_SIZE = 64        # 缓存的取样下标表个数（按块长和起始相位）
+
+
+def design_polyphase_filter(up, down, taps_per_phase=DEFAULT_TAPS_PER_PHASE):
+    """设计 up/down 倍重采样的低通滤波器，返回形状为 (up, taps_per_phase) 的各相位系数"""
+    length = up * taps_per_phase
+    cutoff = ROLLOFF * 0.5 / max(up, down)  # 以上采样后的采样率归一化
+    n = np.arange(length) - (length - 1) / 2.0
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, KAISER_BETA)
+    # 每个相位的直流增益为1
+    h *= up / h.sum()
+    # phases[p, k] = h[p + k * up]
+    return np.ascontiguousarray(h.reshape(taps_per_phase, up).T, dtype=np.float32)
+
+
+class PolyphaseResampler:
+    """流式的16位PCM格式转换：多声道取平均混为单声道，再做 in_rate -> out_rate 重采样
+
+    采样率和声道都与目标相同时直接返回输入。process() 不是线程安全的，每个音频流使用独立实例。
+    """
+
+    def __init__(self, in_rate, out_rate=16000, in_channels=1, taps_per_phase=DEFAULT_TAPS_PER_PHASE):
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.in_channels = max(1, int(in_channels))
+        self.frame_bytes = 2 * self.in_channels
+        divisor = math.gcd(self.in_rate, self.out_rate)
+        self.up = self.out_rate // divisor
+        self.down = self.in_rate // divisor
+        self.passthrough = self.up == self.down and self.in_channels == 1
+        self.taps = taps_per_phase if self.up != self.down else 1
+        self.phases = (design_polyphase_filter(self.up, self.down, self.taps)
+                       if self.up != self.down else np.ones((1, 1), dtype=np.float32))
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._position = 0  # 下一个输出样本在当前块中的位置，单位为 1/up 个输入样本
+        self._work = np.zeros(0, dtype=np.float32)
+        self._index_cache = {}
+        self._odd = b''  # 不足一帧的尾部字节，留到下一块
+        self.cpu_seconds = 0.0
+        self.frames_in = 0
+        self.frames_out = 0
+
+    def _indices(self, count, position):
+        # (块长, 起始相位) 相同时取样下标完全相同，固定大小的采集块只计算一次
+        key = (count, position)
+        cached = self._index_cache.get(key)
+        if cached is not None:
+            return cached
+        outputs = max(0, (count * self.up - position + self.down - 1) // self.down)
+        positions = position + np.arange(outputs, dtype=np.int64) * self.down
+        base = positions // self.up
+        phase = positions % self.up
+        # 工作区前 taps-1 个样本为历史，输入样本 i 位于 i + taps - 1
+        gather = base[:, None] + (self.taps - 1) - np.arange(self.taps)[None, :]
+        next_position = position + outputs * self.down - count * self.up
+        cached = (gather, self.phases[phase], next_position)
+        if len(self._index_cache) >= INDEX_CACHE_SIZE:
+            self._index_cache.clear()
+        self._index_cache[key] = cached
+        return cached
+
+    def _mono(self, samples):
+        if self.in_channels == 1:
+            return samples.astype(np.float32)
+        return samples.reshape(-1, self.in_channels).mean(axis=1, dtype=np.float32)
+
+    def process(self, data):
+        """转换一块PCM数据，返回目标格式的字节串（长度随块边界略有变化）"""
+        if self.passthrough:
+            return data
+        started = time.thread_time()
+        data = self._odd + bytes(data)
+        usable = len(data) - len(data) % self.frame_bytes
+        data, self._odd = data[:usable], data[usable:]
+        if not data:
+            return b''
+        mono = self._mono(np.frombuffer(data, dtype=np.int16))
+        count = len(mono)
+        self.frames_in += count
+        if self.up == self.down:
+            out = mono
+        else:
+            size = count + self.taps - 1
+            if len(self._work) < size:
+                self._work = np.empty(size, dtype=np.float32)
+            work = self._work[:size]
+            work[:self.taps - 1] = self._history
+            work[self.taps - 1:] = mono
+            gather, coefficients, self._position = self._indices(count, self._position)
+            out = np.einsum('nk,nk->n', work[gather], coefficients)
+            self._history = work[count:].copy()
+        np.clip(out, -32768, 32767, out=out)
+        result = np.rint(out).astype(np.int16).tobytes()
+        self.frames_out += len(out)
+        elapsed = time.thread_time() - started
+        self.cpu_seconds += elapsed
+        RESAMPLE_SECONDS.inc(elapsed)
+        return result
+
+    def input_bytes_for(self, output_bytes):
+        """得到 output_bytes 字节输出大约需要的输入字节数（按帧对齐）"""
+        frames = math.ceil(output_bytes / 2 * self.down / self.up)
+        return frames * self.frame_bytes
+
+    def stats(self):
+        audio_seconds = self.frames_in / self.in_rate if self.in_rate else 0.0
+        return {
+            'in_rate': self.in_rate,
+            'in_channels': self.in_channels,
+            'out_rate': self.out_rate,
+            'ratio': f'{self.up}/{self.down}',
+            'taps_per_phase': self.taps,
+            'passthrough': self.passthrough,
+            'frames_in': self.frames_in,
+            'frames_out': self.frames_out,
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            # 每秒音频占用的CPU时间
+            'cpu_ratio': round(self.cpu_seconds / audio_seconds, 6) if audio_seconds else 0.0,
+        }
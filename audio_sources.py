@@ -0,0 +1,224 @@
+# 识别音频来源
+# 识别会话通过统一接口读取音频：本机麦克风、客户端上传的PCM流、或本地WAV/PCM文件回放
+import logging
+import os
+import queue
+import threading
+import time
+import wave
+
+logger = logging.getLogger('speech_server')
+
+SOURCE_MICROPHONE = 'microphone'
+SOURCE_STREAM = 'stream'
+SOURCE_FILE = 'file'
+
+
+class AudioSourceError(Exception):
+    """音频来源无法创建或参数不正确"""
+
+
+class AudioSource:
+    """音频来源接口
+
+    read() 返回一批16位单声道PCM数据；暂时没有数据时返回空字节串，
+    来源已结束时返回None。read() 必须在有限时间内返回，以便会话能及时停止。
+    """
+
+    kind = None
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {'type': self.kind}
+
+
+class PushAudioSource(AudioSource):
+    """由外部推入数据的音频来源（客户端通过HTTP分块上传PCM）"""
+
+    kind = SOURCE_STREAM
+
+    def __init__(self, rate=16000, batch_bytes=6400, max_buffered_chunks=256, read_timeout=0.5):
+        self.rate = rate
+        self.batch_bytes = batch_bytes
+        self.read_timeout = read_timeout
+        self._queue = queue.Queue(maxsize=max_buffered_chunks)
+        self._pending = b''
+        self._ended = False
+        self._closed = False
+        self._odd_byte = b''
+        self._push_lock = threading.Lock()
+        self.bytes_pushed = 0
+        self.bytes_read = 0
+        self.push_timeouts = 0
+
+    def push(self, data, timeout=5.0):
+        """推入PCM数据，缓冲区满时阻塞最多 timeout 秒（对上传方形成背压）"""
+        if self._ended or self._closed:
+            raise AudioSourceError('音频流已结束')
+        with self._push_lock:
+            # end() 持有同一把锁，结束标记之后不会再有数据入队
+            if self._ended:
+                raise AudioSourceError('音频流已结束')
+            # 保证每次入队的数据按16位采样对齐
+            data = self._odd_byte + bytes(data)
+            cut = len(data) - len(data) % 2
+            data, self._odd_byte = data[:cut], data[cut:]
+            if not data:
+                return
+            try:
+                self._queue.put(data, timeout=timeout)
+            except queue.Full:
+                self.push_timeouts += 1
+                raise AudioSourceError('音频缓冲区已满，客户端上传过快或识别端处理过慢')
+            self.bytes_pushed += len(data)
+
+    @property
+    def ended(self):
+        return self._ended
+
+    def end(self):
+        """标记上传结束，剩余数据读完后 read() 返回None"""
+        with self._push_lock:
+            self._ended = True
+        # 结束标记只用于及早唤醒读取方，队列已满时由 read() 根据 _ended 判断
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def read(self):
+        chunks = [self._pending] if self._pending else []
+        size = len(self._pending)
+        self._pending = b''
+        deadline = time.monotonic() + self.read_timeout
+        while size < self.batch_bytes and not self._closed:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    chunk = self._queue.get(timeout=remaining)
+                else:
+                    chunk = self._queue.get_nowait()
+            except queue.Empty:
+                if self._ended and self._queue.empty():
+                    self._closed = True
+                break
+            if chunk is None:
+                self._closed = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        data = b''.join(chunks)
+        if len(data) > self.batch_bytes:
+            data, self._pending = data[:self.batch_bytes], data[self.batch_bytes:]
+        if not data and self._closed:
+            return None
+        self.bytes_read += len(data)
+        return data
+
+    def close(self):
+        self._closed = True
+        self._ended = True
+
+    def stats(self):
+        return {
+            'type': self.kind,
+            'rate': self.rate,
+            'bytes_pushed': self.bytes_pushed,
+            'bytes_read': self.bytes_read,
+            'buffered_chunks': self._queue.qsize(),
+            'push_timeouts': self.push_timeouts,
+            'ended': self._ended,
+        }
+
+
+class FileAudioSource(AudioSource):
+    """WAV/PCM文件回放
+
+    speed 为回放速度倍数（1.0为实时），为0时不做节流，尽可能快地读取。
+    """
+
+    kind = SOURCE_FILE
+
+    def __init__(self, path, rate=16000, batch_bytes=6400, speed=1.0, loop=False):
+        if not os.path.isfile(path):
+            raise AudioSourceError(f'音频文件不存在: {path}')
+        self.path = path
+        self.batch_bytes = batch_bytes - batch_bytes % 2
+        self.speed = speed
+        self.loop = loop
+        self.rate = rate
+        self._wave = None
+        self._file = None
+        self._closed = False
+        self._start_time = None
+        self.bytes_read = 0
+        self.loops = 0
+        self._open()
+
+    def _open(self):
+        if self.path.lower().endswith('.wav'):
+            wav = wave.open(self.path, 'rb')
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1 or wav.getframerate() != self.rate:
+                params = (wav.getframerate(), wav.getnchannels(), wav.getsampwidth() * 8)
+                wav.close()
+                raise AudioSourceError(
+                    f'不支持的WAV格式: {params[0]}Hz/{params[1]}声道/{params[2]}位，'
+                    f'需要 {self.rate}Hz/单声道/16位')
+            self._wave = wav
+        else:
+            # 其他扩展名按原始16位单声道PCM处理
+            self._file = open(self.path, 'rb')
+
+    def _read_raw(self, size):
+        if self._wave is not None:
+            return self._wave.readframes(size // 2)
+        return self._file.read(size)
+
+    def _rewind(self):
+        if self._wave is not None:
+            self._wave.rewind()
+        else:
+            self._file.seek(0)
+
+    def read(self):
+        if self._closed:
+            return None
+        if self._start_time is None:
+            self._start_time = time.monotonic()
+        data = self._read_raw(self.batch_bytes)
+        if not data and self.loop:
+            self.loops += 1
+            self._rewind()
+            data = self._read_raw(self.batch_bytes)
+        if not data:
+            return None
+        self.bytes_read += len(data)
+        if self.speed:
+            # 按回放速度节流：等到这批数据在时间轴上的结束时刻
+            due = self._start_time + self.bytes_read / (self.rate * 2 * self.speed)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return data
+
+    def close(self):
+        self._closed = True
+        if self._wave is not None:
+            self._wave.close()
+        if self._file is not None:
+            self._file.close()
+
+    def stats(self):
+        return {
+            'type': self.kind,
+            'path': self.path,
+            'speed': self.speed,
+            'bytes_read': self.bytes_read,
+            'audio_seconds': self.bytes_read / (self.rate * 2),
+            'loops': self.loops,
+        }
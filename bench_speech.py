@@ -0,0 +1,545 @@
+# 语音服务端到端基准测试
+# 通过HTTP接口驱动识别和合成会话，逐级提高并发数，统计接口延迟、首个识别结果/首个音频字节的时间、
+# 可持续的最大并发会话数以及每个会话的CPU和内存开销，结果保存为JSON便于在不同提交之间比较。
+#
+# 默认在本进程内以离线替身后端（SPEECH_BACKEND=fake）启动服务器；指定 --url 时测试已运行的服务器。
+# 用法:
+#   python bench_speech.py --levels 1,2,4,8
+#   python bench_speech.py --url http://127.0.0.1:2047 --server-pid 1234
+#   python bench_speech.py --compare bench_results/上一次.json
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import wave
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+RATE = 16000                  # 识别音频采样率
+POLL_INTERVAL = 0.02          # 轮询识别结果的间隔（秒）
+SESSION_TIMEOUT = 60.0        # 单个会话的最长等待时间（秒）
+RESOURCE_SAMPLE_INTERVAL = 0.1  # 内存采样间隔（秒）
+DEFAULT_TTS_TEXT = '你好，这是一段用于测试语音合成延迟的文本。今天天气很好，我们出去走走吧。'
+# 与上一次结果比较时输出的指标，值越小越好
+COMPARE_METRICS = ('request_p95_ms', 'asr_first_partial_p95_ms', 'asr_final_p95_ms',
+                   'tts_first_audio_p95_ms', 'cpu_ms_per_session', 'rss_kb_per_session', 'error_rate')
+
+
+def percentile(values, q):
+    """线性插值的分位数，没有数据时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None,
+    }
+
+
+def generate_audio(path, seconds):
+    """生成测试用的WAV文件：音节般起伏的正弦音，中间夹杂停顿"""
+    t = np.arange(int(RATE * seconds)) / RATE
+    envelope = np.clip(np.sin(2 * np.pi * 2.5 * t), 0, None) * (np.sin(2 * np.pi * 0.25 * t) > -0.7)
+    samples = (np.sin(2 * np.pi * 220 * t) * envelope * 8000).astype(np.int16)
+    with wave.open(path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(samples.tobytes())
+    return path
+
+
+class ResourceMonitor:
+    """采样进程的CPU时间和常驻内存，优先使用psutil，否则读取 /proc（仅限本进程）"""
+
+    def __init__(self, pid=None):
+        self.pid = pid
+        self._process = psutil.Process(pid) if psutil is not None else None
+        self.available = self._process is not None or (pid is None and os.path.exists('/proc/self/statm'))
+        self._stop = threading.Event()
+        self._thread = None
+        self.peak_rss = None
+
+    def cpu_seconds(self):
+        if self._process is not None:
+            times = self._process.cpu_times()
+            return times.user + times.system
+        if self.pid is None:
+            times = os.times()
+            return times.user + times.system
+        return None
+
+    def rss(self):
+        if self._process is not None:
+            return self._process.memory_info().rss
+        if self.available:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        return None
+
+    def start(self):
+        self.peak_rss = self.rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='bench-monitor', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(RESOURCE_SAMPLE_INTERVAL):
+            rss = self.rss()
+            if rss is not None and (self.peak_rss is None or rss > self.peak_rss):
+                self.peak_rss = rss
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.peak_rss
+
+
+class SpeechClient:
+    """调用语音服务接口，记录每个请求的延迟"""
+
+    def __init__(self, base_url, timeout=SESSION_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.latencies = {}   # 接口 -> 毫秒列表
+        self.errors = {}      # 接口 -> 失败次数
+        self.status_codes = {}
+
+    def _record(self, endpoint, elapsed_ms, status, ok):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed_ms)
+            self.status_codes[status] = self.status_codes.get(status, 0) + 1
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def request(self, method, path, payload=None, endpoint=None):
+        """返回 (状态码, JSON内容)，网络错误时状态码为0"""
+        endpoint = endpoint or path.split('?')[0]
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                status, content = resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            self._record(endpoint, (time.perf_counter() - started) * 1000, 0, False)
+            return 0, {'message': str(e)}
+        self._record(endpoint, (time.perf_counter() - started) * 1000, status, status < 400)
+        try:
+            return status, json.loads(content or b'{}')
+        except ValueError:
+            return status, {}
+
+    def open_stream(self, path):
+        return urllib.request.urlopen(self.base_url + path, timeout=self.timeout)
+
+    def reset(self):
+        with self._lock:
+            self.latencies = {}
+            self.errors = {}
+            self.status_codes = {}
+
+
+def run_asr_session(client, audio_path, speed, vad):
+    """启动一个文件回放的识别会话并轮询结果，返回计时数据"""
+    session_id = f'bench-asr-{uuid.uuid4().hex[:8]}'
+    payload = {'session_id': session_id, 'source': 'file', 'file_path': audio_path, 'speed': speed}
+    if vad is not None:
+        payload['vad'] = vad
+    result = {'ok': False, 'first_partial_ms': None, 'final_ms': None, 'complete_ms': None, 'status': None}
+    started = time.perf_counter()
+    status, body = client.request('POST', '/api/speech/start', payload)
+    result['status'] = status
+    if status != 200:
+        result['error'] = body.get('message')
+        return result
+
+    cursor = 0
+    deadline = started + SESSION_TIMEOUT
+    try:
+        while time.perf_counter() < deadline:
+            status, body = client.request('GET', f'/api/speech/results?session_id={session_id}&after={cursor}')
+            if status != 200:
+                result['error'] = body.get('message')
+                return result
+            if body.get('cursor') is not None:
+                cursor = body['cursor']
+            now_ms = (time.perf_counter() - started) * 1000
+            for item in body.get('results', []):
+                if item.get('type') == 'text':
+                    if result['first_partial_ms'] is None:
+                        result['first_partial_ms'] = now_ms
+                    if item.get('is_end') and result['final_ms'] is None:
+                        result['final_ms'] = now_ms
+                elif item.get('type') == 'error':
+                    result['error'] = item.get('message') or item.get('error')
+                    return result
+                elif item.get('type') == 'complete':
+                    result['complete_ms'] = now_ms
+            if result['complete_ms'] is not None:
+                result['ok'] = result['final_ms'] is not None
+                return result
+            time.sleep(POLL_INTERVAL)
+        result['error'] = '等待识别完成超时'
+        return result
+    finally:
+        # 文件回放结束后会话可能已自行结束，此时停止接口返回400，不计为失败
+        client.request('POST', '/api/speech/stop', {'session_id': session_id})
+
+
+def run_tts_session(client, text, voice):
+    """启动一个TTS会话，边合成边读取音频流，返回首个音频字节的时间"""
+    result = {'ok': False, 'first_audio_ms': None, 'complete_ms': None, 'audio_bytes': 0, 'status': None}
+    payload = {'playback': False}
+    if voice:
+        payload['voice'] = voice
+    started = time.perf_counter()
+    status, body = client.request('POST', '/api/tts/start', payload)
+    result['status'] = status
+    if status != 200:
+        result['error'] = body.get('message')
+        return result
+    session_id = body['session_id']
+    result['pooled'] = body.get('pooled')
+
+    synth_started = [None]
+    first_byte = threading.Event()
+
+    def read_audio():
+        try:
+            with client.open_stream(f'/api/tts/audio/{session_id}?stream=1&format=pcm') as resp:
+                while True:
+                    chunk = resp.read1(4096) if hasattr(resp, 'read1') else resp.read(4096)
+                    if not chunk:
+                        break
+                    if not first_byte.is_set() and synth_started[0] is not None:
+                        result['first_audio_ms'] = (time.perf_counter() - synth_started[0]) * 1000
+                        first_byte.set()
+                    result['audio_bytes'] += len(chunk)
+        except Exception as e:
+            result.setdefault('error', f'读取音频流失败: {e}')
+
+    synth_started[0] = time.perf_counter()
+    reader = threading.Thread(target=read_audio, name='bench-tts-reader', daemon=True)
+    reader.start()
+    try:
+        status, body = client.request('POST', '/api/tts/synthesize',
+                                      {'session_id': session_id, 'text': text, 'is_complete': True})
+        if status != 200:
+            result['error'] = body.get('message')
+            return result
+        status, body = client.request('POST', '/api/tts/status', {'session_id': session_id, 'wait': 10})
+        result['complete_ms'] = (time.perf_counter() - started) * 1000
+        reader.join(SESSION_TIMEOUT)
+        result['ok'] = status == 200 and body.get('is_complete') and not body.get('error') and result['audio_bytes'] > 0
+        if not result['ok']:
+            result.setdefault('error', body.get('error') or '合成未完成')
+        return result
+    finally:
+        client.request('POST', '/api/tts/stop', {'session_id': session_id})
+
+
+def run_level(client, monitor, args, concurrency, audio_path):
+    """以指定并发数同时运行若干轮会话"""
+    client.reset()
+    asr_results = []
+    tts_results = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(args.rounds):
+            if args.mode in ('asr', 'both'):
+                r = run_asr_session(client, audio_path, args.speed, args.vad)
+                with lock:
+                    asr_results.append(r)
+            if args.mode in ('tts', 'both'):
+                # 每个会话使用不同的文本，避免命中TTS缓存（缓存在多次运行之间保留）
+                text = args.text if args.cache else f'{args.text}（{uuid.uuid4().hex[:6]}）'
+                r = run_tts_session(client, text, args.voice)
+                with lock:
+                    tts_results.append(r)
+
+    cpu_before = monitor.cpu_seconds() if monitor else None
+    rss_before = monitor.rss() if monitor else None
+    if monitor:
+        monitor.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f'bench-worker-{i}') for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    peak_rss = monitor.stop() if monitor else None
+    cpu_after = monitor.cpu_seconds() if monitor else None
+
+    sessions = len(asr_results) + len(tts_results)
+    failures = [r for r in asr_results + tts_results if not r['ok']]
+    rejected = sum(1 for r in asr_results + tts_results if r['status'] == 429)
+    all_latencies = [ms for values in client.latencies.values() for ms in values]
+    # synthesize 和 status(wait) 会等待合成结束，不计入总体请求延迟，单独列在 endpoints 中
+    blocking = ('/api/tts/synthesize', '/api/tts/status')
+    request_latencies = [ms for endpoint, values in client.latencies.items() if endpoint not in blocking for ms in values]
+
+    level = {
+        'concurrency': concurrency,
+        'sessions': sessions,
+        'wall_seconds': wall,
+        'sessions_per_second': sessions / wall if wall > 0 else None,
+        'errors': len(failures),
+        'rejected': rejected,
+        'error_rate': len(failures) / sessions if sessions else 0.0,
+        'error_samples': sorted({str(r.get('error')) for r in failures})[:5],
+        'status_codes': {str(k): v for k, v in sorted(client.status_codes.items())},
+        'requests': summarize(request_latencies),
+        'all_requests': summarize(all_latencies),
+        'endpoints': {endpoint: dict(summarize(values), errors=client.errors.get(endpoint, 0))
+                      for endpoint, values in sorted(client.latencies.items())},
+        'asr_first_partial_ms': summarize([r['first_partial_ms'] for r in asr_results if r['first_partial_ms'] is not None]),
+        'asr_final_ms': summarize([r['final_ms'] for r in asr_results if r['final_ms'] is not None]),
+        'tts_first_audio_ms': summarize([r['first_audio_ms'] for r in tts_results if r['first_audio_ms'] is not None]),
+        'tts_complete_ms': summarize([r['complete_ms'] for r in tts_results if r['complete_ms'] is not None]),
+        'cpu_ms_per_session': None,
+        'rss_kb_per_session': None,
+    }
+    if cpu_before is not None and cpu_after is not None and sessions:
+        level['cpu_ms_per_session'] = (cpu_after - cpu_before) * 1000 / sessions
+    if rss_before is not None and peak_rss is not None:
+        # 峰值内存的增量按同时进行的会话数分摊
+        level['rss_kb_per_session'] = max(0, peak_rss - rss_before) / 1024 / concurrency
+        level['peak_rss_kb'] = peak_rss / 1024
+    level['sustainable'] = is_sustainable(level, args)
+    return level
+
+
+def is_sustainable(level, args):
+    if level['rejected'] or level['error_rate'] > args.max_error_rate:
+        return False
+    for key in ('asr_first_partial_ms', 'tts_first_audio_ms'):
+        p95 = level[key]['p95']
+        if p95 is not None and p95 > args.latency_budget_ms:
+            return False
+    return True
+
+
+def start_local_server(args, replay_dir=None):
+    """在本进程内以离线替身后端启动服务器，返回 (地址, 模块)
+
+    replay_dir 为识别测试音频所在的目录，服务器只允许回放该目录中的文件。
+    """
+    os.environ.setdefault('SPEECH_BACKEND', 'fake')
+    if replay_dir:
+        os.environ['SPEECH_REPLAY_DIR'] = replay_dir
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import logging
+    from werkzeug.serving import make_server
+    import speech_server
+
+    # 调试日志会显著影响测试结果
+    for name in ('speech_server', 'werkzeug'):
+        logging.getLogger(name).setLevel(getattr(logging, args.log_level.upper()))
+    if args.max_recognition_sessions:
+        speech_server.recognition_manager.max_sessions = args.max_recognition_sessions
+    speech_server.prepare_speech_backend()
+    server = make_server('127.0.0.1', 0, speech_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server, speech_server
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def level_metrics(level):
+    return {
+        'request_p95_ms': level['requests']['p95'],
+        'asr_first_partial_p95_ms': level['asr_first_partial_ms']['p95'],
+        'asr_final_p95_ms': level['asr_final_ms']['p95'],
+        'tts_first_audio_p95_ms': level['tts_first_audio_ms']['p95'],
+        'cpu_ms_per_session': level['cpu_ms_per_session'],
+        'rss_kb_per_session': level['rss_kb_per_session'],
+        'error_rate': level['error_rate'],
+    }
+
+
+def compare_results(current, previous_path):
+    """与之前保存的结果逐级比较，打印变化百分比"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"\n与 {previous_path} (提交 {previous.get('git_revision')}) 比较:")
+    previous_levels = {level['concurrency']: level for level in previous.get('levels', [])}
+    for level in current['levels']:
+        old = previous_levels.get(level['concurrency'])
+        if old is None:
+            continue
+        print(f"  并发 {level['concurrency']}:")
+        new_metrics, old_metrics = level_metrics(level), level_metrics(old)
+        for name in COMPARE_METRICS:
+            new_value, old_value = new_metrics[name], old_metrics[name]
+            if new_value is None or old_value is None:
+                continue
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            marker = '  <-- 变慢' if change > 10 else ''
+            print(f'    {name:<26} {old_value:>10.2f} -> {new_value:>10.2f} ({change:+.1f}%){marker}')
+    old_max = previous.get('max_sustainable_concurrency')
+    print(f"  最大可持续并发: {old_max} -> {current['max_sustainable_concurrency']}")
+
+
+def print_level(level):
+    def fmt(summary):
+        if not summary['count']:
+            return '-'
+        return f"p50 {summary['p50']:.0f} / p95 {summary['p95']:.0f} / p99 {summary['p99']:.0f} ms"
+
+    print(f"\n并发 {level['concurrency']}: {level['sessions']} 个会话, 耗时 {level['wall_seconds']:.1f}s, "
+          f"失败 {level['errors']}, 拒绝 {level['rejected']}, {'可持续' if level['sustainable'] else '不可持续'}")
+    print(f"  请求延迟:       {fmt(level['requests'])}")
+    print(f"  ASR首个结果:    {fmt(level['asr_first_partial_ms'])}")
+    print(f"  ASR首个句末:    {fmt(level['asr_final_ms'])}")
+    print(f"  TTS首个音频字节: {fmt(level['tts_first_audio_ms'])}")
+    if level['cpu_ms_per_session'] is not None:
+        print(f"  每会话CPU:      {level['cpu_ms_per_session']:.1f} ms")
+    if level['rss_kb_per_session'] is not None:
+        print(f"  每会话内存:     {level['rss_kb_per_session']:.0f} KB (峰值 {level['peak_rss_kb'] / 1024:.1f} MB)")
+    for sample in level['error_samples']:
+        print(f'  错误: {sample}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='语音服务端到端基准测试')
+    parser.add_argument('--url', help='测试已运行的服务器，不指定时在本进程内以离线替身后端启动')
+    parser.add_argument('--server-pid', type=int, help='配合 --url 统计服务器进程的CPU和内存（需要psutil）')
+    parser.add_argument('--levels', default='1,2,4,8', help='逐级测试的并发数，逗号分隔')
+    parser.add_argument('--rounds', type=int, default=2, help='每个并发工作线程运行的会话轮数')
+    parser.add_argument('--mode', choices=('asr', 'tts', 'both'), default='both')
+    parser.add_argument('--audio', help='识别使用的WAV/PCM文件，不指定时生成测试音频'
+                                        '（配合 --url 时必须位于服务器的回放目录 SPEECH_REPLAY_DIR 中）')
+    parser.add_argument('--audio-seconds', type=float, default=4.0, help='生成的测试音频时长')
+    parser.add_argument('--speed', type=float, default=1.0, help='文件回放速度，1为实时，0为不限速')
+    parser.add_argument('--vad', type=lambda v: v.lower() in ('1', 'true', 'yes'), default=None,
+                        help='是否启用VAD，不指定时使用服务器默认值')
+    parser.add_argument('--text', default=DEFAULT_TTS_TEXT, help='合成使用的文本')
+    parser.add_argument('--voice', help='合成使用的音色')
+    parser.add_argument('--cache', action='store_true', help='允许命中TTS缓存（默认每次使用不同文本）')
+    parser.add_argument('--latency-budget-ms', type=float, default=1500.0,
+                        help='首个识别结果和首个音频字节的p95上限，超过视为不可持续')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='可接受的会话失败率')
+    parser.add_argument('--max-recognition-sessions', type=int,
+                        help='本进程模式下覆盖识别会话上限，用于测试更高的并发')
+    parser.add_argument('--keep-going', action='store_true', help='出现不可持续的级别后继续测试更高并发')
+    parser.add_argument('--log-level', default='warning', help='本进程模式下服务器的日志级别')
+    parser.add_argument('--output', help='结果JSON路径，默认为 bench_results/bench_<时间>.json')
+    parser.add_argument('--compare', help='与之前保存的结果JSON比较')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    levels = [int(v) for v in args.levels.split(',') if v.strip()]
+
+    temp_dir = None
+    audio_path = args.audio
+    if args.mode != 'tts' and not audio_path:
+        temp_dir = tempfile.mkdtemp(prefix='bench_speech_')
+        audio_path = generate_audio(os.path.join(temp_dir, 'bench.wav'), args.audio_seconds)
+    if audio_path:
+        audio_path = os.path.abspath(audio_path)
+
+    server = module = None
+    if args.url:
+        base_url = args.url
+        monitor = ResourceMonitor(args.server_pid) if args.server_pid and psutil is not None else None
+    else:
+        base_url, server, module = start_local_server(args, os.path.dirname(audio_path) if audio_path else None)
+        # 客户端线程与服务器在同一进程，CPU和内存数据包含客户端自身的开销
+        monitor = ResourceMonitor()
+        if not monitor.available:
+            monitor = None
+    client = SpeechClient(base_url)
+
+    status, info = client.request('GET', '/')
+    if status != 200:
+        print(f'无法连接服务器 {base_url}: {info.get("message")}')
+        return 1
+    backend = info.get('backend')
+    print(f'服务器: {base_url}, 后端: {backend}')
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'server': base_url if args.url else 'in-process',
+        'backend': backend,
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'resource_scope': None if monitor is None else ('server' if args.url else 'process'),
+        'levels': [],
+        'max_sustainable_concurrency': 0,
+    }
+    try:
+        for concurrency in levels:
+            level = run_level(client, monitor, args, concurrency, audio_path)
+            results['levels'].append(level)
+            print_level(level)
+            if level['sustainable']:
+                results['max_sustainable_concurrency'] = max(results['max_sustainable_concurrency'], concurrency)
+            elif not args.keep_going:
+                break
+    finally:
+        if server is not None:
+            server.shutdown()
+            module.cleanup()
+        if temp_dir:
+            try:
+                os.remove(audio_path)
+                os.rmdir(temp_dir)
+            except OSError:
+                pass
+
+    print(f"\n最大可持续并发会话数: {results['max_sustainable_concurrency']}")
+    output = args.output or os.path.join('bench_results', f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f'结果已保存: {output}')
+
+    if args.compare:
+        compare_results(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,303 @@
+# 离线的语音服务替身
+# 接口与 dashscope 的 Recognition / SpeechSynthesizer 一致，不访问网络、不需要API密钥，
+# 用于本地调试、CI和并发压测。延迟和错误率可调
+import json
+import logging
+import queue
+import random
+import threading
+import time
+import uuid
+
+import numpy as np
+from dashscope.audio.asr.recognition import RecognitionResponse, RecognitionResult
+
+logger = logging.getLogger('speech_server')
+
+DEFAULT_TRANSCRIPT = [
+    '你好，这是离线测试的识别结果。',
+    '今天的天气很好，适合出去走走。',
+    '语音识别替身会按音频时长逐步输出文字。',
+]
+
+
+def _maybe_fail(error_rate, what):
+    if error_rate and random.random() < error_rate:
+        raise RuntimeError(f'模拟{what}失败')
+
+
+def _make_result(request_id, sentence, status_code=200, message=''):
+    response = RecognitionResponse(status_code=status_code, request_id=request_id, code='' if status_code == 200 else 'FakeError',
+                                   message=message, output={'sentence': sentence} if sentence else None)
+    return RecognitionResult(response)
+
+
+class FakeRecognition:
+    """识别替身
+
+    每收到 sentence_seconds 秒音频输出一句，期间每 partial_seconds 秒输出一次中间结果。
+    transcript 为句子列表时依次循环输出（脚本模式），为None时根据音频生成描述文字（推导模式）。
+    """
+
+    def __init__(self, model, format='pcm', sample_rate=16000, callback=None, transcript=None,
+                 connect_latency=0.1, result_latency=0.05, sentence_seconds=3.0, partial_seconds=0.4,
+                 error_rate=0.0, **kwargs):
+        self.model = model
+        self.sample_rate = sample_rate
+        self._callback = callback
+        self.transcript = transcript
+        self.connect_latency = connect_latency
+        self.result_latency = result_latency
+        self.sentence_seconds = sentence_seconds
+        self.partial_seconds = partial_seconds
+        self.error_rate = error_rate
+        self.request_id = uuid.uuid4().hex
+        self._queue = queue.Queue()
+        self._running = False
+        self._thread = None
+        self._sentence_index = 0
+        self._sentence_audio = 0.0   # 当前句子已收到的音频秒数
+        self._since_partial = 0.0
+        self._sentence_energy = []
+        self._audio_seconds = 0.0
+
+    def start(self, phrase_id=None, **kwargs):
+        if self._running:
+            raise RuntimeError('Speech recognition has started.')
+        time.sleep(self.connect_latency)
+        _maybe_fail(self.error_rate, '识别连接')
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='fake-recognition', daemon=True)
+        self._thread.start()
+        self._callback.on_open()
+
+    def send_audio_frame(self, buffer):
+        if not self._running:
+            raise RuntimeError('Speech recognition has stopped.')
+        self._queue.put(bytes(buffer))
+
+    def _sentence_text(self):
+        if self.transcript:
+            return self.transcript[self._sentence_index % len(self.transcript)]
+        energy = float(np.mean(self._sentence_energy)) if self._sentence_energy else 0.0
+        return f'第{self._sentence_index + 1}句，音频{self._sentence_audio:.1f}秒，平均能量{energy:.0f}。'
+
+    def _emit(self, final):
+        text = self._sentence_text()
+        if not final:
+            # 中间结果按已收到的音频比例显示前缀
+            shown = max(1, int(len(text) * min(1.0, self._sentence_audio / self.sentence_seconds)))
+            text = text[:shown]
+        begin = int((self._audio_seconds - self._sentence_audio) * 1000)
+        sentence = {
+            'text': text,
+            'begin_time': begin,
+            'end_time': int(self._audio_seconds * 1000) if final else None,
+        }
+        time.sleep(self.result_latency)
+        self._callback.on_event(_make_result(self.request_id, sentence))
+        if final:
+            self._sentence_index += 1
+            self._sentence_audio = 0.0
+            self._sentence_energy = []
+        self._since_partial = 0.0
+
+    def _fail(self, message):
+        self._running = False
+        self._callback.on_error(_make_result(self.request_id, None, status_code=500, message=message))
+        self._callback.on_close()
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            if not self._running:
+                continue
+            seconds = len(data) / (self.sample_rate * 2)
+            samples = np.frombuffer(data[:len(data) - len(data) % 2], dtype=np.int16)
+            if len(samples):
+                self._sentence_energy.append(float(np.sqrt(np.mean(samples.astype(np.float32) ** 2))))
+            self._audio_seconds += seconds
+            self._sentence_audio += seconds
+            self._since_partial += seconds
+            if self.error_rate and random.random() < self.error_rate * seconds:
+                self._fail('模拟识别服务错误')
+                return
+            if self._sentence_audio >= self.sentence_seconds:
+                self._emit(final=True)
+            elif self._since_partial >= self.partial_seconds:
+                self._emit(final=False)
+
+    def stop(self):
+        if not self._running:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._running = False
+        if self._sentence_audio > 0:
+            self._emit(final=True)
+        self._callback.on_complete()
+        self._callback.on_close()
+
+    def get_last_request_id(self):
+        return self.request_id
+
+
+class FakeSpeechSynthesizer:
+    """合成替身
+
+    按 chars_per_second 的语速把文本换算成音频时长，生成正弦音或静音PCM，
+    每 chunk_ms 毫秒的音频作为一块通过 on_data 回调输出，每块之间等待 chunk_latency 秒。
+    """
+
+    def __init__(self, model, voice, format=None, callback=None, connect_latency=0.15,
+                 first_chunk_latency=0.1, chunk_latency=0.02, chunk_ms=100, chars_per_second=5.0,
+                 waveform='tone', error_rate=0.0, **kwargs):
+        self.model = model
+        self.voice = voice
+        self.aformat = getattr(format, 'format', 'wav') or 'wav'
+        self.sample_rate = getattr(format, 'sample_rate', 0) or 16000
+        self.callback = callback
+        self.connect_latency = connect_latency
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_latency = chunk_latency
+        self.chunk_bytes = self.sample_rate * chunk_ms // 1000 * 2
+        self.chars_per_second = chars_per_second
+        self.waveform = waveform
+        self.error_rate = error_rate
+        self.last_request_id = uuid.uuid4().hex
+        self.complete_event = threading.Event()
+        self.ws = None
+        self._is_first = True
+        self._is_started = False
+        self._cancelled = False
+        self._queue = queue.Queue()
+        self._worker = None
+        self._audio = []
+        self._phase = 0
+        self._start_time = None
+        self._first_package_time = None
+
+    def _tone(self, samples):
+        if self.waveform == 'silence':
+            return bytes(samples * 2)
+        t = (np.arange(samples) + self._phase) / self.sample_rate
+        self._phase += samples
+        # 以音色名决定音高，便于区分不同会话
+        freq = 220 + (sum(map(ord, self.voice or '')) % 8) * 55
+        return (np.sin(2 * np.pi * freq * t) * 6000).astype(np.int16).tobytes()
+
+    def _wav_header(self):
+        byte_rate = self.sample_rate * 2
+        return (b'RIFF' + (0).to_bytes(4, 'little') + b'WAVE'
+                + b'fmt ' + (16).to_bytes(4, 'little') + (1).to_bytes(2, 'little') + (1).to_bytes(2, 'little')
+                + self.sample_rate.to_bytes(4, 'little') + byte_rate.to_bytes(4, 'little')
+                + (2).to_bytes(2, 'little') + (16).to_bytes(2, 'little')
+                + b'data' + (0).to_bytes(4, 'little'))
+
+    def start_stream(self):
+        """建立连接并启动任务（对应SDK在第一次 streaming_call 时的启动过程）"""
+        if self._is_started:
+            raise RuntimeError('task has already started.')
+        self._start_time = time.time()
+        time.sleep(self.connect_latency)
+        _maybe_fail(self.error_rate, 'TTS连接')
+        self._is_first = False
+        self._is_started = True
+        self.complete_event.clear()
+        self._worker = threading.Thread(target=self._run, name='fake-synthesizer', daemon=True)
+        self._worker.start()
+        if self.callback is not None:
+            self.callback.on_open()
+
+    def _deliver(self, data):
+        if self._first_package_time is None:
+            self._first_package_time = time.time()
+        if self.callback is not None:
+            self.callback.on_data(data)
+        else:
+            self._audio.append(data)
+
+    def _run(self):
+        pending = self._wav_header() if self.aformat == 'wav' else b''
+        first = True
+        while True:
+            text = self._queue.get()
+            if text is None or self._cancelled:
+                break
+            total = int(len(text.strip()) / self.chars_per_second * self.sample_rate) * 2
+            sent = 0
+            while sent < total and not self._cancelled:
+                time.sleep(self.first_chunk_latency if first else self.chunk_latency)
+                first = False
+                if self.error_rate and random.random() < self.error_rate:
+                    self._finish(error=json.dumps({'header': {'event': 'task-failed', 'error_message': '模拟合成错误'}},
+                                                  ensure_ascii=False))
+                    return
+                size = min(self.chunk_bytes, total - sent)
+                self._deliver(pending + self._tone(size // 2))
+                pending = b''
+                sent += size
+        if pending and not self._cancelled:
+            self._deliver(pending)
+        self._finish()
+
+    def _finish(self, error=None):
+        self._is_started = False
+        self.complete_event.set()
+        if self.callback is None or self._cancelled:
+            return
+        if error is not None:
+            self.callback.on_error(error)
+        else:
+            self.callback.on_complete()
+        self.callback.on_close()
+
+    def streaming_call(self, text):
+        if self._is_first:
+            self.start_stream()
+        if not self._is_started:
+            raise RuntimeError('speech synthesizer has not been started.')
+        self._queue.put(text)
+
+    def streaming_complete(self, complete_timeout_millis=600000):
+        if not self._is_started:
+            raise RuntimeError('speech synthesizer has not been started.')
+        self._queue.put(None)
+        timeout = complete_timeout_millis / 1000 if complete_timeout_millis else None
+        if not self.complete_event.wait(timeout):
+            raise TimeoutError(f'speech synthesizer wait for complete timeout {complete_timeout_millis}ms')
+
+    def async_streaming_complete(self, complete_timeout_millis=600000):
+        if not self._is_started:
+            raise RuntimeError('speech synthesizer has not been started.')
+        self._queue.put(None)
+
+    def streaming_cancel(self):
+        if not self._is_started:
+            raise RuntimeError('speech synthesizer has not been started.')
+        self._cancelled = True
+        self._queue.put(None)
+        self.complete_event.set()
+
+    def call(self, text, timeout_millis=None):
+        self.start_stream()
+        self.streaming_call(text)
+        if self.callback is not None:
+            self.async_streaming_complete(timeout_millis)
+            return None
+        self.streaming_complete(timeout_millis)
+        return b''.join(self._audio)
+
+    def close(self):
+        self._cancelled = True
+        self._queue.put(None)
+
+    def get_last_request_id(self):
+        return self.last_request_id
+
+    def get_first_package_delay(self):
+        if self._first_package_time is None or self._start_time is None:
+            return -1
+        return (self._first_package_time - self._start_time) * 1000
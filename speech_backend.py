@@ -0,0 +1,84 @@
+# 语音服务后端选择
+# speech_server 通过这里取得识别和合成的实现：dashscope 为阿里云百炼服务，fake 为离线替身。
+# SDK在第一次使用（或后台预热）时才导入，服务启动时不等待SDK加载
+import functools
+import importlib
+import threading
+
+BACKEND_DASHSCOPE = 'dashscope'
+BACKEND_FAKE = 'fake'
+
+# 预热线程和请求线程可能同时第一次导入SDK，导入SDK的包时在两个线程中的顺序不同会被判为死锁，
+# 所有SDK的导入都在这个锁内进行
+_import_lock = threading.RLock()
+
+
+def import_module(name):
+    """在导入锁内导入模块，返回模块对象"""
+    with _import_lock:
+        return importlib.import_module(name)
+
+
+class SpeechBackend:
+    """一组识别/合成实现，构造参数与 dashscope 的 Recognition / SpeechSynthesizer 相同
+
+    loader() 返回 (识别类, 合成类)，在第一次访问 Recognition / SpeechSynthesizer 或调用 load() 时执行一次。
+    """
+
+    def __init__(self, name, loader, requires_api_key):
+        self.name = name
+        self.requires_api_key = requires_api_key
+        self._loader = loader
+        self._classes = None
+
+    def load(self):
+        """导入实现，多个线程同时调用时只导入一次"""
+        if self._classes is None:
+            with _import_lock:
+                if self._classes is None:
+                    self._classes = self._loader()
+        return self._classes
+
+    @property
+    def loaded(self):
+        return self._classes is not None
+
+    @property
+    def Recognition(self):
+        return self.load()[0]
+
+    @property
+    def SpeechSynthesizer(self):
+        return self.load()[1]
+
+    def info(self):
+        return {'name': self.name, 'requires_api_key': self.requires_api_key, 'loaded': self.loaded}
+
+
+def _load_dashscope():
+    from dashscope.audio.asr import Recognition
+    from dashscope.audio.tts_v2 import SpeechSynthesizer
+    return Recognition, SpeechSynthesizer
+
+
+def _load_fake(recognition_options, synthesizer_options):
+    from fake_speech import FakeRecognition, FakeSpeechSynthesizer
+    return (functools.partial(FakeRecognition, **recognition_options),
+            functools.partial(FakeSpeechSynthesizer, **synthesizer_options))
+
+
+def load_backend(name, fake_options=None):
+    """按名称选择后端；fake_options 为替身的可调参数，如 connect_latency、chunk_latency、error_rate"""
+    name = (name or BACKEND_DASHSCOPE).lower()
+    if name == BACKEND_DASHSCOPE:
+        return SpeechBackend(name, _load_dashscope, requires_api_key=True)
+    if name == BACKEND_FAKE:
+        options = fake_options or {}
+        recognition_options = {k[len('recognition_'):]: v for k, v in options.items() if k.startswith('recognition_')}
+        synthesizer_options = {k[len('tts_'):]: v for k, v in options.items() if k.startswith('tts_')}
+        return SpeechBackend(
+            name,
+            functools.partial(_load_fake, recognition_options, synthesizer_options),
+            requires_api_key=False
+        )
+    raise ValueError(f'未知的语音服务后端: {name}')
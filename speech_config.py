@@ -0,0 +1,253 @@
+# 语音服务配置
+# 合并进程环境变量、.env.local 和 user_config.json，解析一次后缓存。
+# 访问时最多每 check_interval 秒检查一次文件的修改时间，文件变化后才重新读取，
+# 请求路径上不再有文件I/O，修改配置文件后无需重启服务
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger('speech_server')
+
+ENV_FILE_NAME = '.env.local'
+USER_CONFIG_FILE_NAME = 'user_config.json'
+API_KEY_NAME = 'DASHSCOPE_API_KEY'
+
+
+def _parse_list(value):
+    return tuple(item.strip() for item in str(value).split(',') if item.strip())
+
+
+def _parse_bool(value):
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'off', '')
+
+
+# 可通过环境变量或 .env.local 设置的项：属性名 -> (变量名, 类型, 默认值)
+SETTING_FIELDS = {
+    'host': ('SPEECH_HOST', str, '0.0.0.0'),
+    'port': ('SPEECH_PORT', int, 2047),
+    'chunk': ('SPEECH_CHUNK', int, 3200),                  # 每次发送给识别服务的帧数
+    'rate': ('SPEECH_RATE', int, 16000),                   # 识别音频采样率
+    'recognition_model': ('SPEECH_RECOGNITION_MODEL', str, 'paraformer-realtime-v2'),
+    'max_recognition_sessions': ('SPEECH_MAX_RECOGNITION_SESSIONS', int, 4),
+    'replay_dir': ('SPEECH_REPLAY_DIR', str, ''),           # 文件回放只能读取该目录中的文件，为空时为存储目录下的replay
+    'tts_model': ('SPEECH_TTS_MODEL', str, 'cosyvoice-v1'),
+    'tts_voice': ('SPEECH_TTS_VOICE', str, 'longxiaochun'),  # 未指定音色时使用
+    'tts_preload_voices': ('SPEECH_TTS_PRELOAD_VOICES', _parse_list, ('longxiaochun',)),
+    'tts_local_playback': ('SPEECH_TTS_LOCAL_PLAYBACK', _parse_bool, True),
+    'tts_output_format': ('SPEECH_TTS_OUTPUT_FORMAT', str, 'wav'),   # 未指定格式时的输出格式: wav、pcm、mp3
+    'tts_sample_rate': ('SPEECH_TTS_SAMPLE_RATE', int, 16000),       # 未指定采样率时的合成采样率
+    'tts_mp3_bitrate': ('SPEECH_TTS_MP3_BITRATE', int, 24),          # 服务端编码MP3的默认码率（kbps）
+    'tts_pool_size': ('SPEECH_TTS_POOL_SIZE', int, 2),
+    'tts_pool_idle_ttl': ('SPEECH_TTS_POOL_IDLE_TTL', float, 300.0),  # 预热连接的最长空闲时间（秒）
+    'tts_max_sessions': ('SPEECH_TTS_MAX_SESSIONS', int, 32),            # 同时保留的TTS会话上限
+    'tts_session_idle_ttl': ('SPEECH_TTS_SESSION_IDLE_TTL', float, 300.0),  # TTS会话空闲超过该秒数后关闭，0为不关闭
+    'tts_batch_workers': ('SPEECH_TTS_BATCH_WORKERS', int, 4),
+    'tts_batch_max_items': ('SPEECH_TTS_BATCH_MAX_ITEMS', int, 200),
+}
+
+
+class SpeechSettings:
+    """某一时刻的配置快照，属性见 SETTING_FIELDS，另有 storage_path 和 api_key"""
+
+    __slots__ = tuple(SETTING_FIELDS) + ('storage_path', 'api_key')
+
+    def __init__(self, lookup, storage_path, api_key):
+        for name, (key, kind, default) in SETTING_FIELDS.items():
+            raw = lookup(key)
+            value = default
+            if raw not in (None, ''):
+                try:
+                    value = kind(raw)
+                except (TypeError, ValueError):
+                    logger.warning(f'配置项 {key} 的值无效: {raw!r}，使用默认值 {default!r}')
+            setattr(self, name, value)
+        self.storage_path = storage_path
+        self.api_key = api_key
+
+    def as_dict(self, include_secrets=False):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        if not include_secrets:
+            values['api_key'] = bool(self.api_key)
+        return values
+
+
+class WatchedFile:
+    """按修改时间缓存解析结果的文件，文件不存在时解析结果为空"""
+
+    def __init__(self, paths, parser):
+        self.paths = paths  # 候选路径，使用第一个存在的
+        self.parser = parser
+        self.path = None
+        self.signature = None
+        self.data = {}
+
+    def _current(self):
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            return path, (st.st_mtime_ns, st.st_size)
+        return None, None
+
+    def refresh(self):
+        """文件变化时重新解析，返回是否发生了变化"""
+        path, signature = self._current()
+        if path == self.path and signature == self.signature:
+            return False
+        data = {}
+        if path is not None:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = self.parser(f.read())
+            except Exception as e:
+                logger.error(f'读取配置文件 {path} 失败: {e}')
+                # 保留上一次的内容，文件下次变化时再读取
+                data = self.data
+        self.path, self.signature, self.data = path, signature, data
+        return True
+
+
+def parse_env_file(text):
+    values = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        key, value = key.strip(), value.strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+            value = value[1:-1]
+        if key:
+            values[key] = value
+    return values
+
+
+def parse_json_file(text):
+    data = json.loads(text) if text.strip() else {}
+    return data if isinstance(data, dict) else {}
+
+
+class SpeechConfig:
+    """缓存的配置，settings 返回当前快照
+
+    进程启动时已有的环境变量优先于 .env.local；.env.local 中的值同时写入 os.environ，
+    供直接读取环境变量的代码（如 dashscope SDK）使用，文件修改后随之更新。
+    """
+
+    def __init__(self, env_paths, user_config_path, default_storage_path, check_interval=2.0):
+        self._lock = threading.Lock()
+        self._env_file = WatchedFile(env_paths, parse_env_file)
+        self._user_config = WatchedFile([user_config_path], parse_json_file)
+        self.default_storage_path = default_storage_path
+        self.check_interval = check_interval
+        self._process_env = dict(os.environ)  # 启动时的环境变量，不被配置文件覆盖
+        self._injected = set()
+        self._listeners = []
+        self._checked_at = 0.0
+        self._settings = None
+        self._storage_dirs = {}  # 配置的存储路径 -> 实际使用的路径（已创建）
+        self.reloads = 0
+        self._refresh(force=True)
+
+    def lookup(self, key, default=None):
+        if key in self._process_env:
+            return self._process_env[key]
+        return self._env_file.data.get(key, default)
+
+    def _sync_environ(self):
+        # 调用方必须持有 self._lock
+        values = self._env_file.data
+        for key in list(self._injected):
+            if key not in values:
+                os.environ.pop(key, None)
+                self._injected.discard(key)
+        for key, value in values.items():
+            if key not in self._process_env:
+                os.environ[key] = value
+                self._injected.add(key)
+
+    def _resolve_storage_path(self):
+        storage = self._user_config.data.get('storagePath')
+        return os.path.join(storage, 'audio_output') if storage else self.default_storage_path
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return None
+        with self._lock:
+            if not force and now - self._checked_at < self.check_interval:
+                return None
+            self._checked_at = now
+            env_changed = self._env_file.refresh()
+            config_changed = self._user_config.refresh()
+            if not (env_changed or config_changed or force):
+                return None
+            if env_changed:
+                self._sync_environ()
+            previous = self._settings
+            settings = SpeechSettings(self.lookup, self._resolve_storage_path(), self.lookup(API_KEY_NAME))
+            self._settings = settings
+            if previous is None:
+                return None
+            self.reloads += 1
+            changed = [name for name in SpeechSettings.__slots__
+                       if getattr(previous, name) != getattr(settings, name)]
+            listeners = list(self._listeners)
+        if changed:
+            logger.info(f'配置已重新加载，变化的项: {", ".join(changed)}')
+            for listener in listeners:
+                try:
+                    listener(settings, changed)
+                except Exception as e:
+                    logger.error(f'应用配置变化失败: {e}', exc_info=True)
+        return changed
+
+    @property
+    def settings(self):
+        self._refresh()
+        return self._settings
+
+    def add_listener(self, listener):
+        """配置变化时调用 listener(settings, 变化的属性名列表)"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def storage_path(self):
+        """当前存储目录，目录只在路径变化后创建一次；无法创建时退回默认目录"""
+        configured = self.settings.storage_path
+        path = self._storage_dirs.get(configured)
+        if path is None:
+            path = configured
+            try:
+                os.makedirs(path, exist_ok=True)
+            except OSError as e:
+                logger.error(f'创建存储目录 {path} 失败: {e}，使用默认存储路径')
+                path = self.default_storage_path
+                os.makedirs(path, exist_ok=True)
+            self._storage_dirs[configured] = path
+            logger.info(f'使用存储路径: {path}')
+        return path
+
+    def reload(self):
+        """立即检查配置文件，返回变化的属性名列表"""
+        return self._refresh(force=True) or []
+
+    def info(self):
+        settings = self.settings
+        return {
+            'env_file': self._env_file.path,
+            'user_config': self._user_config.path,
+            'reloads': self.reloads,
+            'settings': settings.as_dict(),
+        }
+
+
+def default_env_paths(script_dir):
+    """.env.local 的候选位置：打包后在可执行文件同级目录，开发时在当前目录或脚本目录"""
+    if getattr(sys, 'frozen', False):
+        return [os.path.join(os.path.dirname(sys.executable), ENV_FILE_NAME)]
+    return [os.path.abspath(ENV_FILE_NAME), os.path.join(script_dir, ENV_FILE_NAME)]
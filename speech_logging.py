@@ -0,0 +1,149 @@
+# 日志管道
+# 所有日志记录先放入有界队列，由后台线程格式化并写到控制台和滚动日志文件，
+# 音频采集、合成回调等实时线程不会阻塞在控制台或磁盘I/O上。
+# 高频的帧级日志按调用位置限流或抽样
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE_NAME = 'speech_server.log'
+
+
+class CallSiteRateLimiter(logging.Filter):
+    """按调用位置（文件+行号）限流的过滤器
+
+    - 不高于 max_level 的记录，或带有 extra={'rate_limit': True} 的记录，
+      每个调用位置每 interval 秒最多输出 burst 条，下一个时间窗口的第一条附带被省略的条数
+    - 带有 extra={'sample_every': N} 的记录每个调用位置只输出每N条中的第一条
+    在写日志的线程上运行，只做字典查找和计数，不加锁（并发时计数略有误差）。
+    """
+
+    def __init__(self, interval=1.0, burst=5, max_level=logging.DEBUG):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.max_level = max_level
+        self._sites = {}  # (文件, 行号) -> [窗口开始时间, 窗口内条数, 省略条数, 抽样计数]
+        self.suppressed = 0
+
+    def filter(self, record):
+        sample_every = getattr(record, 'sample_every', None)
+        limited = record.levelno <= self.max_level or getattr(record, 'rate_limit', False)
+        if not sample_every and not limited:
+            return True
+        key = (record.pathname, record.lineno)
+        state = self._sites.get(key)
+        if state is None:
+            state = [record.created, 0, 0, 0]
+            self._sites[key] = state
+
+        if sample_every:
+            state[3] += 1
+            if (state[3] - 1) % sample_every:
+                self.suppressed += 1
+                return False
+            if not limited:
+                return True
+
+        if record.created - state[0] >= self.interval:
+            if state[2]:
+                # 不修改参数，只在消息末尾追加说明，延迟格式化仍然有效
+                record.msg = f'{record.msg} (上一时段省略了 {state[2]} 条同类日志)'
+            state[0], state[1], state[2] = record.created, 0, 0
+        if state[1] >= self.burst:
+            state[2] += 1
+            self.suppressed += 1
+            return False
+        state[1] += 1
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """只把记录放入队列：消息的格式化留给后台线程，队列满时丢弃记录而不是等待"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 同一进程内的队列不需要序列化，保持记录原样，由写出线程再调用 getMessage()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """根日志的队列管道，负责控制台和文件输出"""
+
+    def __init__(self, level=logging.INFO, queue_size=10000, rate_limit_interval=1.0, rate_limit_burst=5):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.limiter = CallSiteRateLimiter(interval=rate_limit_interval, burst=rate_limit_burst)
+        self.handler.addFilter(self.limiter)
+        self.formatter = logging.Formatter(LOG_FORMAT)
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(self.formatter)
+        self.file_handler = None
+        self.listener = logging.handlers.QueueListener(self.queue, console, respect_handler_level=True)
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(self.handler)
+        self.set_level(level)
+        self.listener.start()
+
+    def set_level(self, level):
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+            if not isinstance(level, int):
+                level = logging.INFO
+        logging.getLogger().setLevel(level)
+
+    def add_file_sink(self, directory, max_bytes=5 * 1024 * 1024, backup_count=3):
+        """在 directory 下写滚动日志文件，返回日志文件路径"""
+        if self.file_handler is not None:
+            return self.file_handler.baseFilename
+        os.makedirs(directory, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            os.path.join(directory, LOG_FILE_NAME),
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding='utf-8',
+            delay=True
+        )
+        handler.setFormatter(self.formatter)
+        self.file_handler = handler
+        # 监听线程每条记录都重新读取 handlers，追加后立即生效
+        self.listener.handlers = self.listener.handlers + (handler,)
+        return handler.baseFilename
+
+    def stats(self):
+        return {
+            'level': logging.getLevelName(logging.getLogger().level),
+            'queued': self.queue.qsize(),
+            'dropped': self.handler.dropped,
+            'suppressed': self.limiter.suppressed,
+            'file': self.file_handler.baseFilename if self.file_handler is not None else None,
+        }
+
+    def close(self):
+        """写出队列中剩余的记录并停止后台线程"""
+        try:
+            self.listener.stop()
+        except Exception:
+            pass
+        for handler in self.listener.handlers:
+            try:
+                handler.flush()
+                handler.close()
+            except Exception:
+                pass
+
@@ -0,0 +1,182 @@
+# 运行指标
+# 以Prometheus文本格式导出计数器、仪表和直方图，供 /metrics 接口使用。
+# 计数器和直方图按线程分片：每个线程只写自己的单元，采集和回调线程更新时不加锁，
+# 抓取时再把各线程的单元相加
+import bisect
+import math
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认的延迟分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ThreadCells:
+    """每个线程一个定长的数值单元"""
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cells = []  # (线程, 单元)
+        self._retired = [0] * size  # 已退出线程的累计值
+
+    def cell(self):
+        cell = getattr(self._local, 'cell', None)
+        if cell is None:
+            # 每个线程只在第一次更新时加锁登记
+            cell = [0] * self._size
+            self._local.cell = cell
+            with self._lock:
+                self._cells.append((threading.current_thread(), cell))
+        return cell
+
+    def totals(self):
+        with self._lock:
+            totals = list(self._retired)
+            alive = []
+            for thread, cell in self._cells:
+                values = list(cell)
+                for index, value in enumerate(values):
+                    totals[index] += value
+                if thread.is_alive():
+                    alive.append((thread, cell))
+                else:
+                    # 线程已退出，不会再写它的单元，合并后释放
+                    for index, value in enumerate(values):
+                        self._retired[index] += value
+            self._cells = alive
+        return totals
+
+
+class Counter:
+    """单调递增的计数器"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount=1):
+        self._cells.cell()[0] += amount
+
+    @property
+    def value(self):
+        return self._cells.totals()[0]
+
+    def samples(self):
+        yield self.name, {}, self.value
+
+
+class Histogram:
+    """固定分桶的直方图，observe 的值通常为秒"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # 单元布局：各分桶计数 + 超出最大分桶的计数 + 总和
+        self._cells = _ThreadCells(len(self.buckets) + 2)
+
+    def observe(self, value):
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def samples(self):
+        totals = self._cells.totals()
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), totals[:-1]):
+            cumulative += count
+            yield f'{self.name}_bucket', {'le': _format_value(bound)}, cumulative
+        yield f'{self.name}_sum', {}, totals[-1]
+        yield f'{self.name}_count', {}, cumulative
+
+
+class CallbackMetric:
+    """抓取时调用函数取值，用于已有统计数据和仪表；函数返回数值或 {标签值: 数值}"""
+
+    def __init__(self, kind, name, help_text, func, label=None):
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.label = label
+
+    def samples(self):
+        value = self.func()
+        if isinstance(value, dict):
+            for label_value, item in value.items():
+                yield self.name, {self.label: label_value}, item
+        elif value is not None:
+            yield self.name, {}, value
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(int(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'指标已存在: {metric.name}')
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def gauge_func(self, name, help_text, func, label=None):
+        return self._register(CallbackMetric('gauge', name, help_text, func, label))
+
+    def counter_func(self, name, help_text, func, label=None):
+        return self._register(CallbackMetric('counter', name, help_text, func, label))
+
+    def render(self):
+        """生成Prometheus文本格式；单个指标取值失败时跳过，不影响其他指标"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception:
+                continue
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# 进程内共用的指标注册表
+registry = MetricsRegistry()
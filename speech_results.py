@@ -0,0 +1,299 @@
+# 识别结果存储
+# 按会话保存带递增序号的识别结果，供 /api/speech/results 轮询和 /api/speech/stream 推送共用
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+# 缓冲区满时的处理策略
+OVERFLOW_DROP_PARTIALS = 'drop_partials'  # 优先丢弃最早的中间结果，全是未读取的最终结果时才丢弃最早的最终结果
+OVERFLOW_DROP_OLDEST = 'drop_oldest'      # 直接丢弃最早的结果
+OVERFLOW_POLICIES = (OVERFLOW_DROP_PARTIALS, OVERFLOW_DROP_OLDEST)
+
+
+def is_final_result(result):
+    """句末文本、完成和错误事件都视为最终结果"""
+    if result.get('type') == 'text':
+        return bool(result.get('is_end'))
+    return True
+
+
+def _common_prefix_length(a, b):
+    limit = min(len(a), len(b))
+    if a[:limit] == b[:limit]:
+        return limit
+    # 二分查找第一个不同的位置，比逐字符比较的Python循环快
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def encode_delta(result, state):
+    """把文本结果编码为相对于同一句上一次文本的增量
+
+    state 为 {(会话ID, 句子ID): 上次交给该客户端的文本}，由调用方按连接或轮询游标保存。
+    返回的字典不含 text，而是 prefix（与上次文本相同的前缀长度）和 delta（其后的新文本），
+    客户端按 上次文本[:prefix] + delta 还原；非文本结果原样返回。
+    """
+    if result.get('type') != 'text' or 'sentence_id' not in result:
+        return result
+    key = (result.get('session_id'), result['sentence_id'])
+    text = result.get('text') or ''
+    prefix = _common_prefix_length(state.get(key, ''), text)
+    encoded = {k: v for k, v in result.items() if k != 'text'}
+    encoded['prefix'] = prefix
+    encoded['delta'] = text[prefix:]
+    if result.get('is_end'):
+        state.pop(key, None)
+    else:
+        state[key] = text
+    return encoded
+
+
+def encode_deltas(items, state):
+    """对 (序号, 结果) 列表逐条调用 encode_delta"""
+    return [(seq, encode_delta(result, state)) for seq, result in items]
+
+
+class _SessionBuffer:
+    __slots__ = ('events', 'poll_cursor', 'last_access', 'cond', 'delta_state')
+
+    def __init__(self, lock, now):
+        self.events = deque()  # (序号, 结果)，序号递增
+        self.poll_cursor = 0   # /api/speech/results 已取走的位置
+        self.last_access = now
+        self.cond = threading.Condition(lock)
+        self.delta_state = {}  # 轮询方已收到的各句文本，用于增量编码
+
+
+class SessionResultStore:
+    """按会话划分的有界结果缓冲区
+
+    每条结果分配一个全局递增的序号，读取时传入游标只返回之后的结果，
+    开销只与返回的条数相关。每个会话最多保留 max_items_per_session 条：轮询（drain）
+    取走的结果随即释放，缓冲区满时按溢出策略丢弃。长时间无人读写的会话会被自动清理；
+    读取不存在的会话不会创建缓冲区。
+    coalesce_partials 为True时，同一句的新文本结果替换缓冲区末尾该句的旧中间结果
+    （以新序号重新追加），读取方每句只会拿到最新的中间结果。
+    """
+
+    def __init__(self, max_items_per_session=200, session_ttl=300,
+                 overflow_policy=OVERFLOW_DROP_PARTIALS, sweep_interval=10, coalesce_partials=True):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f'未知的溢出策略: {overflow_policy}')
+        self.max_items_per_session = max_items_per_session
+        self.session_ttl = session_ttl
+        self.overflow_policy = overflow_policy
+        self.sweep_interval = sweep_interval
+        self.coalesce_partials = coalesce_partials
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._seq = itertools.count(1)
+        self._last_sweep = time.monotonic()
+        self._created = threading.Condition(self._lock)  # 等待尚不存在的会话时使用
+        # 统计计数
+        self._published = 0
+        self._drained = 0
+        self._dropped_partials = 0
+        self._dropped_finals = 0
+        self._released = 0  # 被轮询取走后释放的条数
+        self._superseded_partials = 0
+        self._expired_sessions = 0
+        self._expired_items = 0
+
+    def _get_session(self, session_id, now):
+        # 调用方必须持有 self._lock
+        buf = self._sessions.get(session_id)
+        if buf is None:
+            buf = _SessionBuffer(self._lock, now)
+            self._sessions[session_id] = buf
+            self._created.notify_all()
+        buf.last_access = now
+        return buf
+
+    def _find_session(self, session_id, now):
+        # 调用方必须持有 self._lock；读取用，会话不存在时返回None而不创建
+        buf = self._sessions.get(session_id)
+        if buf is not None:
+            buf.last_access = now
+        return buf
+
+    def _release_consumed(self, buf):
+        # 调用方必须持有 self._lock；释放已被轮询取走的结果
+        events = buf.events
+        while events and events[0][0] <= buf.poll_cursor:
+            events.popleft()
+            self._released += 1
+
+    def _expire_idle(self, now):
+        # 调用方必须持有 self._lock；按 sweep_interval 节流
+        if self.session_ttl is None or now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        for session_id in [sid for sid, buf in self._sessions.items()
+                           if now - buf.last_access > self.session_ttl]:
+            buf = self._sessions.pop(session_id)
+            self._expired_sessions += 1
+            self._expired_items += len(buf.events)
+            buf.cond.notify_all()
+
+    def _make_room(self, buf):
+        # 调用方必须持有 self._lock
+        events = buf.events
+        if len(events) < self.max_items_per_session:
+            return
+        self._release_consumed(buf)
+        if len(events) < self.max_items_per_session:
+            return
+        if self.overflow_policy == OVERFLOW_DROP_PARTIALS:
+            for index, (_, result) in enumerate(events):
+                if not is_final_result(result):
+                    del events[index]
+                    self._dropped_partials += 1
+                    return
+        # 缓冲区中全是未读取的最终结果（或策略为 drop_oldest）时丢弃最早的一条
+        _, dropped = events.popleft()
+        if is_final_result(dropped):
+            self._dropped_finals += 1
+        else:
+            self._dropped_partials += 1
+
+    def publish(self, session_id, result):
+        """追加一条结果并唤醒等待者，返回分配的序号"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            buf = self._get_session(session_id, now)
+            # 队尾是同一句的中间结果时直接替换（句末结果也一样），不检查是否已被读取：
+            # 新结果的序号更大，已读过旧结果的读取方仍会收到它
+            if self.coalesce_partials and buf.events and result.get('type') == 'text':
+                _, last = buf.events[-1]
+                if (last.get('type') == 'text' and not last.get('is_end')
+                        and last.get('sentence_id') == result.get('sentence_id')):
+                    buf.events.pop()
+                    self._superseded_partials += 1
+            self._make_room(buf)
+            seq = next(self._seq)
+            buf.events.append((seq, result))
+            self._published += 1
+            buf.cond.notify_all()
+            return seq
+
+    @staticmethod
+    def _events_after(buf, cursor):
+        # 从尾部向前扫描，开销与返回条数成正比
+        items = []
+        for seq, result in reversed(buf.events):
+            if seq <= cursor:
+                break
+            items.append((seq, result))
+        items.reverse()
+        return items
+
+    def read(self, session_id, cursor=0):
+        """返回序号大于 cursor 的结果，不改变轮询游标"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            buf = self._find_session(session_id, now)
+            return self._events_after(buf, cursor) if buf is not None else []
+
+    def wait_for(self, session_id, cursor=0, timeout=None):
+        """同 read，但没有新结果时最多等待 timeout 秒"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            buf = self._find_session(session_id, now)
+            if buf is None:
+                # 会话尚无结果：等到该会话被创建（第一条结果发布）或超时
+                deadline = None if timeout is None else now + timeout
+                while buf is None:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return []
+                    self._created.wait(remaining)
+                    buf = self._find_session(session_id, time.monotonic())
+                return self._events_after(buf, cursor)
+            if not buf.events or buf.events[-1][0] <= cursor:
+                buf.cond.wait(timeout)
+                buf.last_access = time.monotonic()
+            return self._events_after(buf, cursor)
+
+    def drain(self, session_id=None, delta=False):
+        """返回轮询游标之后的结果并推进游标；不指定会话时返回所有会话的结果
+
+        delta 为True时文本结果按 encode_delta 编码，相对于此前轮询取走的文本。
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire_idle(now)
+            if session_id is not None:
+                buf = self._find_session(session_id, now)
+                buffers = [buf] if buf is not None else []
+            else:
+                buffers = list(self._sessions.values())
+            items = []
+            for buf in buffers:
+                new_items = self._events_after(buf, buf.poll_cursor)
+                if new_items:
+                    buf.poll_cursor = new_items[-1][0]
+                    self._release_consumed(buf)
+                    if delta:
+                        new_items = encode_deltas(new_items, buf.delta_state)
+                    items.extend(new_items)
+            if len(buffers) > 1:
+                items.sort(key=lambda item: item[0])
+            self._drained += len(items)
+            return items
+
+    def reset(self, session_id):
+        """清空指定会话的结果（会话ID被复用时调用）"""
+        with self._lock:
+            buf = self._sessions.pop(session_id, None)
+            if buf is not None:
+                buf.cond.notify_all()
+
+    def wake_all(self):
+        """唤醒所有等待中的订阅者（服务器关闭时使用）"""
+        with self._lock:
+            for buf in self._sessions.values():
+                buf.cond.notify_all()
+            self._created.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'retained': sum(len(buf.events) for buf in self._sessions.values()),
+                'published': self._published,
+                'drained': self._drained,
+                'released': self._released,
+                'dropped_partials': self._dropped_partials,
+                'dropped_finals': self._dropped_finals,
+                'superseded_partials': self._superseded_partials,
+                'coalesce_partials': self.coalesce_partials,
+                'expired_sessions': self._expired_sessions,
+                'expired_items': self._expired_items,
+                'max_items_per_session': self.max_items_per_session,
+                'session_ttl': self.session_ttl,
+                'overflow_policy': self.overflow_policy,
+            }
+
+
+def format_sse(data, event=None, event_id=None):
+    """将数据编码为一条SSE消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    payload = json.dumps(data, ensure_ascii=False)
+    for line in payload.splitlines() or ['']:
+        lines.append(f'data: {line}')
+    return '\n'.join(lines) + '\n\n'
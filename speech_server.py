@@ -1,66 +1,7 @@
-import os 
-import re 
-import sys 
-from pathlib import Path 
- 
-# 尝试从.env.local文件读取API密钥 
-def load_env_from_file(): 
-    try: 
-        # 尝试从应用同级目录读取.env.local 
-        env_path = Path(os.path.dirname(sys.executable)) / '.env.local' 
-        # 如果不是打包模式，尝试从当前目录读取 
-        if not getattr(sys, 'frozen', False): 
-            env_path = Path('.env.local') 
- 
-        if env_path.exists(): 
-            print(f"正在从{env_path}读取环境变量...") 
-            with open(env_path, 'r') as f: 
-                for line in f: 
-                    line = line.strip() 
-                    if line and not line.startswith('#'): 
-                        key, value = line.split('=', 1) 
-                        # 只设置未定义的环境变量 
-                        if key and value and not os.environ.get(key): 
-                            os.environ[key] = value 
-                            print(f"已设置环境变量: {key}") 
-    except Exception as e: 
-        print(f"读取.env.local文件时出错: {e}") 
- 
-# 在程序启动时加载环境变量 
-load_env_from_file() 
- 
-import os 
-import re 
-import sys 
-from pathlib import Path 
- 
-# 尝试�?env.local文件读取API密钥 
-def load_env_from_file(): 
-    try: 
-        # 尝试从应用同级目录读�?env.local 
-        env_path = Path(os.path.dirname(sys.executable)) / '.env.local' 
-        # 如果不是打包模式，尝试从当前目录读取 
-        if not getattr(sys, 'frozen', False): 
-            env_path = Path('.env.local') 
- 
-        if env_path.exists(): 
-            print(f"正在从{env_path}读取环境变量...") 
-            with open(env_path, 'r') as f: 
-                for line in f: 
-                    line = line.strip() 
-                    if line and not line.startswith('#'): 
-                        key, value = line.split('=', 1) 
-                        # 只设置未定义的环境变�?
-                        if key and value and not os.environ.get(key): 
-                            os.environ[key] = value 
-                            print(f"已设置环境变量? {key}") 
-    except Exception as e: 
-        print(f"读取.env.local文件时出错? {e}") 
- 
-# 在程序启动时加载环境变量 
-load_env_from_file() 
- 
-from flask import Flask, request, jsonify, Response, send_file
+# 启动耗时记录最先导入，之后的模块导入都计入记录。
+# dashscope SDK 和 PyAudio 不在这里导入：由后台预热或第一次使用时加载，服务启动后立即可以响应
+from speech_startup import startup_profile, WarmupTracker
+from flask import Flask, request, jsonify, Response, send_file, stream_with_context
 from flask_cors import CORS
 import os
 import sys
@@ -68,10 +9,6 @@ import logging
 import time
 import threading
 import queue
-import dashscope
-import pyaudio
-from dashscope.audio.asr import *
-from dashscope.audio.tts_v2 import SpeechSynthesizer, AudioFormat, ResultCallback
 import uuid
 import json
 import io
@@ -79,15 +16,59 @@ import glob
 import signal
 import base64
 import traceback
-from logging.handlers import RotatingFileHandler
-
-# 配置日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
+from speech_config import SpeechConfig, default_env_paths, USER_CONFIG_FILE_NAME
+from speech_logging import LogPipeline
+from speech_results import SessionResultStore, format_sse, encode_delta, encode_deltas
+from speech_transcripts import TranscriptStore
+from speech_sessions import RecognitionSessionManager, SessionLimitError, SessionExistsError
+from audio_capture import MicrophoneCapture, get_pyaudio, terminate_pyaudio, list_input_devices, find_input_device
+from audio_playback import PlaybackEngine
+from speech_vad import VoiceActivityGate, VadTotals
+from tts_cache import TtsAudioCache, make_cache_key
+from tts_stream import TtsAudioBuffer, find_wav_data_offset
+from tts_formats import (AudioOutputFormat, negotiate_format, load_mp3_encoder, pcm_mimetype,
+                         CODECS, SAMPLE_RATES, CODEC_WAV, CODEC_PCM, CODEC_MP3)
+from tts_pool import SynthesizerPool
+from tts_sessions import SynthesizerFinisher, TtsSessionRegistry, CLOSE_STOPPED
+from tts_chunker import TextChunker
+from tts_batch import BatchSynthesisManager
+from speech_backend import load_backend, import_module
+from speech_metrics import registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from audio_sources import (PushAudioSource, FileAudioSource, AudioSourceError,
+                           SOURCE_MICROPHONE, SOURCE_STREAM, SOURCE_FILE)
+
+startup_profile.mark('imports')
+
+# 默认的音频输出目录（打包后位于可执行文件同级目录）
+if getattr(sys, 'frozen', False):
+    TTS_OUTPUT_DIR = os.path.join(os.path.dirname(sys.executable), 'audio_output')
+else:
+    TTS_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audio_output')
+
+# 配置：环境变量、.env.local 和 user_config.json 解析后缓存，文件修改时间变化后才重新读取。
+# .env.local 中的变量同时写入 os.environ，因此下面的 os.getenv 也能读到
+config = SpeechConfig(
+    env_paths=default_env_paths(os.path.dirname(os.path.abspath(__file__))),
+    user_config_path=os.path.join(os.path.dirname(__file__), USER_CONFIG_FILE_NAME),
+    default_storage_path=TTS_OUTPUT_DIR
+)
+settings = config.settings  # 启动时的配置快照
+
+# 配置日志：记录经队列交给后台线程写出，音频线程不会阻塞在控制台或文件I/O上
+LOG_LEVEL = os.getenv('SPEECH_LOG_LEVEL', 'INFO')   # 日志级别，调试时设为DEBUG
+LOG_FILE_ENABLED = os.getenv('SPEECH_LOG_FILE', '1').lower() not in ('0', 'false', 'no')  # 是否写日志文件
+LOG_DIR = os.getenv('SPEECH_LOG_DIR', '')           # 日志目录，默认为存储目录下的logs子目录
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024                # 单个日志文件大小上限
+LOG_FILE_BACKUP_COUNT = 3                           # 保留的旧日志文件数
+LOG_RATE_LIMIT_INTERVAL = float(os.getenv('SPEECH_LOG_RATE_INTERVAL', '1.0'))  # 帧级日志的限流时间窗口（秒）
+LOG_RATE_LIMIT_BURST = int(os.getenv('SPEECH_LOG_RATE_BURST', '5'))            # 每个调用位置每个窗口最多输出的条数
+STARTUP_PROFILE_ENABLED = os.getenv('SPEECH_STARTUP_PROFILE', '1').lower() not in ('0', 'false', 'no')  # 是否把启动耗时记录写入日志目录
+READY_MAX_WAIT = 30.0                               # 就绪检查等待预热结束的最长时间（秒）
+
+log_pipeline = LogPipeline(
+    level=LOG_LEVEL,
+    rate_limit_interval=LOG_RATE_LIMIT_INTERVAL,
+    rate_limit_burst=LOG_RATE_LIMIT_BURST
 )
 logger = logging.getLogger('speech_server')
 
@@ -96,92 +77,225 @@ app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # 全局变量
-recognition = None
-audio_queue = queue.Queue()
-results_queue = queue.Queue()
-is_recording = False
-current_session_id = None
-processing_thread = None
-stop_thread = threading.Event()
-
-# 添加TTS相关的全局变量
-tts_sessions = {}  # 存储会话ID -> TTS合成器的映射
-tts_callbacks = {}  # 存储会话ID -> 回调对象的映射
-
-# 音频设置
-CHUNK = 3200       # 每次读取的帧数
-FORMAT = pyaudio.paInt16  # 16位整型
+stop_thread = threading.Event()  # 服务器关闭标志
+selected_input_device = None  # 麦克风会话默认使用的输入设备索引，None为系统默认设备
+
+# 添加TTS相关的全局变量（tts_sessions 和 tts_callbacks 由会话登记表 tts_registry 维护）
+tts_audio_buffers = {}  # 存储会话ID -> 音频缓冲，会话停止后仍保留一段时间供客户端读完
+tts_audio_lock = threading.Lock()
+
+# 音频设置（CHUNK、RATE 等结构性设置在启动时读取，修改后需重启）
+CHUNK = settings.chunk  # 每次发送的帧数（200ms）
+FORMAT = 8         # 16位整型（pyaudio.paInt16）
 CHANNELS = 1       # 单声道
-RATE = 16000      # 采样率
+RATE = settings.rate    # 采样率
+CAPTURE_FRAMES_PER_BUFFER = 1600  # 采集回调的帧数（100ms）
+CAPTURE_BUFFER_SECONDS = 10.0     # 采集环形缓冲区可积压的时长
+CAPTURE_NATIVE_FORMAT = True      # 按设备原生采样率和通道数打开麦克风，再转换为16kHz单声道
+UPLOAD_READ_SIZE = 6400           # 读取上传音频流的块大小
+AUDIO_FILE_EXTENSIONS = ('.wav', '.pcm')  # 允许回放的音频文件类型
+REPLAY_DIR_NAME = 'replay'                # 未配置回放目录时使用存储目录下的该子目录
+
+# 语音服务后端：dashscope 为阿里云百炼，fake 为离线替身（无需网络和API密钥，用于调试和压测）
+SPEECH_BACKEND = os.getenv('SPEECH_BACKEND', 'dashscope')
+# 离线替身的可调参数，对应 fake_speech 中各类的构造参数
+FAKE_SPEECH_OPTIONS = {
+    'recognition_connect_latency': float(os.getenv('SPEECH_FAKE_CONNECT_LATENCY', '0.1')),
+    'recognition_error_rate': float(os.getenv('SPEECH_FAKE_ASR_ERROR_RATE', '0')),
+    'recognition_transcript': [t for t in os.getenv('SPEECH_FAKE_TRANSCRIPT', '').split('|') if t] or None,
+    'tts_connect_latency': float(os.getenv('SPEECH_FAKE_CONNECT_LATENCY', '0.1')),
+    'tts_first_chunk_latency': float(os.getenv('SPEECH_FAKE_FIRST_CHUNK_LATENCY', '0.1')),
+    'tts_chunk_latency': float(os.getenv('SPEECH_FAKE_CHUNK_LATENCY', '0.02')),
+    'tts_error_rate': float(os.getenv('SPEECH_FAKE_TTS_ERROR_RATE', '0')),
+    'tts_waveform': os.getenv('SPEECH_FAKE_WAVEFORM', 'tone'),
+}
+
+# 识别会话设置
+MAX_RECOGNITION_SESSIONS = settings.max_recognition_sessions  # 同时进行的识别会话上限，修改配置后立即生效
+
+# VAD设置（可在 /api/speech/start 的 vad 参数中按会话覆盖）
+VAD_ENABLED = False          # 默认不启用
+VAD_AGGRESSIVENESS = 1       # 0-3，越大越容易判为静音
+VAD_HANGOVER_MS = 600        # 语音结束后继续发送的时长
+VAD_PREROLL_MS = 300         # 语音开始时补发的前导时长
+VAD_KEEPALIVE_SECONDS = 10.0  # 静音期间的保活发送间隔，避免识别服务超时断开
+VAD_AUTO_STOP_SECONDS = 0    # 连续静音超过该秒数自动结束识别，0为不启用
+
+# TTS设置
+TTS_MODEL = settings.tts_model
+TTS_CACHE_ENABLED = True                 # 是否缓存合成的音频
+TTS_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 缓存目录的容量上限
+TTS_CACHE_REPLAY_CHUNK = 6400            # 命中缓存时回放的块大小
+TTS_LOCAL_PLAYBACK = settings.tts_local_playback  # 默认是否在服务器声卡上播放，客户端可在创建会话时关闭
+TTS_STREAM_BUFFER_BYTES = 32 * 1024 * 1024  # 每个会话为HTTP客户端保留的音频上限
+TTS_STREAM_WAIT_TIMEOUT = 0.5            # 音频流等待新数据的间隔（秒）
+TTS_STREAM_RETAINED_SESSIONS = 16        # 已结束会话的音频最多保留的个数
+TTS_PLAYBACK_MODE = 'queue'              # 多个会话同时播放时：queue 依次播放，mix 混音
+TTS_PLAYBACK_PREBUFFER_MS = 200          # 开始播放前缓冲的时长，吸收网络抖动
+TTS_PLAYBACK_MAX_BUFFER_SECONDS = 120.0  # 每个会话最多缓冲的音频时长
+TTS_SEGMENT_ENABLED = True               # 默认在服务端按句子合并流式推送的文本，客户端可在创建会话时关闭
+TTS_SEGMENT_MIN_CHARS = 6                # 句末标点处输出一段的最小长度
+TTS_SEGMENT_FIRST_MIN_CHARS = 2          # 第一段的最小长度（尽快出声）
+TTS_SEGMENT_CLAUSE_CHARS = 20            # 长度达到该值后也在逗号等分句标点处输出
+TTS_SEGMENT_MAX_CHARS = 80               # 单段最大长度
+TTS_SEGMENT_MAX_DELAY = 0.4              # 文本在缓冲区中最长停留时间（秒）
+TTS_BATCH_WORKERS = settings.tts_batch_workers      # 批量合成的并发数
+TTS_BATCH_MAX_ITEMS = settings.tts_batch_max_items  # 单个批量任务最多的条目数
+TTS_BATCH_TIMEOUT = 120.0                # 单条批量合成的超时（秒）
+TTS_READY_TIMEOUT = 5.0                  # 等待TTS连接就绪的最长时间（秒）
+TTS_STATUS_MAX_WAIT = 30.0               # 状态查询等待合成完成的最长时间（秒）
+TTS_POOL_SIZE = settings.tts_pool_size   # 每个音色保持预热的合成器个数，0为不预热
+TTS_POOL_IDLE_TTL = settings.tts_pool_idle_ttl  # 预热连接的最长空闲时间（秒），超时后关闭，下次取用时再预热
+TTS_POOL_KEY_TTL = 600.0                 # 音色超过该秒数未使用时不再预热
+TTS_POOL_PRELOAD_VOICES = list(settings.tts_preload_voices)  # 启动时即预热的音色
+TTS_MAX_SESSIONS = settings.tts_max_sessions          # 同时保留的TTS会话上限，超过时关闭最久未活动的会话
+TTS_SESSION_IDLE_TTL = settings.tts_session_idle_ttl  # 会话无请求也无音频超过该秒数后自动关闭
+TTS_SESSION_SWEEP_INTERVAL = 5.0         # 检查空闲会话的间隔（秒）
+TTS_FINISH_WORKERS = 2                   # 关闭合成器的线程数
+TTS_FINISH_TIMEOUT = 10.0                # 关闭合成器超过该秒数记为超时
+
+# 识别结果缓冲设置
+RESULT_BUFFER_SIZE = 200                # 每个会话最多保留的结果条数
+RESULT_SESSION_TTL = 300                # 会话无读写超过该秒数后清理
+RESULT_OVERFLOW_POLICY = 'drop_partials'  # 缓冲区满时优先丢弃中间结果
+RESULT_COALESCE_PARTIALS = True         # 同一句的新结果总是替换队尾的旧中间结果，不论是否已被读取
+
+# 识别文本记录设置
+TRANSCRIPT_ENABLED = os.getenv('SPEECH_TRANSCRIPTS', '1').lower() not in ('0', 'false', 'no')  # 是否记录句末结果
+TRANSCRIPT_FLUSH_INTERVAL = 1.0              # 批量写盘的间隔（秒）
+TRANSCRIPT_FLUSH_BATCH = 50                  # 待写条数达到该值时立即写盘
+TRANSCRIPT_MAX_PENDING = 5000                # 待写队列上限，磁盘不可写时丢弃最早的记录
+TRANSCRIPT_MAX_TOTAL_BYTES = 256 * 1024 * 1024  # 记录文件的总容量上限，超过时删除最早的分段
+TRANSCRIPT_QUERY_MAX_LIMIT = 1000            # 单次查询最多返回的条数
+
+# SSE推送设置
+SSE_HEARTBEAT_INTERVAL = 1.0  # 心跳间隔（秒），前端据此进行静音检测
+SSE_RETRY_MS = 1000           # 断线后浏览器重连间隔（毫秒）
 
-# PyAudio实例和流
-audio = None
-stream = None
+# 按会话保存的识别结果，供轮询和SSE推送共用
+result_store = SessionResultStore(
+    max_items_per_session=RESULT_BUFFER_SIZE,
+    session_ttl=RESULT_SESSION_TTL,
+    overflow_policy=RESULT_OVERFLOW_POLICY,
+    coalesce_partials=RESULT_COALESCE_PARTIALS
+)
 
 # 初始化DashScope API密钥
 def init_dashscope_api_key():
     """
     初始化DashScope API密钥
-    1. 优先从环境变量读取
-    2. 然后尝试从.env.local文件读取
+    1. 优先使用启动时的环境变量
+    2. 然后使用.env.local中的值，文件修改后自动生效
+    密钥从缓存的配置中读取，不会访问文件
     """
-    global api_key
-    
-    try:
-        # 1. 尝试从环境变量读取
-        if 'DASHSCOPE_API_KEY' in os.environ:
-            api_key = os.environ['DASHSCOPE_API_KEY']
-            print("从环境变量加载API密钥成功")
-            return api_key
-            
-        # 2. 尝试从.env.local文件读取
-        env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env.local')
-        if os.path.exists(env_path):
-            try:
-                with open(env_path, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if line.startswith('DASHSCOPE_API_KEY='):
-                            api_key = line.strip().split('=', 1)[1]
-                            print("从.env.local文件加载API密钥成功")
-                            return api_key
-            except Exception as e:
-                print(f"从.env.local读取API密钥失败: {e}")
-                
-        # 如果都没有找到API密钥，使用默认值
-        print("警告: 未找到阿里云百炼API密钥，语音功能可能无法正常工作")
-        return "<your-dashscope-api-key>"
-        
-    except Exception as e:
-        print(f"初始化API密钥时发生错误: {e}")
+    api_key = config.settings.api_key
+    if not api_key:
+        # 每次创建会话都会调用，按调用位置限流
+        logger.warning('未找到阿里云百炼API密钥，语音功能可能无法正常工作', extra={'rate_limit': True})
         return "<your-dashscope-api-key>"
+    dashscope = import_module('dashscope')
+    if dashscope.api_key != api_key:
+        dashscope.api_key = api_key
+        logger.info('已加载DashScope API密钥')
+    return api_key
+
+# 后端的实现（SDK）在预热阶段或第一次创建会话时导入
+speech_backend = load_backend(SPEECH_BACKEND, FAKE_SPEECH_OPTIONS)
+logger.info(f'语音服务后端: {speech_backend.name}')
+
+# 合成服务的音频格式（SDK的AudioFormat），name 为成员名；第一次调用时导入SDK
+def sdk_audio_format(name):
+    return import_module('dashscope.audio.tts_v2').AudioFormat[name]
+
+# 按请求参数 format/sample_rate/bitrate 协商TTS输出格式，未指定的项使用配置中的默认值；不支持时抛出ValueError
+def negotiate_tts_format(options, local_playback=False):
+    settings = config.settings
+    return negotiate_format(
+        options.get('format'),
+        options.get('sample_rate'),
+        options.get('bitrate'),
+        need_pcm=local_playback,
+        default=AudioOutputFormat(settings.tts_output_format, settings.tts_sample_rate),
+        mp3_bitrate=settings.tts_mp3_bitrate
+    )
+
+# 音频接口的响应类型；?format=pcm 只适用于WAV会话（跳过WAV头）
+# 返回 (mimetype, 是否跳过WAV头)，会话的格式不能按裸PCM读取时抛出ValueError
+def tts_audio_response_format(audio_buffer, requested=None):
+    audio_format = audio_buffer.audio_format or AudioOutputFormat()
+    if (requested or '').lower() != CODEC_PCM or audio_format.codec == CODEC_PCM:
+        return audio_format.mimetype, False
+    if audio_format.codec != CODEC_WAV:
+        raise ValueError(f'{audio_format.codec} 格式的会话不能按裸PCM读取')
+    return pcm_mimetype(audio_format.sample_rate), True
+
+# 创建识别/合成实例前的准备（离线替身不需要API密钥）
+def prepare_speech_backend():
+    if speech_backend.requires_api_key:
+        init_dashscope_api_key()
 
 # 获取用户选择的存储目录
 def get_user_storage_path():
-    """获取用户在设置中选择的存储路径"""
+    """获取用户在设置中选择的存储路径（user_config.json 的 storagePath），未设置时返回默认路径"""
+    return config.storage_path()
+
+# TTS音频缓存，位于存储目录下的tts_cache子目录
+tts_cache = None
+tts_cache_lock = threading.Lock()
+
+def get_tts_cache():
+    """返回当前存储目录对应的TTS缓存，存储目录变化时重新加载"""
+    global tts_cache
+    if not TTS_CACHE_ENABLED:
+        return None
     try:
-        config_path = os.path.join(os.path.dirname(__file__), 'user_config.json')
-        if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                if 'storagePath' in config and config['storagePath']:
-                    # 确保路径存在
-                    storage_path = config['storagePath']
-                    audio_path = os.path.join(storage_path, 'audio_output')
-                    if not os.path.exists(audio_path):
-                        os.makedirs(audio_path)
-                    logger.info(f'使用用户存储路径: {audio_path}')
-                    return audio_path
+        cache_dir = os.path.join(get_user_storage_path(), 'tts_cache')
+        with tts_cache_lock:
+            if tts_cache is None or tts_cache.directory != cache_dir:
+                if tts_cache is not None:
+                    tts_cache.flush()
+                tts_cache = TtsAudioCache(cache_dir, max_bytes=TTS_CACHE_MAX_BYTES)
+            return tts_cache
     except Exception as e:
-        logger.error(f'获取用户存储路径失败: {e}')
-    
-    # 如果没有用户设置的路径或出错，返回默认路径
-    logger.info(f'使用默认存储路径: {TTS_OUTPUT_DIR}')
-    return TTS_OUTPUT_DIR
+        logger.error(f'初始化TTS缓存失败: {e}', exc_info=True)
+        return None
+
+# 识别文本记录，句末结果追加写入存储目录下的transcripts子目录
+transcript_store = TranscriptStore(
+    lambda: os.path.join(get_user_storage_path(), 'transcripts'),
+    flush_interval=TRANSCRIPT_FLUSH_INTERVAL,
+    flush_batch=TRANSCRIPT_FLUSH_BATCH,
+    max_pending=TRANSCRIPT_MAX_PENDING,
+    max_total_bytes=TRANSCRIPT_MAX_TOTAL_BYTES
+)
+
+# 结果发布后调用的函数，参数为结果；在识别回调线程中执行，不能阻塞
+result_listeners = []
+
+# 发布识别结果，轮询和SSE订阅者都从结果存储读取
+def publish_result(result):
+    # 记录产生时间，投递给客户端时据此统计回调到投递的延迟
+    result.setdefault('time', time.time())
+    result_store.publish(result['session_id'], result)
+    for listener in result_listeners:
+        try:
+            listener(result)
+        except Exception as e:
+            logger.error(f'结果监听器出错: {e}')
+
+# 结果已交给客户端，记录从识别回调到投递的延迟
+def observe_delivery(results):
+    now = time.time()
+    for result in results:
+        if 'time' in result:
+            RESULT_DELIVERY_SECONDS.observe(max(0.0, now - result['time']))
 
-# 语音识别回调类
-class ParaformerCallback(RecognitionCallback):
+# 语音识别回调类（接口与SDK的 RecognitionCallback 相同，SDK只按方法名调用，不继承以免启动时导入SDK）
+class ParaformerCallback:
     def __init__(self, session_id):
         self.session_id = session_id
+        self.started_at = time.time()  # 识别开始的时间，句子时间戳相对于此
+        self.sentence_id = 0  # 当前句子的序号，句末结果之后加1
         
     def on_open(self) -> None:
         logger.info(f'识别会话已打开: {self.session_id}')
@@ -191,7 +305,7 @@ class ParaformerCallback(RecognitionCallback):
         
     def on_complete(self) -> None:
         logger.info(f'识别会话已完成: {self.session_id}')
-        results_queue.put({
+        publish_result({
             'type': 'complete',
             'session_id': self.session_id,
             'message': '识别完成'
@@ -209,59 +323,102 @@ class ParaformerCallback(RecognitionCallback):
         except Exception as e:
             logger.error(f'解析错误信息失败: {e}')
             
-        results_queue.put({
+        publish_result({
             'type': 'error',
             'session_id': self.session_id,
             'message': message.message
         })
         
-    def on_event(self, result: RecognitionResult) -> None:
+    def on_event(self, result) -> None:
         try:
             sentence = result.get_sentence()
-            logger.debug(f'收到识别事件: {sentence}')
+            logger.debug('收到识别事件: %s', sentence)
             
             if 'text' in sentence:
                 text = sentence['text']
-                is_end = RecognitionResult.is_sentence_end(sentence)
-                logger.info(f'识别结果: {text} (是否结束: {is_end})')
+                # 与 RecognitionResult.is_sentence_end 相同：有结束时间即为句末
+                is_end = sentence.get('end_time') is not None
+                # 中间结果每秒多次，按调用位置限流
+                logger.info('识别结果: %s (是否结束: %s)', text, is_end, extra={'rate_limit': not is_end})
                 
                 if 'begin_time' in sentence and 'end_time' in sentence:
-                    logger.debug(f'时间戳: 开始={sentence["begin_time"]}ms, 结束={sentence["end_time"]}ms')
+                    logger.debug('时间戳: 开始=%sms, 结束=%sms', sentence['begin_time'], sentence['end_time'])
                 
-                results_queue.put({
+                publish_result({
                     'type': 'text',
                     'session_id': self.session_id,
+                    'sentence_id': self.sentence_id,
                     'text': text,
                     'is_end': is_end
                 })
                 
                 if is_end:
+                    self.sentence_id += 1
                     logger.info(f'句子结束: {text}')
+                    if TRANSCRIPT_ENABLED and text:
+                        transcript_store.append(self.session_id, text, sentence.get('begin_time'),
+                                                sentence.get('end_time'), self.started_at)
             else:
                 logger.warning(f'识别事件中没有文本内容: {sentence}')
         except Exception as e:
             logger.error(f'处理识别事件时出错: {e}', exc_info=True)
 
-# 添加TTS回调类
-class TtsCallback(ResultCallback):
-    def __init__(self, session_id):
-        super().__init__()  # 调用父类初始化
+# 添加TTS回调类（接口与SDK的 ResultCallback 相同）
+class TtsCallback:
+    def __init__(self, session_id, local_playback=TTS_LOCAL_PLAYBACK, audio_format=None):
         self.session_id = session_id
-        self._player = None
-        self._stream = None
+        self.local_playback = local_playback  # 是否在服务器声卡上播放
+        # 输出格式：合成服务的数据经 encoder 编码后再交给音频流和缓存，本地播放使用编码前的PCM
+        self.audio_format = audio_format or AudioOutputFormat()
+        self.encoder = self.audio_format.create_encoder()
+        self.audio_buffer = TtsAudioBuffer(TTS_STREAM_BUFFER_BYTES, self.audio_format)  # 供HTTP客户端读取的音频
+        self.playback = None  # 共享播放引擎中本会话的通道，收到第一块音频时创建
+        self.playback_resampler = None  # 采样率与播放引擎不同时转换
         self.is_ready = False
         self.is_initialized = False
-        self.voice = 'longxiaochun'  # 默认音色
+        self.ready_event = threading.Event()  # 连接已建立，可以发送文本
+        self.done_event = threading.Event()   # 合成已结束（完成或出错）
+        self.connecting = False  # 正在建立连接（第一次发送文本时）
+        self.error = None
+        self.completed = False
+        self.call_lock = threading.Lock()  # 保证同一会话的文本按顺序发送
+        self.chunker = None  # 文本分段器，为None时每次请求的文本直接发送
+        self.voice = config.settings.tts_voice  # 默认音色
+        self.text_parts = []  # 本会话发送过的文本，完成时用于计算缓存键
+        self.cache = None  # 为None时不缓存本会话的音频
+        self.cache_writer = None
+        self.text_sent_at = None  # 第一次发送文本的时间，用于统计首个音频的延迟
+        self.first_audio_at = None
+        self.last_activity = None  # 最后一次收到音频的时间，会话登记表据此判断是否空闲
         # 不在构造函数中初始化音频设备，避免冲突
         
     def on_open(self):
         logger.info(f'TTS会话已打开: {self.session_id}')
         # WebSocket连接已建立
         self.is_initialized = True
+        self.connecting = False
+        self.ready_event.set()
         logger.info(f'TTS WebSocket连接已建立: {self.session_id}')
         
     def on_complete(self):
         logger.info(f'TTS会话已完成: {self.session_id}')
+        # 输出编码器中剩余的数据
+        try:
+            self.deliver(self.encoder.flush())
+        except Exception as e:
+            logger.warning(f'TTS音频编码出错: {e}')
+        # 合成完整结束，把录下的音频提交到缓存
+        if self.cache_writer is not None:
+            try:
+                key = make_cache_key(TTS_MODEL, self.voice, self.audio_format, ''.join(self.text_parts))
+                if self.cache_writer.commit(key):
+                    logger.info(f'已缓存TTS音频: {self.session_id}, {self.cache_writer.size} 字节')
+            except Exception as e:
+                logger.warning(f'缓存TTS音频失败: {e}')
+            self.cache_writer = None
+        self.audio_buffer.finish()
+        self.completed = True
+        self.done_event.set()
         # 在播放完成时设置状态标志
         logger.info(f'TTS播放完成，设置完成标志: {self.session_id}')
         # 发送WebSocket完成事件
@@ -273,174 +430,421 @@ class TtsCallback(ResultCallback):
         
     def on_error(self, error):
         logger.error(f'TTS错误: {error}')
+        self.discard_cache_writer()
+        self.audio_buffer.finish(str(error))
+        self.error = str(error)
+        self.connecting = False
+        self.done_event.set()
+        
+    def wait_ready(self, timeout):
+        """正在建立连接时等待连接就绪，返回连接是否可用"""
+        if self.connecting and not self.done_event.is_set():
+            self.ready_event.wait(timeout)
+        return self.ready_event.is_set()
+        
+    def state(self):
+        if self.error:
+            return 'failed'
+        if self.completed:
+            return 'completed'
+        if self.done_event.is_set():
+            return 'closed'
+        if self.ready_event.is_set():
+            return 'ready'
+        return 'connecting' if self.connecting else 'idle'
+        
+    def discard_cache_writer(self):
+        # 合成未正常完成，丢弃录到一半的音频
+        if self.cache_writer is not None:
+            self.cache_writer.abort()
+            self.cache_writer = None
         
     def on_close(self):
         logger.info(f'TTS会话已关闭: {self.session_id}')
-        # 关闭音频流和播放器
-        if self._stream:
-            try:
-                self._stream.stop_stream()
-                self._stream.close()
-                self._stream = None
-                logger.info(f'已关闭音频流: {self.session_id}')
-            except Exception as e:
-                logger.error(f'关闭音频流时出错: {e}')
-        
-        if self._player:
-            try:
-                self._player.terminate()
-                self._player = None
-                logger.info(f'已终止音频播放器: {self.session_id}')
-            except Exception as e:
-                logger.error(f'终止音频播放器时出错: {e}')
+        self.discard_cache_writer()
+        self.audio_buffer.finish()
+        if self.chunker is not None:
+            self.chunker.close()
+        # 数据已全部到达，播放引擎播完缓冲区后移除通道
+        if self.playback is not None:
+            self.playback.end()
         
         self.is_ready = False
         self.is_initialized = False
+        self.connecting = False
+        self.ready_event.clear()
+        self.done_event.set()
         
     def on_event(self, event):
-        logger.debug(f'收到TTS事件: {event}')
+        logger.debug('收到TTS事件: %s', event)
+        
+    def mark_text_sent(self):
+        if self.text_sent_at is None:
+            self.text_sent_at = time.perf_counter()
         
     def on_data(self, data: bytes):
-        # 延迟初始化音频设备，直到收到第一个音频数据
-        if not self._player or not self._stream:
-            try:
-                logger.info(f'收到音频数据，初始化播放设备: {self.session_id}')
-                self._player = pyaudio.PyAudio()
-                self._stream = self._player.open(
-                    format=pyaudio.paInt16,
-                    channels=1,
-                    rate=16000,
-                    output=True
-                )
-                self.is_ready = True
-                logger.info(f'音频设备初始化成功: {self.session_id}')
-            except Exception as e:
-                logger.error(f'初始化音频播放器失败: {e}')
-                return
+        # 合成服务的音频：编码后交给音频流和缓存，编码前的PCM交给本地播放
+        TTS_CHUNKS_RECEIVED.inc()
+        self.deliver(self.encoder.encode(data))
+        if self.local_playback and self.audio_format.has_pcm:
+            self.play(data)
+        logger.debug('收到音频数据: %d 字节', len(data))
         
-        # 播放音频数据
-        logger.debug(f'收到音频数据: {len(data)} 字节')
-        if self._stream and self.is_ready:
+    def deliver(self, data):
+        # 已编码的音频：录制到缓存并交给HTTP客户端（编码器积累不足一帧时可能为空）
+        self.last_activity = time.monotonic()
+        if self.first_audio_at is None:
+            self.first_audio_at = time.perf_counter()
+            if self.text_sent_at is not None:
+                TTS_FIRST_AUDIO_SECONDS.observe(self.first_audio_at - self.text_sent_at)
+        if not data:
+            return
+        if self.cache is not None:
             try:
-                self._stream.write(data)
-                logger.debug(f'已播放 {len(data)} 字节音频')
+                if self.cache_writer is None:
+                    self.cache_writer = self.cache.open_writer(self.audio_format.extension)
+                self.cache_writer.write(data)
             except Exception as e:
-                logger.error(f'播放音频数据时出错: {e}')
+                logger.warning(f'写入TTS缓存失败: {e}')
+                self.cache = None
+                self.discard_cache_writer()
+        # 只是放入缓冲区，不会阻塞
+        self.audio_buffer.append(data)
+        
+    def play(self, pcm):
+        # 交给本地播放引擎，采样率不同时先转换为播放引擎的采样率
+        if self.playback is None:
+            logger.info(f'收到音频数据，开始本地播放: {self.session_id}')
+            self.playback = playback_engine.open_channel(self.session_id)
+            self.is_ready = True
+            if self.audio_format.sample_rate != RATE:
+                from audio_resample import PolyphaseResampler
+                self.playback_resampler = PolyphaseResampler(self.audio_format.sample_rate, RATE)
+        if self.playback_resampler is not None:
+            pcm = self.playback_resampler.process(pcm)
+        self.playback.write(pcm)
+        
+    def stop_playback(self):
+        # 立即停止本地播放并清空缓冲
+        if self.playback is not None:
+            self.playback.cancel()
+        
+    @property
+    def is_playing(self):
+        return self.playback is not None and not self.playback.finished
 
-# 音频处理线程函数 - 直接从麦克风读取数据
-def audio_processing():
-    global recognition, is_recording, audio, stream
-    
-    logger.info('音频处理线程已启动')
+# 共享的本地播放引擎
+playback_engine = PlaybackEngine(
+    rate=RATE,
+    prebuffer_ms=TTS_PLAYBACK_PREBUFFER_MS,
+    max_buffer_seconds=TTS_PLAYBACK_MAX_BUFFER_SECONDS,
+    mode=TTS_PLAYBACK_MODE
+)
+
+# 在固定数量的线程中关闭合成器，停止会话时不再为每个会话新建线程
+tts_finisher = SynthesizerFinisher(workers=TTS_FINISH_WORKERS, timeout=TTS_FINISH_TIMEOUT)
+
+# 预热的TTS合成器池
+tts_pool = SynthesizerPool(
+    size=TTS_POOL_SIZE,
+    idle_ttl=TTS_POOL_IDLE_TTL,
+    key_ttl=TTS_POOL_KEY_TTL,
+    prepare=prepare_speech_backend,
+    factory=lambda **kwargs: speech_backend.SpeechSynthesizer(**kwargs),
+    finisher=tts_finisher
+)
+
+# 关闭TTS会话：结束音频流、停止本地播放，合成器交给 tts_finisher 关闭
+def close_tts_session(session_id, entry, reason):
+    callback = entry.callback
+    if callback is not None:
+        # 合成被中途停止，不缓存不完整的音频
+        callback.discard_cache_writer()
+        # 结束音频流，正在读取的客户端读完已有数据后返回
+        callback.audio_buffer.finish(None if reason == CLOSE_STOPPED else f'会话已关闭: {reason}')
+        # 丢弃尚未发送的文本，立即停止本地播放
+        if callback.chunker is not None:
+            callback.chunker.close()
+        callback.stop_playback()
+    # 未使用的预热连接在关闭时取消任务
+    tts_finisher.submit(entry.synthesizer, session_id)
+    logger.info(f'已关闭TTS会话: {session_id}, 原因: {reason}')
+
+# TTS会话登记表：空闲超时和超过上限的会话自动关闭
+tts_registry = TtsSessionRegistry(
+    close_tts_session,
+    idle_ttl=TTS_SESSION_IDLE_TTL,
+    max_sessions=TTS_MAX_SESSIONS,
+    sweep_interval=TTS_SESSION_SWEEP_INTERVAL,
+    is_busy=lambda entry: entry.callback is not None and entry.callback.is_playing
+)
+tts_sessions = tts_registry.synthesizers  # 会话ID -> TTS合成器，只读
+tts_callbacks = tts_registry.callbacks    # 会话ID -> 回调对象，只读
+
+# 为TTS会话取得合成器：启用预热时从池中取用，否则新建
+def acquire_synthesizer(voice, callback):
+    source_format = sdk_audio_format(callback.audio_format.source_format)
+    if TTS_POOL_SIZE > 0:
+        return tts_pool.acquire(TTS_MODEL, voice, source_format, callback)
+    prepare_speech_backend()
+    synthesizer = speech_backend.SpeechSynthesizer(
+        model=TTS_MODEL,
+        voice=voice,
+        format=source_format,
+        callback=callback
+    )
+    return synthesizer, False
+
+# 为TTS会话创建文本分段器，分段后的文本直接发送给合成器
+def create_text_chunker(synthesizer, callback):
+    def send(text):
+        if not callback.ready_event.is_set():
+            callback.connecting = True
+        callback.mark_text_sent()
+        logger.debug('发送分段文本到TTS: %s', text[:30] + ('...' if len(text) > 30 else ''))
+        synthesizer.streaming_call(text)
     
+    return TextChunker(
+        send,
+        min_chars=TTS_SEGMENT_MIN_CHARS,
+        first_min_chars=TTS_SEGMENT_FIRST_MIN_CHARS,
+        clause_chars=TTS_SEGMENT_CLAUSE_CHARS,
+        max_chars=TTS_SEGMENT_MAX_CHARS,
+        max_delay=TTS_SEGMENT_MAX_DELAY,
+        on_error=callback.on_error
+    )
+
+# 批量合成单条文本，返回完整音频
+def synthesize_batch_text(voice, text, audio_format):
+    prepare_speech_backend()
+    synthesizer = speech_backend.SpeechSynthesizer(model=TTS_MODEL, voice=voice,
+                                                   format=sdk_audio_format(audio_format.source_format))
+    audio = synthesizer.call(text, timeout_millis=int(TTS_BATCH_TIMEOUT * 1000))
+    return audio_format.encode_all(audio) if audio else audio
+
+batch_manager = BatchSynthesisManager(
+    synthesize_batch_text,
+    max_workers=TTS_BATCH_WORKERS,
+    max_items=TTS_BATCH_MAX_ITEMS,
+    cache=get_tts_cache,
+    cache_key=lambda voice, text, audio_format: make_cache_key(TTS_MODEL, voice, audio_format, text)
+)
+
+# 登记会话的音频缓冲，并清理最早结束的会话
+def register_tts_audio_buffer(session_id, audio_buffer):
+    with tts_audio_lock:
+        tts_audio_buffers[session_id] = audio_buffer
+        finished = [sid for sid, buf in tts_audio_buffers.items() if buf.done]
+        for sid in finished[:max(0, len(finished) - TTS_STREAM_RETAINED_SESSIONS)]:
+            del tts_audio_buffers[sid]
+
+# 命中缓存时在后台线程中回放音频，经由回调输出，与实时合成的输出方式一致
+def replay_cached_audio(callback, path):
     try:
-        # 创建PyAudio实例
-        audio = pyaudio.PyAudio()
-        
-        # 打开音频流
-        stream = audio.open(
-            format=FORMAT,
+        with open(path, 'rb') as f:
+            audio = f.read()
+        logger.info(f'TTS缓存命中，回放 {len(audio)} 字节: {callback.session_id}')
+        callback.mark_text_sent()
+        callback.is_initialized = True
+        callback.ready_event.set()
+        # 缓存中是编码后的数据，直接交给音频流；本地播放只用于WAV/PCM（见 cache_replayable）
+        pcm = audio[find_wav_data_offset(audio) or 0:] if callback.local_playback else b''
+        for offset in range(0, len(audio), TTS_CACHE_REPLAY_CHUNK):
+            callback.deliver(audio[offset:offset + TTS_CACHE_REPLAY_CHUNK])
+            if pcm[offset:offset + TTS_CACHE_REPLAY_CHUNK]:
+                callback.play(pcm[offset:offset + TTS_CACHE_REPLAY_CHUNK])
+        callback.on_complete()
+    except Exception as e:
+        logger.error(f'回放缓存音频失败: {e}', exc_info=True)
+        callback.on_error(str(e))
+
+# 命中缓存时能否直接回放：本地播放需要PCM，缓存中的MP3无法解码
+def cache_replayable(callback):
+    return not callback.local_playback or callback.audio_format.codec in (CODEC_WAV, CODEC_PCM)
+
+# 根据请求参数为识别会话创建音频来源
+# 文件回放的路径：相对路径按回放目录解析，解析后（含符号链接）不在回放目录中的路径一律拒绝
+def resolve_replay_path(file_path):
+    replay_dir = config.settings.replay_dir or os.path.join(get_user_storage_path(), REPLAY_DIR_NAME)
+    root = os.path.realpath(replay_dir)
+    path = os.path.realpath(os.path.join(root, file_path))
+    try:
+        inside = os.path.commonpath([root, path]) == root
+    except ValueError:  # 不在同一个驱动器
+        inside = False
+    if not inside:
+        raise AudioSourceError('只能回放回放目录中的文件')
+    return path
+
+def open_audio_source(session_id, options):
+    source = options.get('source', SOURCE_MICROPHONE)
+    
+    if source == SOURCE_MICROPHONE:
+        # 本机麦克风，每个会话使用独立的回调模式采集器；device 为设备索引，未指定时使用选定的设备
+        device_index = options.get('device', selected_input_device)
+        return MicrophoneCapture(
+            rate=RATE,
             channels=CHANNELS,
+            frames_per_buffer=CAPTURE_FRAMES_PER_BUFFER,
+            batch_bytes=CHUNK * 2,
+            buffer_seconds=CAPTURE_BUFFER_SECONDS,
+            device_index=int(device_index) if device_index is not None else None,
+            name=session_id,
+            native=CAPTURE_NATIVE_FORMAT
+        )
+    
+    if source == SOURCE_STREAM:
+        # 客户端通过 /api/speech/audio/<session_id> 上传16kHz单声道PCM
+        return PushAudioSource(rate=RATE, batch_bytes=CHUNK * 2)
+    
+    if source == SOURCE_FILE:
+        # 回放目录中的WAV/PCM文件，speed为0时不限速
+        file_path = options.get('file_path') or ''
+        if not file_path.lower().endswith(AUDIO_FILE_EXTENSIONS):
+            raise AudioSourceError(f'仅支持回放以下类型的文件: {", ".join(AUDIO_FILE_EXTENSIONS)}')
+        speed = float(options.get('speed', 1.0))
+        loop = bool(options.get('loop', False))
+        if loop and speed <= 0:
+            # 不限速的循环回放会一直占满识别连接，直到被停止
+            raise AudioSourceError('不限速回放（speed为0）时不能循环')
+        return FileAudioSource(
+            resolve_replay_path(file_path),
             rate=RATE,
-            input=True,
-            frames_per_buffer=CHUNK
+            batch_bytes=CHUNK * 2,
+            speed=speed,
+            loop=loop
         )
-        
-        logger.info(f'已打开麦克风，采样率: {RATE}Hz, 单声道, 16位')
-        
-        # 主循环 - 从麦克风读取并发送数据
-        while not stop_thread.is_set():
-            if not is_recording:
-                time.sleep(0.1)
-                continue
-                
-            try:
-                if is_recording and recognition:
-                    # 直接从麦克风读取数据
-                    audio_data = stream.read(CHUNK, exception_on_overflow=False)
-                    
-                    if len(audio_data) > 0:
-                        logger.debug(f'从麦克风读取音频数据: {len(audio_data)}字节')
-                        
-                        # 直接发送给识别器
-                        recognition.send_audio_frame(audio_data)
-                        logger.debug('已发送音频数据帧')
-                    
-            except Exception as e:
-                logger.error(f"音频处理错误: {e}", exc_info=True)
-                
-            time.sleep(0.01)
     
-    except Exception as e:
-        logger.error(f"初始化音频设备失败: {e}", exc_info=True)
+    raise AudioSourceError(f'未知的音频来源: {source}')
+
+# 所有会话的VAD累计统计
+vad_totals = VadTotals()
+
+# 根据请求参数为识别会话创建VAD门限
+# vad 参数可以是布尔值，或 {"aggressiveness": 0-3, "auto_stop_seconds": 秒} 形式的对象
+def create_vad(session_id, options):
+    if options is None:
+        options = VAD_ENABLED
+    if isinstance(options, bool):
+        options = {'enabled': options}
+    if not options.get('enabled', True):
+        return None, 0
     
-    finally:
-        # 清理资源
-        logger.info('关闭音频处理线程...')
-        if stream:
-            stream.stop_stream()
-            stream.close()
-        
-        if audio:
-            audio.terminate()
-            
-        logger.info('音频处理线程已停止')
+    gate = VoiceActivityGate(
+        rate=RATE,
+        aggressiveness=int(options.get('aggressiveness', VAD_AGGRESSIVENESS)),
+        hangover_ms=int(options.get('hangover_ms', VAD_HANGOVER_MS)),
+        preroll_ms=int(options.get('preroll_ms', VAD_PREROLL_MS)),
+        keepalive_seconds=VAD_KEEPALIVE_SECONDS,
+        totals=vad_totals
+    )
+    auto_stop_seconds = float(options.get('auto_stop_seconds', VAD_AUTO_STOP_SECONDS))
+    logger.info(f'会话 {session_id} 启用VAD: 灵敏度={gate.aggressiveness}, 静音自动结束={auto_stop_seconds}秒')
+    return gate, auto_stop_seconds
+
+# 为会话创建识别实例
+def create_recognition(session_id):
+    # 初始化DashScope API密钥
+    prepare_speech_backend()
+    
+    return speech_backend.Recognition(
+        model=config.settings.recognition_model,
+        format='pcm',  # 音频格式
+        sample_rate=RATE,  # 采样率
+        semantic_punctuation_enabled=True,  # 启用语义断句
+        callback=ParaformerCallback(session_id)
+    )
+
+# 识别会话管理器
+recognition_manager = RecognitionSessionManager(
+    recognition_factory=create_recognition,
+    audio_source_factory=open_audio_source,
+    max_sessions=MAX_RECOGNITION_SESSIONS,
+    vad_factory=create_vad
+)
+
+# 配置文件修改后应用可以立即生效的设置，其余设置需要重启服务
+RESTART_REQUIRED_SETTINGS = ('host', 'port', 'chunk', 'rate', 'tts_model', 'tts_local_playback',
+                             'tts_pool_size', 'tts_batch_workers', 'tts_batch_max_items')
+
+def apply_config_change(new_settings, changed):
+    if 'max_recognition_sessions' in changed:
+        recognition_manager.max_sessions = new_settings.max_recognition_sessions
+    if 'tts_max_sessions' in changed:
+        tts_registry.max_sessions = new_settings.tts_max_sessions
+    if 'tts_session_idle_ttl' in changed:
+        tts_registry.idle_ttl = new_settings.tts_session_idle_ttl
+    if 'tts_pool_idle_ttl' in changed:
+        tts_pool.idle_ttl = new_settings.tts_pool_idle_ttl
+    if 'api_key' in changed and speech_backend.requires_api_key:
+        init_dashscope_api_key()
+    pending = [name for name in changed if name in RESTART_REQUIRED_SETTINGS]
+    if pending:
+        logger.warning(f'以下配置项需要重启服务后生效: {", ".join(pending)}')
+
+config.add_listener(apply_config_change)
+
+# 运行指标，由 /metrics 导出；热路径上的计数器按线程分片，更新时不加锁
+RESULT_DELIVERY_SECONDS = metrics_registry.histogram(
+    'speech_result_delivery_seconds', '识别结果从回调产生到投递给客户端的延迟')
+TTS_CHUNKS_RECEIVED = metrics_registry.counter('speech_tts_chunks_received_total', '从合成服务收到的音频块数')
+TTS_FIRST_AUDIO_SECONDS = metrics_registry.histogram(
+    'speech_tts_first_audio_seconds', 'TTS会话从第一次发送文本到收到第一块音频的延迟')
+TTS_SESSION_START_SECONDS = metrics_registry.histogram('speech_tts_session_start_seconds', 'TTS会话创建耗时')
+TTS_REBUILDS = metrics_registry.counter(
+    'speech_tts_synthesizer_rebuilds_total', '因合成器未启动（has not been started）而重建的次数')
+metrics_registry.counter_func('speech_results_enqueued_total', '放入结果缓冲区的识别结果数',
+                              lambda: result_store.stats()['published'])
+metrics_registry.counter_func('speech_results_drained_total', '通过轮询接口取走的识别结果数',
+                              lambda: result_store.stats()['drained'])
+metrics_registry.counter_func('speech_tts_frames_played_total', '本地播放引擎写入声卡的音频帧数',
+                              lambda: playback_engine.frames_written)
+metrics_registry.gauge_func('speech_active_sessions', '进行中的会话数', lambda: {
+    'asr': recognition_manager.active_count(),
+    'tts': sum(1 for callback in list(tts_callbacks.values()) if not callback.done_event.is_set()),
+}, label='kind')
+metrics_registry.gauge_func('speech_results_queue_depth', '结果缓冲区中保留的识别结果数',
+                            lambda: result_store.stats()['retained'])
+metrics_registry.gauge_func('speech_tts_sessions', 'tts_sessions 中登记的TTS会话数', lambda: len(tts_sessions))
+metrics_registry.counter_func('speech_tts_sessions_closed_total', '已关闭的TTS会话数',
+                              lambda: tts_registry.stats()['closed'], label='reason')
+metrics_registry.gauge_func('speech_tts_finisher_pending', '等待关闭的TTS合成器数',
+                            lambda: tts_finisher.stats()['pending'])
 
 # 启动识别会话
 @app.route('/api/speech/start', methods=['POST'])
 def start_recognition():
-    global recognition, is_recording, current_session_id, processing_thread, stop_thread
-    
-    if is_recording:
-        return jsonify({'status': 'error', 'message': '已有一个识别会话在进行中'}), 400
-    
     try:
-        # 清空队列
-        while not results_queue.empty():
-            results_queue.get()
-            
-        # 重置停止标志
-        stop_thread.clear()
-        
         # 从请求中获取会话ID，如果没有则生成一个
         data = request.get_json(silent=True) or {}
         session_id = data.get('session_id', str(time.time()))
-        current_session_id = session_id
-        
-        # 初始化DashScope API密钥
-        init_dashscope_api_key()
-        
-        # 创建回调实例
-        callback = ParaformerCallback(session_id)
-        
-        # 创建识别实例
-        recognition = Recognition(
-            model='paraformer-realtime-v2',  # 推荐的实时识别模型
-            format='pcm',  # 音频格式
-            sample_rate=RATE,  # 采样率
-            semantic_punctuation_enabled=True,  # 启用语义断句
-            callback=callback
-        )
         
-        # 启动识别
-        recognition.start()
+        # 音频来源参数: source=microphone|stream|file, microphone模式可指定device, file模式下还有file_path/speed/loop
+        # （file_path 为回放目录 SPEECH_REPLAY_DIR 中的文件）
+        source_options = {
+            key: data[key] for key in ('source', 'device', 'file_path', 'speed', 'loop') if key in data
+        }
         
-        # 启动音频处理线程 (如果尚未启动)
-        if processing_thread is None or not processing_thread.is_alive():
-            processing_thread = threading.Thread(target=audio_processing)
-            processing_thread.daemon = True
-            processing_thread.start()
+        # 清空该会话ID之前残留的结果
+        result_store.reset(session_id)
         
-        # 设置录音标志
-        is_recording = True
+        recognition_manager.start_session(session_id, source_options, data.get('vad'))
         
-        logger.info(f'已启动语音识别会话: {session_id}')
+        logger.info(f'已启动语音识别会话: {session_id}, 当前会话数: {recognition_manager.active_count()}')
         
         return jsonify({
             'status': 'success',
             'message': '语音识别会话已启动',
             'session_id': session_id
         })
+    except SessionExistsError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except SessionLimitError as e:
+        logger.warning(f'拒绝启动识别会话: {e}')
+        return jsonify({'status': 'error', 'message': str(e)}), 429
+    except (AudioSourceError, ValueError) as e:
+        logger.warning(f'创建音频来源失败: {e}')
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         logger.error(f'启动识别会话失败: {e}', exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -448,112 +852,285 @@ def start_recognition():
 # 停止识别会话
 @app.route('/api/speech/stop', methods=['POST'])
 def stop_recognition():
-    global recognition, is_recording, current_session_id
+    data = request.get_json(silent=True) or {}
+    # 未携带会话ID时停止最近启动的会话
+    session_id = data.get('session_id') or recognition_manager.latest_session_id()
     
-    if not is_recording:
-        logger.warning('尝试停止不存在的识别会话')
+    if not session_id or recognition_manager.get(session_id) is None:
+        logger.warning(f'尝试停止不存在的识别会话: {session_id}')
         return jsonify({'status': 'error', 'message': '没有正在进行的识别会话'}), 400
     
     try:
-        logger.info(f'停止识别会话: {current_session_id}')
+        logger.info(f'停止识别会话: {session_id}')
         
-        # 先设置标志，防止再接收新的音频数据
-        is_recording = False
+        recognition_manager.stop_session(session_id)
         
-        # 停止识别
-        if recognition:
-            try:
-                logger.debug('调用recognition.stop()停止识别')
-                recognition.stop()
-                logger.debug('recognition.stop()成功')
-            except Exception as e:
-                logger.error(f'调用recognition.stop()时出错: {e}', exc_info=True)
-            finally:
-                recognition = None
-        else:
-            logger.warning('识别对象为空，无需停止')
-        
-        logger.info(f'已停止语音识别会话: {current_session_id}')
+        logger.info(f'已停止语音识别会话: {session_id}')
         
         return jsonify({
             'status': 'success',
             'message': '语音识别会话已停止',
-            'session_id': current_session_id
+            'session_id': session_id
         })
     except Exception as e:
         logger.error(f'停止识别会话失败: {e}', exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# 上传识别音频（source=stream 的会话）
+# 请求体为16kHz单声道16位PCM，可使用分块传输持续上传；end=1 表示音频结束
+@app.route('/api/speech/audio/<session_id>', methods=['POST'])
+def upload_audio(session_id):
+    session = recognition_manager.get(session_id)
+    if session is None or not session.is_active:
+        return jsonify({'status': 'error', 'message': '识别会话不存在或已结束'}), 404
+    
+    source = session.audio_source
+    if not isinstance(source, PushAudioSource):
+        return jsonify({'status': 'error', 'message': '该会话不接受上传音频'}), 400
+    
+    received = 0
+    try:
+        while True:
+            chunk = request.stream.read(UPLOAD_READ_SIZE)
+            if not chunk:
+                break
+            source.push(chunk)
+            received += len(chunk)
+        
+        if request.args.get('end') in ('1', 'true'):
+            source.end()
+            logger.info(f'会话 {session_id} 的音频上传已结束')
+        
+        return jsonify({'status': 'success', 'session_id': session_id, 'received': received})
+    except AudioSourceError as e:
+        logger.warning(f'接收上传音频失败: {e}')
+        return jsonify({'status': 'error', 'message': str(e), 'received': received}), 409
+    except Exception as e:
+        logger.error(f'接收上传音频失败: {e}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e), 'received': received}), 500
+
+# 列出输入设备（缓存的设备列表，refresh=1 时重新枚举）
+@app.route('/api/speech/devices', methods=['GET'])
+def list_audio_devices():
+    try:
+        devices = list_input_devices(refresh=request.args.get('refresh') in ('1', 'true'))
+        return jsonify({'status': 'success', 'devices': devices, 'selected': selected_input_device})
+    except Exception as e:
+        logger.error(f'枚举输入设备失败: {e}')
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# 选择麦克风会话默认使用的输入设备，index 为空时使用系统默认设备
+@app.route('/api/speech/devices', methods=['POST'])
+def select_audio_device():
+    global selected_input_device
+    data = request.get_json(silent=True) or {}
+    index = data.get('index')
+    try:
+        device = find_input_device(int(index)) if index is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': '设备索引必须是整数'}), 400
+    except AudioSourceError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 404
+    except Exception as e:
+        logger.error(f'选择输入设备失败: {e}')
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    selected_input_device = device['index'] if device is not None else None
+    logger.info(f'已选择输入设备: {device["name"] if device else "系统默认"}')
+    return jsonify({'status': 'success', 'selected': selected_input_device, 'device': device})
+
+# 列出识别会话
+@app.route('/api/speech/sessions', methods=['GET'])
+def list_recognition_sessions():
+    return jsonify({
+        'status': 'success',
+        'max_sessions': recognition_manager.max_sessions,
+        'sessions': recognition_manager.list_sessions()
+    })
+
 # 获取识别结果
 @app.route('/api/speech/results', methods=['GET'])
 def get_results():
-    results = []
     try:
         # 获取请求中的会话ID
         session_id = request.args.get('session_id', None)
+        # 可选的游标：指定时只读取该序号之后的结果，不影响默认的轮询进度
+        after = request.args.get('after', None)
+        # delta=1 时文本结果以增量返回（prefix + delta，见 encode_delta）；
+        # 不带游标的轮询相对于上次轮询取走的文本，带游标时只在本次返回的结果之间编码
+        delta = request.args.get('delta') in ('1', 'true')
         
         if session_id:
-            logger.debug(f'获取会话ID: {session_id} 的识别结果')
+            logger.debug('获取会话ID: %s 的识别结果', session_id)
         else:
             logger.debug('未提供会话ID，返回所有结果')
         
-        # 获取所有可用的结果
-        while not results_queue.empty():
-            result = results_queue.get(False)
-            # 如果提供了会话ID，只返回匹配的结果
-            if session_id is None or ('session_id' in result and result['session_id'] == session_id):
-                results.append(result)
-            else:
-                # 不匹配的结果放回队列
-                results_queue.put(result)
+        if after is not None and session_id:
+            items = result_store.read(session_id, int(after))
+            if delta:
+                items = encode_deltas(items, {})
+        else:
+            items = result_store.drain(session_id, delta=delta)
+        results = [result for _, result in items]
+        cursor = items[-1][0] if items else (int(after) if after is not None else None)
+        observe_delivery(results)
             
-        logger.debug(f'已返回识别结果: {len(results)} 条')
-        return jsonify({'status': 'success', 'results': results})
+        logger.debug('已返回识别结果: %d 条', len(results))
+        return jsonify({'status': 'success', 'results': results, 'cursor': cursor})
     except Exception as e:
         logger.error(f'获取识别结果失败: {e}')
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# 以Server-Sent Events推送识别结果
+@app.route('/api/speech/stream', methods=['GET'])
+def stream_results():
+    session_id = request.args.get('session_id')
+    if not session_id:
+        return jsonify({'status': 'error', 'message': '会话ID不能为空'}), 400
+    
+    # 浏览器重连时通过Last-Event-ID头携带最后收到的事件ID
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        last_event_id = int(last_event_id)
+        heartbeat = float(request.args.get('heartbeat', SSE_HEARTBEAT_INTERVAL))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '参数格式错误'}), 400
+    heartbeat = max(0.1, heartbeat)
+    # delta=1 时文本结果以增量推送，重连后的第一条为完整文本（prefix为0）
+    delta = request.args.get('delta') in ('1', 'true')
+    
+    logger.info(f'SSE订阅识别结果: 会话={session_id}, 起始事件ID={last_event_id}')
+    
+    def generate():
+        cursor = last_event_id
+        delta_state = {}
+        yield f'retry: {SSE_RETRY_MS}\n\n'
+        try:
+            while not stop_thread.is_set():
+                events = result_store.wait_for(session_id, cursor, timeout=heartbeat)
+                if not events:
+                    yield format_sse({'type': 'heartbeat', 'time': time.time()}, event='heartbeat')
+                    continue
+                for event_id, result in events:
+                    cursor = event_id
+                    yield format_sse(encode_delta(result, delta_state) if delta else result, event_id=event_id)
+                observe_delivery([result for _, result in events])
+                # 识别完成或出错后结束推送
+                if events[-1][1].get('type') in ('complete', 'error'):
+                    break
+        finally:
+            logger.info(f'SSE订阅已结束: 会话={session_id}, 最后事件ID={cursor}')
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+# 查询识别文本记录
+# 参数: session_id 会话ID, from/to 句子开始时间的范围（Unix时间戳，秒）, q 文本子串, limit 返回条数；
+# 结果按时间先后排列，more 为True表示还有更多匹配的记录（可用最后一条的时间作为下次的 from）
+@app.route('/api/transcripts', methods=['GET'])
+def query_transcripts():
+    try:
+        since = request.args.get('from')
+        until = request.args.get('to')
+        since = float(since) if since else None
+        until = float(until) if until else None
+        limit = min(int(request.args.get('limit', 100)), TRANSCRIPT_QUERY_MAX_LIMIT)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '参数格式错误'}), 400
+    try:
+        results, more = transcript_store.query(
+            session_id=request.args.get('session_id') or None,
+            since=since,
+            until=until,
+            text=request.args.get('q') or None,
+            limit=limit
+        )
+        return jsonify({'status': 'success', 'results': results, 'more': more})
+    except Exception as e:
+        logger.error(f'查询识别文本记录失败: {e}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# 当前配置（不包含密钥），reload=1 时立即检查配置文件
+@app.route('/api/config', methods=['GET'])
+def get_config():
+    changed = config.reload() if request.args.get('reload') in ('1', 'true') else []
+    return jsonify({'status': 'success', 'changed': changed, 'config': config.info()})
+
+# Prometheus格式的运行指标
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+# 语音服务运行统计
+@app.route('/api/speech/stats', methods=['GET'])
+def get_speech_stats():
+    return jsonify({
+        'status': 'success',
+        'results': result_store.stats(),
+        'vad': vad_totals.snapshot(),
+        'transcripts': transcript_store.stats(),
+        'logging': log_pipeline.stats()
+    })
+
 # 添加TTS相关的API端点
 @app.route('/api/tts/start', methods=['POST'])
 def start_tts():
     try:
         data = request.get_json(silent=True) or {}
-        voice = data.get('voice', 'longxiaochun')  # 默认音色
+        voice = data.get('voice') or config.settings.tts_voice  # 默认音色
+        # 为False时不在服务器上播放，客户端通过 /api/tts/audio/<session_id> 获取音频
+        local_playback = bool(data.get('playback', TTS_LOCAL_PLAYBACK))
+        # 为True时在服务端按句子合并文本，客户端可以按LLM输出速度推送小片段
+        segment = bool(data.get('segment', TTS_SEGMENT_ENABLED))
+        # 输出格式 format/sample_rate/bitrate，见 /api/tts/formats
+        try:
+            audio_format = negotiate_tts_format(data, local_playback)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         
         # 生成会话ID
         session_id = str(uuid.uuid4())
-        
-        # 初始化DashScope API密钥
-        init_dashscope_api_key()
+        started = time.perf_counter()
         
         # 创建回调实例
-        callback = TtsCallback(session_id)
+        callback = TtsCallback(session_id, local_playback=local_playback, audio_format=audio_format)
         # 保存音色信息便于会话重建
         callback.voice = voice
+        callback.cache = get_tts_cache()
         
-        logger.info(f'创建TTS合成器: 音色={voice}')
+        logger.info(f'创建TTS合成器: 音色={voice}, 格式={audio_format}')
         
-        # 创建TTS合成器
+        # 取得TTS合成器，优先使用已预热的连接
         try:
-            synthesizer = SpeechSynthesizer(
-                model="cosyvoice-v1",
-                voice=voice,
-                format=AudioFormat.WAV_16000HZ_MONO_16BIT,
-                callback=callback
-            )
+            synthesizer, pooled = acquire_synthesizer(voice, callback)
+            if segment:
+                callback.chunker = create_text_chunker(synthesizer, callback)
+            setup_ms = (time.perf_counter() - started) * 1000
+            TTS_SESSION_START_SECONDS.observe(setup_ms / 1000)
             
-            # 存储会话
-            tts_sessions[session_id] = synthesizer
-            tts_callbacks[session_id] = callback
+            # 登记会话，超过上限时关闭最久未活动的会话
+            tts_registry.register(session_id, synthesizer, callback)
+            register_tts_audio_buffer(session_id, callback.audio_buffer)
             
             # 不等待WebSocket连接建立，立即返回
             # 我们在合成时会处理连接状态
-            logger.info(f'已创建TTS会话: {session_id}, 音色: {voice}')
+            logger.info(f'已创建TTS会话: {session_id}, 音色: {voice}, 预热连接: {pooled}, 耗时 {setup_ms:.1f}ms')
             
             return jsonify({
                 'status': 'success',
                 'message': 'TTS会话已创建',
-                'session_id': session_id
+                'session_id': session_id,
+                'playback': local_playback,
+                'audio_url': f'/api/tts/audio/{session_id}',
+                'format': audio_format.as_dict(),
+                'pooled': pooled,
+                'segment': segment,
+                'setup_ms': setup_ms
             })
         except Exception as inner_e:
             logger.error(f'创建TTS合成器时出错: {inner_e}', exc_info=True)
@@ -573,38 +1150,85 @@ def synthesize_text():
         if not session_id:
             return jsonify({'status': 'error', 'message': '会话ID不能为空'}), 400
             
-        if session_id not in tts_sessions:
+        if not tts_registry.touch(session_id):
             logger.warning(f'尝试在不存在的会话 {session_id} 上合成文本')
             return jsonify({'status': 'error', 'message': '会话不存在或已关闭'}), 404
             
         if not text and not is_complete:
             return jsonify({'status': 'error', 'message': '文本不能为空'}), 400
         
-        synthesizer = tts_sessions[session_id]
+        synthesizer = tts_sessions.get(session_id)
         callback = tts_callbacks.get(session_id)
+        if synthesizer is None:
+            return jsonify({'status': 'error', 'message': '会话不存在或已关闭'}), 404
         
         # 记录会话状态以进行调试
-        logger.debug(f'合成前会话状态: 会话ID={session_id}, 合成器存在={synthesizer is not None}, 回调存在={callback is not None}, WebSocket连接状态={callback.is_initialized if callback else "无回调"}')
+        logger.debug('合成前会话状态: 会话ID=%s, 合成器存在=%s, 回调存在=%s, WebSocket连接状态=%s',
+                     session_id, synthesizer is not None, callback is not None,
+                     callback.is_initialized if callback else '无回调')
+        
+        # 一次性提交的完整文本先查缓存，命中时无需连接合成服务。之前只发送过空白的也算一次性提交
+        # （前端先发送一个空格建立连接，再发送完整文本），缓存键按规范化后的文本计算，与写入时一致
+        if callback is not None and callback.cache is not None:
+            if is_complete and not ''.join(callback.text_parts).strip() and cache_replayable(callback):
+                key = make_cache_key(TTS_MODEL, callback.voice, callback.audio_format,
+                                     ''.join(callback.text_parts) + text)
+                path = callback.cache.lookup(key)
+                if path is not None:
+                    callback.cache = None
+                    callback.text_parts.append(text)
+                    # 丢弃分段器中等待发送的空白，不再为它建立连接
+                    if callback.chunker is not None:
+                        callback.chunker.close()
+                    threading.Thread(target=replay_cached_audio, args=(callback, path), daemon=True).start()
+                    return jsonify({
+                        'status': 'success',
+                        'message': '已从缓存播放',
+                        'cached': True
+                    })
+            callback.text_parts.append(text)
         
-        # 简化的连接检查 - 等待短暂时间让WebSocket连接建立
-        time.sleep(0.1)
+        # 同一会话的请求依次处理：第一次发送文本时会建立连接，后续请求等待连接就绪后再发送
+        call_lock = callback.call_lock if callback is not None else threading.Lock()
+        if not call_lock.acquire(timeout=TTS_READY_TIMEOUT):
+            logger.warning(f'TTS会话 {session_id} 连接未准备就绪')
+            return jsonify({'status': 'error', 'message': 'TTS连接未准备就绪，请稍后重试'}), 503
         
+        chunker = callback.chunker if callback is not None else None
         try:
-            if text:
+            if chunker is not None:
+                # 交给分段器：凑够一段时在本线程发送，其余留在缓冲区由后续请求或定时器发送
+                logger.debug('TTS文本片段: %s', text[:30] + ('...' if len(text) > 30 else ''))
+                if is_complete:
+                    chunker.flush(text)
+                else:
+                    chunker.feed(text)
+            elif text:
                 # 发送文本进行合成
                 logger.info(f'发送文本到TTS: {text[:30]}{"..." if len(text) > 30 else ""}')
+                if callback is not None:
+                    if not callback.ready_event.is_set():
+                        callback.connecting = True
+                    callback.mark_text_sent()
                 synthesizer.streaming_call(text)
-                logger.debug(f'已调用streaming_call, 文本长度: {len(text)}')
+                logger.debug('已调用streaming_call, 文本长度: %d', len(text))
             
             if is_complete:
-                # 完成流式合成
+                # 完成流式合成，阻塞到服务端返回完成事件
                 logger.info(f'完成TTS会话: {session_id}')
                 synthesizer.streaming_complete()
                 logger.debug('已调用streaming_complete')
+                # SDK先唤醒streaming_complete再调用on_complete，等回调处理完再报告完成状态
+                if callback is not None:
+                    callback.done_event.wait(TTS_READY_TIMEOUT)
                 
             return jsonify({
                 'status': 'success',
-                'message': '已发送文本进行合成并直接播放' if text else '已完成合成'
+                'message': '已发送文本进行合成并直接播放' if text else '已完成合成',
+                'cached': False,
+                'done': callback.done_event.is_set() if callback is not None else is_complete,
+                'error': callback.error if callback is not None else None,
+                'buffered_chars': chunker.buffered if chunker is not None else 0
             })
         except Exception as inner_e:
             logger.error(f'合成过程中出错: {inner_e}', exc_info=True)
@@ -612,48 +1236,61 @@ def synthesize_text():
             # 检查是否是WebSocket尚未准备好的错误
             if 'speech synthesizer has not been started' in str(inner_e):
                 logger.warning('检测到WebSocket尚未启动的错误，尝试重建会话')
+                TTS_REBUILDS.inc()
                 
                 # 尝试重新创建会话
                 try:
                     logger.info(f'尝试重新创建TTS会话: {session_id}')
                     
                     # 获取会话参数 - 尝试从原有回调中获取音色
-                    voice = 'longxiaochun'  # 默认音色
-                    if session_id in tts_callbacks and hasattr(tts_callbacks[session_id], 'voice'):
-                        voice = tts_callbacks[session_id].voice
+                    voice = config.settings.tts_voice  # 默认音色
+                    old_callback = tts_callbacks.get(session_id)
+                    if old_callback is not None and hasattr(old_callback, 'voice'):
+                        voice = old_callback.voice
                     
-                    # 先清理可能的旧会话
-                    if session_id in tts_callbacks:
-                        old_callback = tts_callbacks[session_id]
-                        if hasattr(old_callback, 'on_close'):
-                            try:
-                                old_callback.on_close()
-                            except:
-                                pass
-                    
-                    # 创建新的回调实例
-                    new_callback = TtsCallback(session_id)
+                    # 创建新的回调实例，沿用原有的播放设置、输出格式和音频缓冲，已连接的音频流不中断
+                    new_callback = TtsCallback(session_id, audio_format=getattr(old_callback, 'audio_format', None))
                     new_callback.voice = voice
+                    if old_callback is not None:
+                        new_callback.local_playback = old_callback.local_playback
+                        # 编码器的状态（WAV头、MP3帧）与已输出的数据连续
+                        new_callback.encoder = old_callback.encoder
+                        new_callback.audio_buffer = old_callback.audio_buffer
+                        old_callback.audio_buffer = TtsAudioBuffer(0)
                     
-                    # 创建新的合成器
-                    new_synthesizer = SpeechSynthesizer(
-                        model="cosyvoice-v1",
-                        voice=voice,
-                        format=AudioFormat.WAV_16000HZ_MONO_16BIT,
-                        callback=new_callback
-                    )
+                    # 先清理旧会话：丢弃旧分段器中尚未发送的文本（其定时器不会再发给旧合成器），
+                    # 停止旧的播放通道，旧合成器交给 tts_finisher 关闭
+                    old_synthesizer = tts_sessions.get(session_id)
+                    if old_callback is not None:
+                        if old_callback.chunker is not None:
+                            old_callback.chunker.close()
+                        old_callback.stop_playback()
+                        try:
+                            old_callback.on_close()
+                        except:
+                            pass
+                    if old_synthesizer is not None:
+                        tts_finisher.submit(old_synthesizer, session_id)
+                    # 重建前发送的文本已丢失，只缓存本次请求的文本；沿用原会话的编码器时
+                    # 输出不是完整的音频文件（缺少WAV头或从MP3流中间开始），不缓存
+                    if old_callback is None:
+                        new_callback.cache = get_tts_cache()
+                    new_callback.text_parts = [text]
                     
-                    # 等待WebSocket连接建立
-                    logger.info(f'等待新的WebSocket连接建立: {session_id}')
-                    time.sleep(0.5)
+                    # 创建新的合成器，未预热时由第一次streaming_call建立连接并等待任务启动
+                    new_synthesizer, pooled = acquire_synthesizer(voice, new_callback)
+                    if old_callback is not None and old_callback.chunker is not None:
+                        new_callback.chunker = create_text_chunker(new_synthesizer, new_callback)
                     
                     # 保存新的会话
-                    tts_sessions[session_id] = new_synthesizer
-                    tts_callbacks[session_id] = new_callback
+                    tts_registry.register(session_id, new_synthesizer, new_callback)
                     
-                    # 直接尝试发送文本，不检查WebSocket状态
+                    # 发送文本
                     if text:
                         logger.info(f'重新发送文本到TTS: {text[:30]}{"..." if len(text) > 30 else ""}')
+                        if not new_callback.ready_event.is_set():
+                            new_callback.connecting = True
+                        new_callback.mark_text_sent()
                         new_synthesizer.streaming_call(text)
                     
                     if is_complete:
@@ -662,13 +1299,18 @@ def synthesize_text():
                     
                     return jsonify({
                         'status': 'success',
-                        'message': '会话已重建并发送文本进行合成'
+                        'message': '会话已重建并发送文本进行合成',
+                        'cached': False,
+                        'done': new_callback.done_event.is_set(),
+                        'error': new_callback.error
                     })
                 except Exception as retry_e:
                     logger.error(f'重建会话失败: {retry_e}', exc_info=True)
                     return jsonify({'status': 'error', 'message': f'合成失败且重建会话失败: {str(retry_e)}'}), 500
             else:
                 return jsonify({'status': 'error', 'message': f'合成失败: {str(inner_e)}'}), 500
+        finally:
+            call_lock.release()
     except Exception as e:
         logger.error(f'合成文本失败: {e}', exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -684,59 +1326,11 @@ def stop_tts_session():
             
         logger.info(f'准备停止TTS会话: {session_id}')
         
-        # 检查回调对象是否存在
-        if session_id in tts_callbacks:
-            try:
-                callback = tts_callbacks[session_id]
-                logger.info(f'找到会话 {session_id} 的回调对象')
-                
-                # 先关闭音频流
-                try:
-                    if callback._stream:
-                        logger.info(f'已关闭音频流: {session_id}')
-                        callback._stream.stop_stream()
-                        callback._stream.close()
-                        callback._stream = None
-                except Exception as e:
-                    logger.warning(f'关闭音频流出错: {e}')
-                
-                # 再终止播放器
-                try:
-                    if callback._player:
-                        logger.info(f'已终止音频播放器: {session_id}')
-                        callback._player.terminate()
-                        callback._player = None
-                except Exception as e:
-                    logger.warning(f'终止音频播放器出错: {e}')
-                
-                # 从回调字典中移除
-                del tts_callbacks[session_id]
-            except Exception as e:
-                logger.error(f'停止TTS回调出错: {e}', exc_info=True)
-        
-        # 检查合成器对象是否存在
-        if session_id in tts_sessions:
+        # 从登记表中移除并关闭，合成器由 tts_finisher 在后台关闭，防止阻塞
+        entry = tts_registry.pop(session_id)
+        if entry is not None:
             try:
-                synthesizer = tts_sessions[session_id]
-                logger.info(f'找到会话 {session_id} 的合成器对象')
-                
-                # 安全关闭合成器
-                try:
-                    if synthesizer:
-                        # 在新线程中执行finish操作，防止阻塞
-                        def safe_finish():
-                            try:
-                                synthesizer.finish()
-                                logger.info(f'已完成TTS合成任务: {session_id}')
-                            except Exception as e:
-                                logger.warning(f'完成TTS合成任务: {e}')
-                        
-                        threading.Thread(target=safe_finish).start()
-                except Exception as e:
-                    logger.warning(f'关闭TTS合成器出错: {e}')
-                
-                # 从会话字典中移除
-                del tts_sessions[session_id]
+                close_tts_session(session_id, entry, CLOSE_STOPPED)
             except Exception as e:
                 logger.error(f'停止TTS会话出错: {e}', exc_info=True)
         
@@ -745,6 +1339,163 @@ def stop_tts_session():
         logger.error(f'处理停止TTS会话请求出错: {e}', exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# 批量合成：提交一组文本，立即返回任务ID，通过 /api/tts/batch/<job_id> 查询进度
+@app.route('/api/tts/batch', methods=['POST'])
+def submit_tts_batch():
+    try:
+        data = request.get_json(silent=True) or {}
+        items = data.get('items')
+        if not isinstance(items, list):
+            return jsonify({'status': 'error', 'message': 'items必须是列表'}), 400
+        voice = data.get('voice') or config.settings.tts_voice  # 未指定音色的条目使用该音色
+        try:
+            audio_format = negotiate_tts_format(data)
+            job = batch_manager.submit(items, get_user_storage_path(), voice, audio_format)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        return jsonify({
+            'status': 'success',
+            'message': '批量任务已提交',
+            'job_id': job.job_id,
+            'total': len(job.items),
+            'output_dir': job.output_dir,
+            'format': audio_format.as_dict(),
+            'status_url': f'/api/tts/batch/{job.job_id}'
+        }), 202
+    except Exception as e:
+        logger.error(f'提交TTS批量任务失败: {e}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route('/api/tts/batch', methods=['GET'])
+def list_tts_batches():
+    return jsonify({'status': 'success', 'jobs': batch_manager.list_jobs(), 'stats': batch_manager.stats()})
+
+@app.route('/api/tts/batch/<job_id>', methods=['GET'])
+def get_tts_batch(job_id):
+    job = batch_manager.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+    return jsonify({'status': 'success', 'job': job.info()})
+
+@app.route('/api/tts/batch/<job_id>/cancel', methods=['POST'])
+def cancel_tts_batch(job_id):
+    job = batch_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+    logger.info(f'已取消TTS批量任务: {job_id}')
+    return jsonify({'status': 'success', 'job': job.info(include_items=False)})
+
+# 读取TTS会话的音频
+# 按字节游标拉取：?cursor=N 返回该位置之后已合成的音频，响应头 X-Audio-Cursor 为下次请求的游标；
+# 带 stream=1 时以分块响应持续输出，直到合成结束。响应类型为会话创建时协商的格式，
+# WAV会话带 format=pcm 时跳过WAV头只返回裸PCM。
+# 两者都不带时保持前端轮询使用的JSON状态：有音频后 file_url 指向该会话的音频流
+@app.route('/api/tts/audio/<session_id>', methods=['GET'])
+def get_tts_audio(session_id):
+    tts_registry.touch(session_id)
+    with tts_audio_lock:
+        audio_buffer = tts_audio_buffers.get(session_id)
+    if audio_buffer is None:
+        return jsonify({'status': 'error', 'message': '会话不存在或已关闭'}), 404
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        max_bytes = int(request.args.get('max_bytes', 0)) or None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '参数格式错误'}), 400
+    try:
+        mimetype, raw_pcm = tts_audio_response_format(audio_buffer, request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    if request.args.get('stream') in ('1', 'true'):
+        logger.info(f'开始输出TTS音频流: 会话={session_id}, 游标={cursor}, 格式={mimetype}')
+        
+        def generate():
+            sent = 0
+            try:
+                for chunk in audio_buffer.stream(cursor, TTS_STREAM_WAIT_TIMEOUT,
+                                                 should_stop=stop_thread.is_set, skip_header=raw_pcm):
+                    sent += len(chunk)
+                    yield chunk
+            finally:
+                logger.info(f'TTS音频流已结束: 会话={session_id}, 已发送 {sent} 字节')
+        
+        return Response(
+            stream_with_context(generate()),
+            mimetype=mimetype,
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+    
+    if 'cursor' not in request.args:
+        if audio_buffer.error:
+            return jsonify({'status': 'error', 'message': audio_buffer.error}), 500
+        if audio_buffer.size == 0:
+            if audio_buffer.done:
+                return jsonify({'status': 'success', 'message': '合成已完成'})
+            return jsonify({'status': 'success', 'message': '暂无音频数据'})
+        file_url = f'/api/tts/audio/{session_id}?stream=1'
+        if raw_pcm:
+            file_url += '&format=pcm'
+        return jsonify({
+            'status': 'success',
+            'message': '合成已完成' if audio_buffer.done else '音频合成中',
+            'file_url': file_url,
+            'bytes': audio_buffer.size
+        })
+    
+    if raw_pcm:
+        cursor = audio_buffer.pcm_cursor(cursor)
+        if cursor is None:
+            return jsonify({'status': 'success', 'message': '暂无音频数据', 'cursor': 0})
+    data, next_cursor = audio_buffer.read(cursor, max_bytes)
+    if not data:
+        if audio_buffer.error:
+            return jsonify({'status': 'error', 'message': audio_buffer.error, 'cursor': next_cursor}), 500
+        if audio_buffer.at_end(next_cursor):
+            return jsonify({'status': 'success', 'message': '合成已完成', 'cursor': next_cursor})
+        return jsonify({'status': 'success', 'message': '暂无音频数据', 'cursor': next_cursor})
+    return Response(data, mimetype=mimetype, headers={
+        'Cache-Control': 'no-cache',
+        'X-Audio-Cursor': str(next_cursor),
+        'X-Audio-Complete': '1' if audio_buffer.at_end(next_cursor) else '0',
+        'Access-Control-Expose-Headers': 'X-Audio-Cursor, X-Audio-Complete'
+    })
+
+# TTS缓存统计
+@app.route('/api/tts/cache/stats', methods=['GET'])
+def get_tts_cache_stats():
+    try:
+        cache = get_tts_cache()
+        if cache is None:
+            return jsonify({'status': 'success', 'enabled': False})
+        return jsonify({'status': 'success', 'enabled': True, 'cache': cache.stats()})
+    except Exception as e:
+        logger.error(f'获取TTS缓存统计失败: {e}', exc_info=True)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+# 本地播放统计
+@app.route('/api/tts/playback/stats', methods=['GET'])
+def get_tts_playback_stats():
+    return jsonify({'status': 'success', 'playback': playback_engine.stats()})
+
+# TTS合成器池统计
+@app.route('/api/tts/pool/stats', methods=['GET'])
+def get_tts_pool_stats():
+    return jsonify({'status': 'success', 'enabled': TTS_POOL_SIZE > 0, 'pool': tts_pool.stats()})
+
+# 列出TTS会话及空闲时间
+@app.route('/api/tts/sessions', methods=['GET'])
+def list_tts_sessions():
+    return jsonify({
+        'status': 'success',
+        'registry': tts_registry.stats(),
+        'finisher': tts_finisher.stats(),
+        'sessions': tts_registry.list_sessions()
+    })
+
 # 获取TTS可用音色列表
 @app.route('/api/tts/voices', methods=['GET'])
 def get_voices():
@@ -765,6 +1516,56 @@ def get_voices():
         'voices': voices
     })
 
+# 可选的TTS输出格式，创建会话和批量任务时通过 format/sample_rate/bitrate 指定
+@app.route('/api/tts/formats', methods=['GET'])
+def get_tts_formats():
+    settings = config.settings
+    try:
+        default = negotiate_tts_format({}).as_dict()
+    except ValueError as e:
+        default = {'error': str(e)}
+    return jsonify({
+        'status': 'success',
+        'formats': list(CODECS),
+        'sample_rates': list(SAMPLE_RATES),
+        'mp3_bitrate': settings.tts_mp3_bitrate,
+        # 未安装 lameenc 时MP3只能使用合成服务自带的码率，且不能在服务器上播放
+        'mp3_encoder': load_mp3_encoder() is not None,
+        'default': default
+    })
+
+# 存活检查：不访问SDK和声卡，进程开始监听后立即可用
+@app.route('/api/ping', methods=['GET'])
+def ping():
+    return jsonify({'status': 'success', 'message': 'pong'})
+
+# 就绪检查：预热结束前返回503，phases 为各预热阶段的状态和耗时
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    # wait: 预热未结束时最多等待的秒数
+    try:
+        wait = min(float(request.args.get('wait', 0) or 0), READY_MAX_WAIT)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '参数格式错误'}), 400
+    if wait > 0:
+        warmup.wait(wait)
+    body = warmup.status()
+    body['status'] = 'success' if body['ready'] else 'error'
+    if not body['ready']:
+        body['message'] = '语音服务正在启动' if body['state'] == 'starting' else '语音服务启动失败'
+    body['uptime'] = round(startup_profile.elapsed(), 3)
+    body['marks'] = dict(startup_profile.marks)
+    return jsonify(body), 200 if body['ready'] else 503
+
+# 启动耗时记录：各模块的导入耗时和启动过程中的时间点
+@app.route('/api/startup', methods=['GET'])
+def startup_stats():
+    return jsonify({
+        'status': 'success',
+        'profile': startup_profile.as_dict(),
+        'warmup': warmup.status()
+    })
+
 # 测试端点
 @app.route('/api/speech/test', methods=['GET'])
 def test_endpoint():
@@ -782,15 +1583,35 @@ def home():
     return jsonify({
         'status': 'success',
         'message': '语音识别服务器正在运行',
+        'backend': speech_backend.info(),
         'endpoints': [
+            '/api/ping',
+            '/api/ready',
+            '/api/startup',
             '/api/speech/test',
             '/api/speech/start',
             '/api/speech/stop',
             '/api/speech/results',
+            '/api/speech/stream',
+            '/api/speech/stats',
+            '/api/speech/sessions',
+            '/api/speech/devices',
+            '/api/transcripts',
+            '/api/speech/audio/<session_id>',
+            '/metrics',
+            '/api/config',
             '/api/tts/start',
             '/api/tts/synthesize',
             '/api/tts/stop',
-            '/api/tts/voices'
+            '/api/tts/voices',
+            '/api/tts/formats',
+            '/api/tts/audio/<session_id>',
+            '/api/tts/cache/stats',
+            '/api/tts/pool/stats',
+            '/api/tts/sessions',
+            '/api/tts/playback/stats',
+            '/api/tts/batch',
+            '/api/tts/batch/<job_id>'
         ]
     })
 
@@ -804,35 +1625,51 @@ def check_tts_session():
         if not session_id:
             return jsonify({'status': 'error', 'message': '会话ID不能为空'}), 400
             
-        # 检查会话是否存在
-        if session_id in tts_sessions and session_id in tts_callbacks:
-            synthesizer = tts_sessions[session_id]
-            callback = tts_callbacks[session_id]
+        # wait: 等待合成结束的秒数（长轮询），默认不等待
+        try:
+            wait = min(float(data.get('wait', 0) or 0), TTS_STATUS_MAX_WAIT)
+        except (TypeError, ValueError):
+            return jsonify({'status': 'error', 'message': '参数格式错误'}), 400
             
+        # 检查会话是否存在
+        synthesizer = tts_sessions.get(session_id)
+        callback = tts_callbacks.get(session_id)
+        if tts_registry.touch(session_id) and synthesizer is not None and callback is not None:
             # 检查会话状态
             is_synthesizer_valid = synthesizer is not None
             is_callback_valid = callback is not None
+            
+            # 连接正在建立时等待其就绪，而不是固定等待一段时间
+            if is_synthesizer_valid and is_callback_valid:
+                callback.wait_ready(TTS_READY_TIMEOUT)
+                if wait > 0:
+                    callback.done_event.wait(wait)
             is_initialized = callback.is_initialized if callback else False
             is_ready = callback.is_ready if callback else False
+            state = callback.state() if callback else 'invalid'
             
-            logger.info(f'检查TTS会话状态: {session_id}, 合成器有效={is_synthesizer_valid}, 回调有效={is_callback_valid}, 已初始化={is_initialized}, 已就绪={is_ready}')
-            
-            # 如果会话存在但未初始化，尝试等待一小段时间
-            if is_synthesizer_valid and is_callback_valid and not is_initialized:
-                logger.info(f'会话 {session_id} 存在但未初始化，等待100ms')
-                time.sleep(0.1)
-                is_initialized = callback.is_initialized
-                is_ready = callback.is_ready
+            logger.info(f'检查TTS会话状态: {session_id}, 合成器有效={is_synthesizer_valid}, 回调有效={is_callback_valid}, 已初始化={is_initialized}, 已就绪={is_ready}, 状态={state}')
             
-            status = 'active' if is_synthesizer_valid and is_callback_valid else 'invalid'
+            # 已结束的会话不能再发送文本，客户端应创建新会话
+            if not (is_synthesizer_valid and is_callback_valid):
+                status = 'invalid'
+            elif state in ('completed', 'failed', 'closed'):
+                status = state
+            else:
+                status = 'active'
             
             return jsonify({
                 'status': status,
                 'session_id': session_id,
+                'state': state,
                 'is_synthesizer_valid': is_synthesizer_valid,
                 'is_callback_valid': is_callback_valid,
                 'is_initialized': is_initialized,
-                'is_ready': is_ready
+                'is_ready': is_ready,
+                'is_complete': callback.done_event.is_set() if callback else False,
+                'is_playing': callback.is_playing if callback else False,
+                'segmenter': callback.chunker.stats() if callback and callback.chunker else None,
+                'error': callback.error if callback else None
             })
         else:
             return jsonify({
@@ -848,13 +1685,92 @@ def check_tts_session():
 def cleanup():
     global stop_thread
     stop_thread.set()
+    result_store.wake_all()
+    recognition_manager.stop_all()
+    if tts_cache is not None:
+        tts_cache.flush()
+    transcript_store.close()
+    tts_registry.close()
+    tts_pool.close()
+    tts_finisher.shutdown()
+    batch_manager.shutdown()
+    playback_engine.close()
+    terminate_pyaudio()
     logger.info("服务器关闭，清理资源...")
+    log_pipeline.close()
 
-if __name__ == '__main__':
+# 后台预热的各阶段，服务开始监听后在后台线程中依次执行
+def warmup_speech_sdk():
+    # 导入识别/合成SDK并设置API密钥
+    speech_backend.load()
+    sdk_audio_format(AudioOutputFormat().source_format)
+    prepare_speech_backend()
+
+def warmup_audio_dsp():
+    # 导入numpy和采样率转换（VAD、麦克风格式转换和混音使用）
+    import numpy
+    import audio_resample
+
+def warmup_audio_device():
+    # 初始化PortAudio并缓存输入设备列表（没有声卡的机器上失败，不影响其他功能）
+    get_pyaudio()
+    list_input_devices()
+
+def warmup_tts_pool():
+    # 登记预热的TTS连接，由连接池的后台线程建立
+    if TTS_POOL_SIZE > 0:
+        try:
+            audio_format = negotiate_tts_format({}, TTS_LOCAL_PLAYBACK)
+        except ValueError as e:
+            logger.warning(f'默认TTS输出格式无效，按 {AudioOutputFormat()} 预热: {e}')
+            audio_format = AudioOutputFormat()
+        for voice in TTS_POOL_PRELOAD_VOICES:
+            tts_pool.preload(TTS_MODEL, voice, sdk_audio_format(audio_format.source_format))
+
+# 预热结束：停止记录导入耗时，把本次启动的耗时记录写入日志目录
+def finish_startup_profile():
+    startup_profile.stop()
+    logger.info(f'预热完成，启动后 {startup_profile.elapsed():.3f} 秒，'
+                f'模块导入共 {startup_profile.as_dict()["import_seconds"]:.3f} 秒')
+    if STARTUP_PROFILE_ENABLED:
+        path = startup_profile.save(LOG_DIR or os.path.join(get_user_storage_path(), 'logs'))
+        logger.info(f'启动耗时记录: {path}')
+
+warmup = WarmupTracker(startup_profile, on_finished=finish_startup_profile)
+warmup.add('speech_sdk', warmup_speech_sdk)
+warmup.add('audio_dsp', warmup_audio_dsp)
+warmup.add('audio_device', warmup_audio_device, required=False)
+warmup.add('tts_pool', warmup_tts_pool, required=False)
+
+# 服务器启动前的准备：日志文件和后台预热（同步和asyncio入口共用）
+def prepare_server():
+    if LOG_FILE_ENABLED:
+        try:
+            log_path = log_pipeline.add_file_sink(LOG_DIR or os.path.join(get_user_storage_path(), 'logs'),
+                                                  LOG_FILE_MAX_BYTES, LOG_FILE_BACKUP_COUNT)
+            logger.info(f'日志文件: {log_path}')
+        except Exception as e:
+            logger.warning(f'无法创建日志文件: {e}')
     logger.info('正在启动语音识别服务器...')
+    startup_profile.mark('prepared')
+    # 不等待预热：/api/ping 立即可用，/api/ready 返回预热进度
+    warmup.start()
+
+startup_profile.mark('initialized')
+
+if __name__ == '__main__':
+    if '--startup-profile' in sys.argv:
+        # 只执行启动和预热，输出耗时记录后退出，用于在构建之间对比冷启动时间
+        warmup.run()
+        print(json.dumps({'profile': startup_profile.as_dict(), 'warmup': warmup.status()},
+                         ensure_ascii=False, indent=2))
+        cleanup()
+        sys.exit(0)
+    prepare_server()
+    startup_profile.mark('serving')
     try:
         # 确保监听所有接口，而不仅是localhost
-        app.run(host='0.0.0.0', port=2047, debug=False, threaded=True)
+        app.run(host=settings.host, port=settings.port, debug=False, threaded=True)
     except Exception as e:
         logger.error(f'启动服务器失败: {e}')
     finally:
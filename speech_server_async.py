@@ -0,0 +1,590 @@
+# 语音服务的asyncio入口
+# 与 speech_server.py 提供相同的REST接口，另外为每个客户端提供一个WebSocket连接：
+# 上行为麦克风PCM（二进制帧）和控制消息（JSON文本帧），下行为识别结果（JSON）和合成音频（二进制PCM）。
+# 空闲的连接只占用一个协程，不占用线程，适合大量长时间保持打开的会话。
+#
+# 普通REST接口仍由 speech_server 中的Flask应用处理，在有界线程池中执行；
+# 长时间等待的接口（SSE结果推送、TTS音频流、状态长轮询）和WebSocket在事件循环中等待，
+# 识别/合成回调线程通过 loop.call_soon_threadsafe（事件循环的线程安全队列）唤醒等待的协程。
+#
+# 运行: python speech_server_async.py（需要 aiohttp，见 requirements.txt）
+from speech_startup import startup_profile  # 最先导入，记录之后的模块导入耗时
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web, WSMsgType
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response as WsgiResponse
+
+import speech_server as core
+from audio_sources import PushAudioSource, AudioSourceError
+from speech_results import format_sse, encode_delta
+
+logger = logging.getLogger('speech_server')
+
+ASYNC_WORKERS = int(os.getenv('SPEECH_ASYNC_WORKERS', '16'))  # 执行同步接口的线程数，限制阻塞调用占用的线程
+WS_HEARTBEAT = 30.0            # WebSocket ping间隔（秒），检测断开的客户端
+WS_MAX_MESSAGE_BYTES = 1024 * 1024  # 单条上行消息的大小上限
+WS_PUSH_TIMEOUT = 5.0          # 识别音频缓冲区满时等待的最长时间（秒），超时后丢弃该帧
+WS_PUSH_RETRY_INTERVAL = 0.02  # 缓冲区满时重试推入的间隔（秒）
+STATUS_FORWARD_WAIT = 0.5      # 状态长轮询在事件循环中等待后，转交同步接口时保留的等待时间
+
+# 不从WSGI响应复制的头，由aiohttp重新生成
+HOP_BY_HOP_HEADERS = {'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*'}
+
+
+class LoopNotifier:
+    """把其他线程中的事件转交给事件循环
+
+    协程用 watch(key) 登记一个 asyncio.Event，其他线程调用 notify(key) 时
+    通过 call_soon_threadsafe 在事件循环中把它置位。没有协程等待的key不会产生调度开销。
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._events = {}  # key -> asyncio.Event 集合，只在事件循环线程中修改
+
+    def watch(self, key):
+        event = asyncio.Event()
+        self._events.setdefault(key, set()).add(event)
+        return event
+
+    def unwatch(self, key, event):
+        events = self._events.get(key)
+        if events is not None:
+            events.discard(event)
+            if not events:
+                del self._events[key]
+
+    def notify(self, key):
+        # 先登记再读取数据的协程不会错过通知：登记之后产生的数据一定会触发唤醒
+        if key in self._events:
+            self.loop.call_soon_threadsafe(self._wake, key)
+
+    def _wake(self, key):
+        for event in self._events.get(key, ()):
+            event.set()
+
+
+async def wait_event(event, timeout):
+    """等待事件置位，返回是否在超时前置位"""
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def json_response(data, status=200):
+    return web.json_response(data, status=status, headers=CORS_HEADERS,
+                             dumps=lambda obj: json.dumps(obj, ensure_ascii=False))
+
+
+class AsyncSpeechServer:
+    def __init__(self, workers=ASYNC_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speech-async')
+        self.notifier = None
+        self.websockets = set()
+
+    # ---------- 调用同步的Flask接口 ----------
+
+    def _call_wsgi(self, method, path, query_string, headers, body, remote_addr):
+        builder = EnvironBuilder(path=path, method=method, query_string=query_string,
+                                 headers=headers, data=body,
+                                 environ_overrides={'REMOTE_ADDR': remote_addr or '127.0.0.1'})
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+        response = WsgiResponse.from_app(core.app, environ, buffered=True)
+        return response.status_code, list(response.headers.items()), response.get_data()
+
+    async def call_flask(self, method, path, query_string='', headers=None, body=b'', remote_addr=None):
+        """在线程池中执行Flask接口，返回 (状态码, 响应头, 响应体)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._call_wsgi, method, path,
+                                          query_string, headers or {}, body, remote_addr)
+
+    async def call_json(self, method, path, payload=None):
+        """以JSON调用内部接口，返回 (状态码, 解析后的响应)"""
+        body = json.dumps(payload or {}).encode('utf-8')
+        status, _, data = await self.call_flask(method, path, headers={'Content-Type': 'application/json'},
+                                                body=body)
+        try:
+            return status, json.loads(data)
+        except ValueError:
+            return status, {'status': 'error', 'message': data.decode('utf-8', 'replace')}
+
+    async def handle_rest(self, request, body=None):
+        if body is None:
+            body = await request.read()
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() != 'host']
+        headers.append(('Host', request.host))
+        status, response_headers, data = await self.call_flask(
+            request.method, request.path, request.query_string, headers, body, request.remote)
+        response = web.Response(status=status, body=data)
+        for key, value in response_headers:
+            if key.lower() not in HOP_BY_HOP_HEADERS:
+                response.headers.add(key, value)
+        return response
+
+    # ---------- 在事件循环中等待的接口 ----------
+
+    async def stream_results(self, request):
+        """SSE推送识别结果，参数和事件格式与同步版本相同"""
+        session_id = request.query.get('session_id')
+        if not session_id:
+            return json_response({'status': 'error', 'message': '会话ID不能为空'}, 400)
+        last_event_id = request.headers.get('Last-Event-ID') or request.query.get('last_event_id') or 0
+        try:
+            cursor = int(last_event_id)
+            heartbeat = max(0.1, float(request.query.get('heartbeat', core.SSE_HEARTBEAT_INTERVAL)))
+        except ValueError:
+            return json_response({'status': 'error', 'message': '参数格式错误'}, 400)
+        delta = request.query.get('delta') in ('1', 'true')
+        delta_state = {}
+
+        logger.info(f'SSE订阅识别结果: 会话={session_id}, 起始事件ID={cursor}')
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream; charset=utf-8',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            **CORS_HEADERS
+        })
+        await response.prepare(request)
+        key = ('asr', session_id)
+        event = self.notifier.watch(key)
+        try:
+            await response.write(f'retry: {core.SSE_RETRY_MS}\n\n'.encode('utf-8'))
+            while not core.stop_thread.is_set():
+                event.clear()
+                events = core.result_store.read(session_id, cursor)
+                if not events:
+                    if not await wait_event(event, heartbeat):
+                        await response.write(format_sse({'type': 'heartbeat', 'time': time.time()},
+                                                        event='heartbeat').encode('utf-8'))
+                    continue
+                await response.write(''.join(
+                    format_sse(encode_delta(result, delta_state) if delta else result, event_id=event_id)
+                    for event_id, result in events).encode('utf-8'))
+                cursor = events[-1][0]
+                core.observe_delivery([result for _, result in events])
+                if events[-1][1].get('type') in ('complete', 'error'):
+                    break
+        except ConnectionResetError:
+            pass
+        finally:
+            self.notifier.unwatch(key, event)
+            logger.info(f'SSE订阅已结束: 会话={session_id}, 最后事件ID={cursor}')
+        return response
+
+    def watch_audio(self, audio_buffer):
+        """登记音频缓冲的唤醒，返回 (事件, 取消登记的函数)"""
+        key = ('tts', id(audio_buffer))
+        event = self.notifier.watch(key)
+        listener = lambda: self.notifier.notify(key)
+        audio_buffer.add_listener(listener)
+
+        def release():
+            audio_buffer.remove_listener(listener)
+            self.notifier.unwatch(key, event)
+        return event, release
+
+    async def iter_audio(self, audio_buffer, cursor=0, skip_header=False):
+        """逐块产生音频直到合成结束，与 TtsAudioBuffer.stream 相同但不占用线程"""
+        event, release = self.watch_audio(audio_buffer)
+        try:
+            while not core.stop_thread.is_set():
+                event.clear()
+                if skip_header:
+                    pcm_cursor = audio_buffer.pcm_cursor(cursor)
+                    if pcm_cursor is None:
+                        if audio_buffer.done:
+                            return
+                        await wait_event(event, core.TTS_STREAM_WAIT_TIMEOUT)
+                        continue
+                    cursor = pcm_cursor
+                data, cursor = audio_buffer.read(cursor)
+                if data:
+                    yield data
+                elif audio_buffer.at_end(cursor):
+                    return
+                else:
+                    await wait_event(event, core.TTS_STREAM_WAIT_TIMEOUT)
+        finally:
+            release()
+
+    async def get_tts_audio(self, request):
+        # 只有 stream=1 的持续输出在事件循环中处理，按游标拉取仍由同步接口处理
+        if request.query.get('stream') not in ('1', 'true'):
+            return await self.handle_rest(request)
+        session_id = request.match_info['session_id']
+        with core.tts_audio_lock:
+            audio_buffer = core.tts_audio_buffers.get(session_id)
+        if audio_buffer is None:
+            return json_response({'status': 'error', 'message': '会话不存在或已关闭'}, 404)
+        try:
+            cursor = int(request.query.get('cursor', 0))
+        except ValueError:
+            return json_response({'status': 'error', 'message': '参数格式错误'}, 400)
+        try:
+            mimetype, raw_pcm = core.tts_audio_response_format(audio_buffer, request.query.get('format'))
+        except ValueError as e:
+            return json_response({'status': 'error', 'message': str(e)}, 400)
+
+        logger.info(f'开始输出TTS音频流: 会话={session_id}, 游标={cursor}, 格式={mimetype}')
+        response = web.StreamResponse(headers={
+            'Content-Type': mimetype,
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            **CORS_HEADERS
+        })
+        await response.prepare(request)
+        sent = 0
+        try:
+            async for chunk in self.iter_audio(audio_buffer, cursor, skip_header=raw_pcm):
+                await response.write(chunk)
+                sent += len(chunk)
+        except ConnectionResetError:
+            pass
+        finally:
+            logger.info(f'TTS音频流已结束: 会话={session_id}, 已发送 {sent} 字节')
+        return response
+
+    async def check_tts_session(self, request):
+        """状态长轮询：先在事件循环中等待合成结束，再由同步接口生成响应"""
+        body = await request.read()
+        try:
+            data = json.loads(body or b'{}')
+            wait = min(float(data.get('wait', 0) or 0), core.TTS_STATUS_MAX_WAIT)
+        except (TypeError, ValueError, AttributeError):
+            return await self.handle_rest(request, body)
+        callback = core.tts_callbacks.get(data.get('session_id'))
+        if wait > STATUS_FORWARD_WAIT and callback is not None and not callback.done_event.is_set():
+            deadline = time.monotonic() + wait
+            event, release = self.watch_audio(callback.audio_buffer)
+            try:
+                while not callback.done_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    event.clear()
+                    await wait_event(event, min(remaining, core.TTS_STREAM_WAIT_TIMEOUT))
+            finally:
+                release()
+            data['wait'] = min(wait, STATUS_FORWARD_WAIT)
+            body = json.dumps(data).encode('utf-8')
+        return await self.handle_rest(request, body)
+
+    # ---------- WebSocket ----------
+
+    async def handle_websocket(self, request):
+        ws = web.WebSocketResponse(heartbeat=WS_HEARTBEAT, max_msg_size=WS_MAX_MESSAGE_BYTES)
+        await ws.prepare(request)
+        session = WebSocketSession(self, ws, request.query.get('session_id') or str(uuid.uuid4()))
+        self.websockets.add(ws)
+        logger.info(f'WebSocket已连接: {session.session_id}, 当前连接数: {len(self.websockets)}')
+        try:
+            await session.run()
+        finally:
+            self.websockets.discard(ws)
+            await session.close()
+            logger.info(f'WebSocket已断开: {session.session_id}, 当前连接数: {len(self.websockets)}')
+        return ws
+
+    # ---------- 应用 ----------
+
+    async def on_startup(self, app):
+        loop = asyncio.get_running_loop()
+        self.notifier = LoopNotifier(loop)
+        core.result_listeners.append(self._on_result)
+        await loop.run_in_executor(self.executor, core.prepare_server)
+        startup_profile.mark('serving')
+
+    async def ping(self, request):
+        # 不经过线程池，线程池忙时也能立即响应
+        return web.json_response({'status': 'success', 'message': 'pong'}, headers=CORS_HEADERS)
+
+    def _on_result(self, result):
+        self.notifier.notify(('asr', result['session_id']))
+
+    async def on_shutdown(self, app):
+        for ws in list(self.websockets):
+            await ws.close(code=1001, message=b'server shutdown')
+
+    async def on_cleanup(self, app):
+        if self._on_result in core.result_listeners:
+            core.result_listeners.remove(self._on_result)
+        await asyncio.get_running_loop().run_in_executor(None, core.cleanup)
+        self.executor.shutdown(wait=False)
+
+    def create_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.on_startup.append(self.on_startup)
+        app.on_shutdown.append(self.on_shutdown)
+        app.on_cleanup.append(self.on_cleanup)
+        app.router.add_get('/api/ping', self.ping)
+        app.router.add_get('/ws/session', self.handle_websocket)
+        app.router.add_get('/api/speech/stream', self.stream_results)
+        app.router.add_get('/api/tts/audio/{session_id}', self.get_tts_audio)
+        app.router.add_post('/api/tts/status', self.check_tts_session)
+        # 其余路径（包括CORS预检）交给Flask应用
+        app.router.add_route('*', '/{tail:.*}', self.handle_rest)
+        return app
+
+
+class WebSocketSession:
+    """一个WebSocket连接上的识别和合成会话
+
+    上行文本帧为JSON控制消息，按 type 区分：
+      asr.start {vad?, delta?}  开始识别，之后的二进制帧为16kHz单声道16位PCM；
+                              delta 为 true 时文本结果以增量下发（prefix + delta，见 speech_results.encode_delta）
+      asr.end                 音频结束，识别完剩余音频后下发 complete
+      asr.stop                立即停止识别
+      tts.start {voice?, segment?, format?, sample_rate?, bitrate?}
+                              创建合成会话，合成的音频以二进制帧下发：默认为裸PCM，format 为 mp3 时为MP3数据，
+                              tts.start.ok 中的 format 为协商后的格式
+      tts.text {text, final?} 发送待合成文本，final 为 true 表示文本结束
+      tts.stop                停止合成
+      ping                    回复 pong
+    下行文本帧：识别结果（与SSE相同，附 event_id）、各控制消息的回复（type 加 .ok / .error 后缀）、
+    合成结束时的 tts.done {error}。
+    """
+
+    def __init__(self, server, ws, session_id):
+        self.server = server
+        self.ws = ws
+        self.session_id = session_id
+        self.asr_session_id = None
+        self.tts_session_id = None
+        self.source = None
+        self._send_lock = asyncio.Lock()
+        self._tts_lock = asyncio.Lock()  # 按收到的顺序依次发送合成文本
+        self._tasks = set()
+        self.frames_received = 0
+        self.frames_dropped = 0
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def send_json(self, data):
+        if self.ws.closed:
+            return
+        async with self._send_lock:
+            await self.ws.send_str(json.dumps(data, ensure_ascii=False))
+
+    async def send_bytes(self, data):
+        if self.ws.closed:
+            return
+        async with self._send_lock:
+            await self.ws.send_bytes(data)
+
+    async def run(self):
+        await self.send_json({'type': 'session', 'session_id': self.session_id})
+        async for message in self.ws:
+            if message.type == WSMsgType.BINARY:
+                await self.push_audio(message.data)
+            elif message.type == WSMsgType.TEXT:
+                try:
+                    data = json.loads(message.data)
+                    if not isinstance(data, dict):
+                        raise ValueError('消息必须是JSON对象')
+                except ValueError as e:
+                    await self.send_json({'type': 'error', 'message': f'无效的消息: {e}'})
+                    continue
+                await self.dispatch(data)
+            elif message.type == WSMsgType.ERROR:
+                logger.warning(f'WebSocket出错: {self.session_id}, {self.ws.exception()}')
+                break
+
+    async def dispatch(self, data):
+        kind = data.get('type')
+        try:
+            if kind == 'asr.start':
+                await self.start_recognition(data)
+            elif kind == 'asr.end':
+                if self.source is not None:
+                    self.source.end()
+                await self.send_json({'type': 'asr.end.ok'})
+            elif kind == 'asr.stop':
+                await self.stop_recognition()
+            elif kind == 'tts.start':
+                await self.start_tts(data)
+            elif kind == 'tts.text':
+                # 合成请求可能等待到文本合成完毕，在单独的任务中执行，不阻塞接收音频
+                self._spawn(self.synthesize(data))
+            elif kind == 'tts.stop':
+                await self.stop_tts()
+            elif kind == 'ping':
+                await self.send_json({'type': 'pong', 'time': time.time()})
+            else:
+                await self.send_json({'type': 'error', 'message': f'未知的消息类型: {kind}'})
+        except Exception as e:
+            logger.error(f'处理WebSocket消息失败: {kind}, {e}', exc_info=True)
+            await self.send_json({'type': f'{kind}.error', 'message': str(e)})
+
+    # 识别
+
+    async def start_recognition(self, data):
+        if self.asr_session_id is not None:
+            await self.stop_recognition(reply=False)
+        session_id = data.get('session_id') or f'{self.session_id}-asr-{uuid.uuid4().hex[:8]}'
+        payload = {'session_id': session_id, 'source': 'stream'}
+        if 'vad' in data:
+            payload['vad'] = data['vad']
+        status, response = await self.server.call_json('POST', '/api/speech/start', payload)
+        if status != 200:
+            await self.send_json({'type': 'asr.start.error', 'status': status, 'message': response.get('message')})
+            return
+        session = core.recognition_manager.get(session_id)
+        self.asr_session_id = session_id
+        self.source = session.audio_source if session is not None else None
+        self._spawn(self.forward_results(session_id, bool(data.get('delta'))))
+        await self.send_json({'type': 'asr.start.ok', 'session_id': session_id})
+
+    async def push_audio(self, data):
+        source = self.source
+        if not isinstance(source, PushAudioSource):
+            self.frames_dropped += 1
+            if self.frames_dropped == 1:
+                await self.send_json({'type': 'error', 'message': '没有进行中的识别会话，音频已丢弃'})
+            return
+        self.frames_received += 1
+        # 缓冲区满时在事件循环中重试，不占用线程；对客户端的背压来自不再读取后续消息
+        deadline = time.monotonic() + WS_PUSH_TIMEOUT
+        while True:
+            try:
+                source.push(data, timeout=0)
+                return
+            except AudioSourceError as e:
+                if source.ended or time.monotonic() >= deadline:
+                    self.frames_dropped += 1
+                    logger.warning(f'WebSocket音频帧已丢弃: {self.asr_session_id}, {e}',
+                                   extra={'rate_limit': True})
+                    return
+            await asyncio.sleep(WS_PUSH_RETRY_INTERVAL)
+
+    async def forward_results(self, session_id, delta=False):
+        key = ('asr', session_id)
+        event = self.server.notifier.watch(key)
+        cursor = 0
+        delta_state = {}
+        try:
+            while not self.ws.closed:
+                event.clear()
+                events = core.result_store.read(session_id, cursor)
+                if not events:
+                    await event.wait()
+                    continue
+                for event_id, result in events:
+                    if delta:
+                        result = encode_delta(result, delta_state)
+                    await self.send_json({**result, 'event_id': event_id})
+                cursor = events[-1][0]
+                core.observe_delivery([result for _, result in events])
+                if events[-1][1].get('type') in ('complete', 'error'):
+                    break
+        finally:
+            self.server.notifier.unwatch(key, event)
+            if self.asr_session_id == session_id:
+                self.asr_session_id = None
+                self.source = None
+
+    async def stop_recognition(self, reply=True):
+        session_id, self.asr_session_id, self.source = self.asr_session_id, None, None
+        if session_id is None or core.recognition_manager.get(session_id) is None:
+            if reply:
+                await self.send_json({'type': 'asr.stop.error', 'message': '没有正在进行的识别会话'})
+            return
+        status, response = await self.server.call_json('POST', '/api/speech/stop', {'session_id': session_id})
+        if reply:
+            await self.send_json({'type': 'asr.stop.ok' if status == 200 else 'asr.stop.error',
+                                  'session_id': session_id, 'message': response.get('message')})
+
+    # 合成
+
+    async def start_tts(self, data):
+        if self.tts_session_id is not None:
+            await self.stop_tts(reply=False)
+        payload = {'playback': False}
+        for key in ('voice', 'segment', 'format', 'sample_rate', 'bitrate'):
+            if key in data:
+                payload[key] = data[key]
+        status, response = await self.server.call_json('POST', '/api/tts/start', payload)
+        if status != 200:
+            await self.send_json({'type': 'tts.start.error', 'status': status, 'message': response.get('message')})
+            return
+        session_id = response['session_id']
+        with core.tts_audio_lock:
+            audio_buffer = core.tts_audio_buffers.get(session_id)
+        self.tts_session_id = session_id
+        if audio_buffer is not None:
+            self._spawn(self.forward_audio(session_id, audio_buffer))
+        await self.send_json({'type': 'tts.start.ok', 'session_id': session_id, 'format': response.get('format')})
+
+    async def synthesize(self, data):
+        async with self._tts_lock:
+            session_id = self.tts_session_id
+            if session_id is None:
+                await self.send_json({'type': 'tts.text.error', 'message': '没有进行中的合成会话'})
+                return
+            payload = {'session_id': session_id, 'text': data.get('text', ''),
+                       'is_complete': bool(data.get('final'))}
+            status, response = await self.server.call_json('POST', '/api/tts/synthesize', payload)
+            await self.send_json({'type': 'tts.text.ok' if status == 200 else 'tts.text.error',
+                                  'session_id': session_id, 'message': response.get('message')})
+
+    async def forward_audio(self, session_id, audio_buffer):
+        try:
+            async for chunk in self.server.iter_audio(audio_buffer, skip_header=True):
+                if self.ws.closed:
+                    return
+                await self.send_bytes(chunk)
+            await self.send_json({'type': 'tts.done', 'session_id': session_id, 'error': audio_buffer.error})
+        except ConnectionResetError:
+            pass
+
+    async def stop_tts(self, reply=True):
+        session_id, self.tts_session_id = self.tts_session_id, None
+        if session_id is None:
+            if reply:
+                await self.send_json({'type': 'tts.stop.error', 'message': '没有进行中的合成会话'})
+            return
+        status, response = await self.server.call_json('POST', '/api/tts/stop', {'session_id': session_id})
+        if reply:
+            await self.send_json({'type': 'tts.stop.ok' if status == 200 else 'tts.stop.error',
+                                  'session_id': session_id, 'message': response.get('message')})
+
+    async def close(self):
+        """连接断开时停止该连接上仍在进行的会话"""
+        try:
+            if self.asr_session_id is not None:
+                await self.stop_recognition(reply=False)
+            if self.tts_session_id is not None:
+                await self.stop_tts(reply=False)
+        except Exception as e:
+            logger.error(f'关闭WebSocket会话失败: {self.session_id}, {e}')
+        for task in list(self._tasks):
+            task.cancel()
+
+
+def main():
+    server = AsyncSpeechServer()
+    settings = core.config.settings
+    logger.info(f'以asyncio模式启动，监听 {settings.host}:{settings.port}')
+    web.run_app(server.create_app(), host=settings.host, port=settings.port,
+                print=None, access_log=None, handle_signals=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+# 语音识别会话管理
+# 每个会话拥有独立的识别实例、音频来源、回调和音频线程，可同时服务多个窗口或客户端
+import logging
+import threading
+import time
+
+from speech_metrics import registry
+
+logger = logging.getLogger('speech_server')
+
+FRAMES_SENT = registry.counter('speech_audio_frames_sent_total', '发送给识别服务的音频块数')
+BYTES_SENT = registry.counter('speech_audio_bytes_sent_total', '发送给识别服务的音频字节数')
+SESSION_START_SECONDS = registry.histogram('speech_asr_session_start_seconds', '识别会话启动耗时（打开音频来源并建立识别连接）')
+
+# 会话状态
+STATE_STARTING = 'starting'
+STATE_RUNNING = 'running'
+STATE_STOPPING = 'stopping'
+STATE_STOPPED = 'stopped'
+STATE_FAILED = 'failed'
+
+
+class SessionLimitError(Exception):
+    """并发会话数已达上限"""
+
+
+class SessionExistsError(Exception):
+    """会话ID已在使用中"""
+
+
+class RecognitionSession:
+    """单个识别会话：识别实例 + 音频来源 + 发送线程"""
+
+    def __init__(self, session_id, recognition_factory, audio_source_factory, source_options=None,
+                 vad=None, auto_stop_seconds=0):
+        self.session_id = session_id
+        self._recognition_factory = recognition_factory
+        self._audio_source_factory = audio_source_factory
+        self.source_options = source_options or {}
+        self.vad = vad  # 可选的VAD门限，静音段不发送
+        self.auto_stop_seconds = auto_stop_seconds  # 连续静音超过该秒数自动结束，0为不启用
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self.recognition = None
+        self.audio_source = None
+        self.thread = None
+        self.state = STATE_STARTING
+        self.error = None
+        self.created_at = time.time()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.audio_stats = None  # 音频来源关闭时保存的统计
+
+    @property
+    def is_active(self):
+        return self.state in (STATE_STARTING, STATE_RUNNING)
+
+    def start(self):
+        """创建并启动识别实例，然后启动音频线程"""
+        started = time.perf_counter()
+        with self._lock:
+            try:
+                # 先创建音频来源，参数错误时不必建立识别连接
+                self.audio_source = self._audio_source_factory(self.session_id, self.source_options)
+                self.recognition = self._recognition_factory(self.session_id)
+                self.recognition.start()
+            except Exception as e:
+                self.state = STATE_FAILED
+                self.error = str(e)
+                self._close_source()
+                self._stop_recognition()
+                raise
+            self.thread = threading.Thread(
+                target=self._run_audio,
+                name=f'recognition-audio-{self.session_id}',
+                daemon=True
+            )
+            self.state = STATE_RUNNING
+            self.thread.start()
+        SESSION_START_SECONDS.observe(time.perf_counter() - started)
+
+    def _run_audio(self):
+        logger.info(f'会话 {self.session_id} 的音频线程已启动')
+        try:
+            while not self._stop_event.is_set():
+                audio_data = self.audio_source.read()
+                if audio_data is None:
+                    # 音频来源已结束（上传结束或文件读完），结束识别以取得最终结果
+                    logger.info(f'会话 {self.session_id} 的音频来源已结束')
+                    threading.Thread(target=self.stop, daemon=True).start()
+                    break
+                if self.vad is not None and audio_data:
+                    audio_data = self.vad.process(audio_data)
+                    if self.auto_stop_seconds and self.vad.silence_seconds >= self.auto_stop_seconds:
+                        logger.info(f'会话 {self.session_id} 连续静音 {self.vad.silence_seconds:.1f} 秒，自动结束识别')
+                        threading.Thread(target=self.stop, daemon=True).start()
+                        break
+                if not audio_data:
+                    continue
+                self.recognition.send_audio_frame(audio_data)
+                self.frames_sent += 1
+                self.bytes_sent += len(audio_data)
+                FRAMES_SENT.inc()
+                BYTES_SENT.inc(len(audio_data))
+        except Exception as e:
+            if not self._stop_event.is_set():
+                logger.error(f'会话 {self.session_id} 音频处理错误: {e}', exc_info=True)
+                self.error = str(e)
+                self.state = STATE_FAILED
+                self._release_after_failure()
+        finally:
+            logger.info(f'会话 {self.session_id} 的音频线程已停止')
+
+    def _release_after_failure(self):
+        # 音频线程出错退出后关闭音频来源和识别连接；stop() 持有锁时等待音频线程退出，
+        # 此时由 stop() 负责关闭，不在这里等锁
+        while not self._lock.acquire(timeout=0.1):
+            if self._stop_event.is_set():
+                return
+        try:
+            self._close_source()
+            self._stop_recognition()
+        finally:
+            self._lock.release()
+
+    def _source_stats(self):
+        source = self.audio_source
+        if source is not None and hasattr(source, 'stats'):
+            return source.stats()
+        return self.audio_stats
+
+    def _close_source(self):
+        if self.audio_source is not None:
+            try:
+                self.audio_source.close()
+            except Exception as e:
+                logger.warning(f'关闭会话 {self.session_id} 的音频来源出错: {e}')
+            self.audio_stats = self._source_stats()
+            self.audio_source = None
+
+    def _stop_recognition(self):
+        if self.recognition is not None:
+            try:
+                self.recognition.stop()
+            except Exception as e:
+                logger.error(f'停止会话 {self.session_id} 的识别实例时出错: {e}', exc_info=True)
+            self.recognition = None
+
+    def stop(self, join_timeout=2.0):
+        """停止音频线程和识别实例，可重复调用"""
+        with self._lock:
+            if self.state in (STATE_STOPPING, STATE_STOPPED):
+                return
+            if self.state != STATE_FAILED:
+                self.state = STATE_STOPPING
+            self._stop_event.set()
+            # 音频来源的读取有超时，等音频线程退出后再关闭来源
+            if self.thread is not None and self.thread is not threading.current_thread():
+                self.thread.join(join_timeout)
+            self._close_source()
+            self._stop_recognition()
+            if self.state != STATE_FAILED:
+                self.state = STATE_STOPPED
+
+    def info(self):
+        return {
+            'session_id': self.session_id,
+            'state': self.state,
+            'created_at': self.created_at,
+            'frames_sent': self.frames_sent,
+            'bytes_sent': self.bytes_sent,
+            'error': self.error,
+            'source': self.source_options.get('source', 'microphone'),
+            'audio': self._source_stats(),
+            'vad': self.vad.stats() if self.vad is not None else None,
+        }
+
+
+class RecognitionSessionManager:
+    """管理多个并发的识别会话"""
+
+    def __init__(self, recognition_factory, audio_source_factory, max_sessions=4, vad_factory=None):
+        self.recognition_factory = recognition_factory
+        self.audio_source_factory = audio_source_factory
+        self.vad_factory = vad_factory  # vad_factory(session_id, options) -> (门限或None, 自动结束秒数)
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = {}  # 会话ID -> RecognitionSession
+
+    def _purge_finished(self):
+        # 调用方必须持有 self._lock；返回出错结束的会话，由调用方在锁外调用 stop() 释放资源
+        failed = []
+        for session_id in [sid for sid, s in self._sessions.items() if not s.is_active]:
+            session = self._sessions.pop(session_id)
+            if session.state == STATE_FAILED:
+                failed.append(session)
+        return failed
+
+    def start_session(self, session_id, source_options=None, vad_options=None):
+        """创建并启动会话；超过并发上限或ID重复时抛出异常"""
+        vad, auto_stop_seconds = None, 0
+        if self.vad_factory is not None:
+            vad, auto_stop_seconds = self.vad_factory(session_id, vad_options)
+        failed = []
+        try:
+            with self._lock:
+                failed = self._purge_finished()
+                if session_id in self._sessions:
+                    raise SessionExistsError(f'会话 {session_id} 已在进行中')
+                if len(self._sessions) >= self.max_sessions:
+                    raise SessionLimitError(f'并发识别会话数已达上限 ({self.max_sessions})')
+                # 先占位，耗时的网络连接在锁外完成
+                session = RecognitionSession(session_id, self.recognition_factory,
+                                             self.audio_source_factory, source_options,
+                                             vad=vad, auto_stop_seconds=auto_stop_seconds)
+                self._sessions[session_id] = session
+        finally:
+            for failed_session in failed:
+                failed_session.stop()
+        try:
+            session.start()
+        except Exception:
+            with self._lock:
+                if self._sessions.get(session_id) is session:
+                    del self._sessions[session_id]
+            raise
+        return session
+
+    def stop_session(self, session_id):
+        """停止并移除会话，不存在时返回None"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.stop()
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def latest_session_id(self):
+        """最近启动的会话ID（兼容不携带会话ID的停止请求）"""
+        with self._lock:
+            active = [s for s in self._sessions.values() if s.is_active]
+        if not active:
+            return None
+        return max(active, key=lambda s: s.created_at).session_id
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for s in self._sessions.values() if s.is_active)
+
+    def list_sessions(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return [s.info() for s in sessions]
+
+    def stop_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.stop()
@@ -0,0 +1,232 @@
+# 启动耗时记录
+# StartupProfile 记录进程启动后各模块的导入耗时和启动过程中的时间点，写入日志目录，
+# 用于对比不同版本的冷启动时间。WarmupTracker 记录后台预热（导入SDK、初始化PortAudio、
+# 建立预热连接）各阶段的状态，就绪检查接口据此返回。
+# 本模块只依赖标准库
+import builtins
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+
+logger = logging.getLogger('speech_server')
+
+PROFILE_FILE_NAME = 'startup_profile.json'     # 最近一次启动的记录
+HISTORY_FILE_NAME = 'startup_profiles.jsonl'   # 每次启动追加一行
+HISTORY_MAX_LINES = 200                        # 历史记录保留的行数
+TOP_IMPORTS = 25                               # 记录中列出的最慢的模块数
+
+PHASE_PENDING = 'pending'
+PHASE_RUNNING = 'running'
+PHASE_DONE = 'done'
+PHASE_FAILED = 'failed'
+
+
+class StartupProfile:
+    """记录模块导入耗时和启动时间点
+
+    创建时替换 builtins.__import__，记录每个模块第一次导入的耗时（含其导入的子模块）和
+    自身耗时（不含子模块），直到调用 stop()。相对导入计入所在包。时间点由 mark() 记录，
+    为相对于创建时的秒数。
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.marks = {}
+        self.imports = {}  # 模块名 -> [总耗时, 自身耗时]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    @property
+    def active(self):
+        return builtins.__import__ == self._import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)  # 子模块的导入耗时
+        started = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                entry = self.imports.setdefault(name, [0.0, 0.0])
+                entry[0] += elapsed
+                entry[1] += elapsed - children
+
+    def stop(self):
+        """停止记录导入耗时"""
+        if self.active:
+            builtins.__import__ = self._original_import
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def mark(self, name):
+        """记录一个时间点，同名时只保留第一次"""
+        self.marks.setdefault(name, round(self.elapsed(), 4))
+
+    def as_dict(self):
+        with self._lock:
+            imports = {name: tuple(entry) for name, entry in self.imports.items()}
+        # 自身耗时按顶层包汇总，各包之和即为全部导入耗时
+        packages = {}
+        for name, (_, own) in imports.items():
+            top = name.partition('.')[0]
+            packages[top] = packages.get(top, 0.0) + own
+        slowest = sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:TOP_IMPORTS]
+        return {
+            'started_at': round(self.wall_started, 3),
+            'elapsed': round(self.elapsed(), 4),
+            'frozen': bool(getattr(sys, 'frozen', False)),
+            'python': platform.python_version(),
+            'platform': sys.platform,
+            'marks': dict(self.marks),
+            'import_seconds': round(sum(packages.values()), 4),
+            'packages': {name: round(seconds, 4) for name, seconds in
+                         sorted(packages.items(), key=lambda item: item[1], reverse=True)
+                         if seconds >= 0.0005},
+            'slowest_imports': [{'module': name, 'cumulative': round(total, 4), 'self': round(own, 4)}
+                                for name, (total, own) in slowest],
+        }
+
+    def save(self, directory):
+        """写出本次启动的记录，并追加到历史记录（超过 HISTORY_MAX_LINES 行时删除最早的）"""
+        data = self.as_dict()
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, PROFILE_FILE_NAME), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        history_path = os.path.join(directory, HISTORY_FILE_NAME)
+        line = json.dumps(data, ensure_ascii=False) + '\n'
+        try:
+            with open(history_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            lines = []
+        if len(lines) >= HISTORY_MAX_LINES:
+            lines = lines[-(HISTORY_MAX_LINES - 1):] + [line]
+            with open(history_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+        else:
+            with open(history_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        return os.path.join(directory, PROFILE_FILE_NAME)
+
+
+class WarmupPhase:
+    __slots__ = ('name', 'required', 'state', 'started', 'seconds', 'error')
+
+    def __init__(self, name, required):
+        self.name = name
+        self.required = required  # 失败时服务是否不可用
+        self.state = PHASE_PENDING
+        self.started = None
+        self.seconds = None
+        self.error = None
+
+    def as_dict(self):
+        return {'name': self.name, 'required': self.required, 'state': self.state,
+                'seconds': self.seconds, 'error': self.error}
+
+
+class WarmupTracker:
+    """后台预热各阶段的状态
+
+    阶段通过 add(名称, 函数, required) 登记，start() 在后台线程中依次执行；
+    全部阶段结束后调用 on_finished()。必需阶段失败时 ready 为False，可选阶段
+    （例如本机没有声卡）失败时只把状态记为 degraded。
+    """
+
+    def __init__(self, profile=None, on_finished=None):
+        self.profile = profile
+        self.on_finished = on_finished
+        self._cond = threading.Condition()
+        self._phases = []
+        self._functions = {}
+        self._thread = None
+        self.finished = False
+
+    def add(self, name, function, required=True):
+        with self._cond:
+            self._phases.append(WarmupPhase(name, required))
+            self._functions[name] = function
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='speech-warmup', daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """依次执行各阶段（start() 在后台线程中调用，也可在当前线程直接调用）"""
+        for phase in list(self._phases):
+            with self._cond:
+                phase.state = PHASE_RUNNING
+                phase.started = time.perf_counter()
+                self._cond.notify_all()
+            try:
+                self._functions[phase.name]()
+                state, error = PHASE_DONE, None
+            except Exception as e:
+                state, error = PHASE_FAILED, f'{type(e).__name__}: {e}'
+                log = logger.error if phase.required else logger.warning
+                log(f'预热阶段 {phase.name} 失败: {error}')
+            with self._cond:
+                phase.state, phase.error = state, error
+                phase.seconds = round(time.perf_counter() - phase.started, 4)
+                self._cond.notify_all()
+            if self.profile is not None:
+                self.profile.mark(f'warmup.{phase.name}')
+            logger.debug(f'预热阶段 {phase.name}: {state}, 耗时 {phase.seconds:.3f} 秒')
+        with self._cond:
+            self.finished = True
+            self._cond.notify_all()
+        if self.on_finished is not None:
+            try:
+                self.on_finished()
+            except Exception as e:
+                logger.warning(f'预热完成后的处理出错: {e}')
+
+    def wait(self, timeout=None):
+        """等待全部阶段结束，返回是否已结束"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.finished, timeout)
+
+    @property
+    def ready(self):
+        with self._cond:
+            return self.finished and not any(
+                phase.required and phase.state == PHASE_FAILED for phase in self._phases)
+
+    def status(self):
+        with self._cond:
+            phases = [phase.as_dict() for phase in self._phases]
+            finished = self.finished
+        failed = [phase for phase in phases if phase['state'] == PHASE_FAILED]
+        if not finished:
+            state = 'starting'
+        elif any(phase['required'] for phase in failed):
+            state = 'failed'
+        elif failed:
+            state = 'degraded'
+        else:
+            state = 'ready'
+        return {'state': state, 'ready': state in ('ready', 'degraded'), 'phases': phases}
+
+
+# 进程内唯一的记录，导入本模块时开始记录；入口脚本应最先导入本模块
+startup_profile = StartupProfile()
@@ -0,0 +1,249 @@
+# 识别文本记录
+# 把每个会话的句末结果（带时间戳）追加写入存储目录下按天分段的JSONL文件。
+# 识别回调只把记录放入有界的待写队列，由后台线程批量写盘；查询时逐行扫描文件，
+# 按文件名中的日期和行内的时间跳过无关数据，不会把整份记录读入内存
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger('speech_server')
+
+FILE_PREFIX = 'transcripts-'
+FILE_SUFFIX = '.jsonl'
+TRIM_CHECK_RECORDS = 1000  # 每写入这么多条检查一次总容量
+
+
+def _file_name(timestamp):
+    return f'{FILE_PREFIX}{datetime.datetime.fromtimestamp(timestamp):%Y%m%d}{FILE_SUFFIX}'
+
+
+def _file_day_range(name):
+    """由文件名得到该文件覆盖的时间范围 (开始, 结束)，文件名不符合格式时返回None"""
+    try:
+        day = datetime.datetime.strptime(name[len(FILE_PREFIX):-len(FILE_SUFFIX)], '%Y%m%d')
+    except ValueError:
+        return None
+    start = day.timestamp()
+    return start, (day + datetime.timedelta(days=1)).timestamp()
+
+
+class TranscriptStore:
+    """追加写入的识别文本记录
+
+    每行一条句子: {"time", "session_id", "text", "begin_time", "end_time", "start_time"}，
+    time 为写入队列时的时间（秒），begin_time/end_time 为句子在会话音频中的位置（毫秒），
+    start_time 为句子开始的绝对时间（秒，由会话开始时间推算，未知时为null）。
+    待写队列最多保留 max_pending 条，磁盘不可写时丢弃最早的记录；
+    所有分段文件合计超过 max_total_bytes 时删除最早的分段。
+    """
+
+    def __init__(self, directory, flush_interval=1.0, flush_batch=50, max_pending=5000,
+                 max_total_bytes=256 * 1024 * 1024):
+        self._directory = directory  # 目录或返回目录的函数（存储目录可能在运行时改变）
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.max_total_bytes = max_total_bytes
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._write_lock = threading.Lock()  # 写盘和清理旧分段
+        self._thread = None
+        self._closed = False
+        self.appended = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.removed_files = 0
+        self._unchecked = 0  # 上次检查容量后写入的条数
+
+    @property
+    def directory(self):
+        return self._directory() if callable(self._directory) else self._directory
+
+    def _ensure_thread(self):
+        # 调用方必须持有 self._cond
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name='transcript-writer', daemon=True)
+            self._thread.start()
+
+    def append(self, session_id, text, begin_time=None, end_time=None, session_started=None):
+        """记录一条句末结果；只放入待写队列，不做磁盘I/O"""
+        now = time.time()
+        record = {
+            'time': round(now, 3),
+            'session_id': session_id,
+            'text': text,
+            'begin_time': begin_time,
+            'end_time': end_time,
+            'start_time': round(session_started + begin_time / 1000.0, 3)
+            if session_started is not None and begin_time is not None else None,
+        }
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(record)
+            self.appended += 1
+            self._ensure_thread()
+            if len(self._pending) >= self.flush_batch:
+                self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.flush_batch:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        """把待写队列写入文件，返回写入的条数"""
+        with self._write_lock:
+            with self._cond:
+                batch = list(self._pending)
+                dropped = self.dropped
+            if not batch:
+                return 0
+            try:
+                directory = self.directory
+                os.makedirs(directory, exist_ok=True)
+                # 按记录时间分到各天的文件，每个文件一次写入
+                lines = {}
+                for record in batch:
+                    lines.setdefault(_file_name(record['time']), []).append(
+                        json.dumps(record, ensure_ascii=False) + '\n')
+                for name, items in lines.items():
+                    with open(os.path.join(directory, name), 'a', encoding='utf-8') as f:
+                        f.write(''.join(items))
+            except Exception as e:
+                # 保留在队列中下次重试，队列长度由 max_pending 限制
+                self.write_errors += 1
+                logger.error(f'写入识别文本记录失败: {e}', extra={'rate_limit': True})
+                return 0
+            with self._cond:
+                # 写盘期间 append 可能因队列已满从队首丢弃了快照中的记录，只移除仍在队首的那部分
+                for _ in range(max(0, len(batch) - (self.dropped - dropped))):
+                    self._pending.popleft()
+                self.written += len(batch)
+            self._unchecked += len(batch)
+            # 跨天或写入较多后检查总容量
+            if len(lines) > 1 or self._unchecked >= TRIM_CHECK_RECORDS:
+                self._unchecked = 0
+                self._trim(directory)
+            return len(batch)
+
+    def _files(self, directory):
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return []
+        return sorted(name for name in names if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX))
+
+    def _trim(self, directory):
+        # 调用方必须持有 self._write_lock；保留最新的分段
+        names = self._files(directory)
+        sizes = []
+        for name in names:
+            try:
+                sizes.append(os.path.getsize(os.path.join(directory, name)))
+            except OSError:
+                sizes.append(0)
+        total = sum(sizes)
+        for name, size in zip(names[:-1], sizes[:-1]):
+            if total <= self.max_total_bytes:
+                break
+            try:
+                os.remove(os.path.join(directory, name))
+                total -= size
+                self.removed_files += 1
+                logger.info(f'识别文本记录超过容量上限，已删除: {name}')
+            except OSError as e:
+                logger.warning(f'删除识别文本记录 {name} 失败: {e}')
+
+    @staticmethod
+    def _matches(record, session_id, since, until, query):
+        if session_id is not None and record.get('session_id') != session_id:
+            return False
+        record_time = record.get('start_time') or record.get('time', 0)
+        if since is not None and record_time < since:
+            return False
+        if until is not None and record_time > until:
+            return False
+        return query is None or query in (record.get('text') or '')
+
+    def query(self, session_id=None, since=None, until=None, text=None, limit=100):
+        """按会话、时间范围（秒）和子串查询句子，按时间先后返回 (结果列表, 是否还有更多)
+
+        时间按句子开始的绝对时间比较；逐行读取文件，先用原始行做子串和会话ID的快速过滤，
+        匹配的行才解析JSON。
+        """
+        limit = max(1, int(limit))
+        results = []
+        # 字符串在JSON行中的形式，用于解析前的快速过滤
+        raw_filters = [json.dumps(value, ensure_ascii=False)[1:-1]
+                       for value in (text, session_id) if value]
+        directory = self.directory
+        # 写入时间晚于句子开始时间，向后放宽一个文件的范围即可
+        for name in self._files(directory):
+            day_range = _file_day_range(name)
+            if day_range is not None:
+                if since is not None and day_range[1] < since:
+                    continue
+                if until is not None and day_range[0] > until + 86400:
+                    continue
+            try:
+                with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if any(value not in line for value in raw_filters):
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue  # 写入中断留下的不完整行
+                        if self._matches(record, session_id, since, until, text):
+                            results.append(record)
+                            if len(results) > limit:
+                                return results[:limit], True
+            except OSError as e:
+                logger.warning(f'读取识别文本记录 {name} 失败: {e}')
+        # 尚未写盘的记录
+        with self._cond:
+            pending = list(self._pending)
+        for record in pending:
+            if self._matches(record, session_id, since, until, text):
+                results.append(record)
+                if len(results) > limit:
+                    return results[:limit], True
+        return results, False
+
+    def close(self):
+        """写出剩余记录并停止后台线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5.0)
+        else:
+            self.flush()
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'directory': self.directory,
+            'pending': pending,
+            'appended': self.appended,
+            'written': self.written,
+            'dropped': self.dropped,
+            'write_errors': self.write_errors,
+            'removed_files': self.removed_files,
+        }
@@ -0,0 +1,178 @@
+# 语音活动检测（VAD）
+# 位于音频来源和 send_audio_frame 之间，静音段不发送到识别服务
+import threading
+from collections import deque
+
+np = None  # numpy，创建第一个实例时导入，服务启动时不等待
+
+# 各档灵敏度对应的参数：(高于噪声底的分贝余量, 最低绝对能量dBFS)
+AGGRESSIVENESS_LEVELS = {
+    0: (6.0, -55.0),
+    1: (9.0, -50.0),
+    2: (12.0, -45.0),
+    3: (15.0, -40.0),
+}
+ZCR_NOISE = 0.35       # 过零率高于该值且能量只略高于阈值的帧视为噪声
+ZCR_NOISE_MARGIN = 6.0  # 判定噪声帧时允许高出阈值的分贝数
+NOISE_FLOOR_RISE = 0.05  # 噪声底上升速度（每批次向当前最小能量靠近的比例）
+
+
+class VadTotals:
+    """所有会话共享的VAD累计统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frames_forwarded = 0
+        self.frames_suppressed = 0
+        self.frames_keepalive = 0
+        self.bytes_suppressed = 0
+
+    def add(self, forwarded, suppressed, keepalive, bytes_suppressed):
+        with self._lock:
+            self.frames_forwarded += forwarded
+            self.frames_suppressed += suppressed
+            self.frames_keepalive += keepalive
+            self.bytes_suppressed += bytes_suppressed
+
+    def snapshot(self):
+        with self._lock:
+            total = self.frames_forwarded + self.frames_suppressed
+            return {
+                'frames_forwarded': self.frames_forwarded,
+                'frames_suppressed': self.frames_suppressed,
+                'frames_keepalive': self.frames_keepalive,
+                'bytes_suppressed': self.bytes_suppressed,
+                'suppressed_ratio': self.frames_suppressed / total if total else 0.0,
+            }
+
+
+class VoiceActivityGate:
+    """基于能量和过零率的VAD门限
+
+    输入为16位单声道PCM批次，按 frame_ms 切分后向量化计算每帧的能量(dBFS)和过零率。
+    语音开始时补发 preroll_ms 的前导音频，语音结束后继续发送 hangover_ms 的拖尾，
+    保证识别服务能正常断句。长时间静音时每隔 keepalive_seconds 发送一帧，
+    避免识别服务因长时间收不到音频而超时断开。
+    """
+
+    def __init__(self, rate=16000, frame_ms=20, aggressiveness=1, hangover_ms=600,
+                 preroll_ms=300, keepalive_seconds=10.0, totals=None):
+        global np
+        if np is None:
+            import numpy as np
+        if aggressiveness not in AGGRESSIVENESS_LEVELS:
+            raise ValueError(f'VAD灵敏度必须为0-3: {aggressiveness}')
+        self.rate = rate
+        self.frame_samples = rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.aggressiveness = aggressiveness
+        self.margin_db, self.min_db = AGGRESSIVENESS_LEVELS[aggressiveness]
+        self.hangover_frames = max(0, hangover_ms // frame_ms)
+        self.keepalive_frames = int(keepalive_seconds * 1000 // frame_ms) if keepalive_seconds else 0
+        self.totals = totals
+        self._remainder = b''
+        self._preroll = deque(maxlen=max(0, preroll_ms // frame_ms))
+        self._noise_db = None
+        self._since_speech = self.hangover_frames + 1  # 距离上一语音帧的帧数
+        self._since_forward = 0
+        self._in_speech = False
+        self.frames_seen = 0
+        self.frames_forwarded = 0
+        self.frames_suppressed = 0
+        self.frames_keepalive = 0
+        self.speech_frames = 0
+        self.segments = 0
+
+    @property
+    def silence_seconds(self):
+        """当前连续静音时长（按音频时间计）"""
+        return self._since_speech * self.frame_samples / self.rate
+
+    def _classify(self, samples):
+        """返回每帧是否为语音的布尔数组"""
+        frames = samples.reshape(-1, self.frame_samples).astype(np.float32)
+        power = np.mean(frames * frames, axis=1)
+        energy_db = 10.0 * np.log10(power / (32768.0 * 32768.0) + 1e-12)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_samples - 1)
+
+        # 噪声底跟踪：快速下降、缓慢上升
+        batch_floor = float(energy_db.min())
+        if self._noise_db is None or batch_floor < self._noise_db:
+            self._noise_db = batch_floor
+        else:
+            self._noise_db += (batch_floor - self._noise_db) * NOISE_FLOOR_RISE
+
+        threshold = max(self._noise_db + self.margin_db, self.min_db)
+        speech = energy_db > threshold
+        noisy = (zcr > ZCR_NOISE) & (energy_db < threshold + ZCR_NOISE_MARGIN)
+        return speech & ~noisy
+
+    def process(self, data):
+        """过滤一批音频，返回需要发送的数据（可能为空）"""
+        data = self._remainder + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = data[usable:]
+        if usable == 0:
+            return b''
+
+        samples = np.frombuffer(data[:usable], dtype=np.int16)
+        speech = self._classify(samples)
+        count = len(speech)
+
+        # 计算每帧距离上一语音帧的距离，向量化实现拖尾
+        positions = np.arange(count)
+        last_speech = np.where(speech, positions, -1 - self._since_speech)
+        last_speech = np.maximum.accumulate(last_speech)
+        keep = (positions - last_speech) <= self.hangover_frames
+
+        output = []
+        forwarded = suppressed = keepalive = 0
+        for index in range(count):
+            frame = data[index * self.frame_bytes:(index + 1) * self.frame_bytes]
+            if keep[index]:
+                if not self._in_speech:
+                    # 语音开始：先补发前导音频
+                    self._in_speech = True
+                    self.segments += 1
+                    forwarded += len(self._preroll)
+                    suppressed -= len(self._preroll)
+                    output.extend(self._preroll)
+                    self._preroll.clear()
+                output.append(frame)
+                forwarded += 1
+                self._since_forward = 0
+                continue
+            self._in_speech = False
+            if self.keepalive_frames and self._since_forward >= self.keepalive_frames:
+                output.append(frame)
+                forwarded += 1
+                keepalive += 1
+                self._since_forward = 0
+            else:
+                self._preroll.append(frame)
+                suppressed += 1
+                self._since_forward += 1
+
+        self._since_speech = int(count - 1 - last_speech[-1])
+        self.frames_seen += count
+        self.speech_frames += int(np.count_nonzero(speech))
+        self.frames_forwarded += forwarded
+        self.frames_suppressed += suppressed
+        self.frames_keepalive += keepalive
+        if self.totals is not None:
+            self.totals.add(forwarded, suppressed, keepalive, suppressed * self.frame_bytes)
+        return b''.join(output)
+
+    def stats(self):
+        return {
+            'aggressiveness': self.aggressiveness,
+            'frames_seen': self.frames_seen,
+            'speech_frames': self.speech_frames,
+            'frames_forwarded': self.frames_forwarded,
+            'frames_suppressed': self.frames_suppressed,
+            'frames_keepalive': self.frames_keepalive,
+            'segments': self.segments,
+            'noise_floor_db': self._noise_db,
+            'silence_seconds': self.silence_seconds,
+        }
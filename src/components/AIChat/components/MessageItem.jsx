@@ -1209,9 +1209,7 @@ export const MessageItem = ({
       setTtsSessionId(localSessionId);
       console.log('创建TTS会话成功，会话ID:', localSessionId);
       
-      // 添加短暂延迟确保WebSocket连接已建立
-      console.log('等待WebSocket连接建立...');
-      await new Promise(resolve => setTimeout(resolve, 500)); // 增加到500ms，增强稳定性
+      // 服务端在发送文本时会等待连接就绪，这里无需额外延迟
       
       // 发送文本进行合成
       try {
@@ -1421,8 +1419,8 @@ export const MessageItem = ({
             return;
           }
           
-          // 如果成功获取到音频文件路径
-          if (jsonData.status === 'success' && jsonData.file_url) {
+          // 如果成功获取到音频文件路径（file_url 是整个会话的音频流，只需加入队列一次）
+          if (jsonData.status === 'success' && jsonData.file_url && !hasReceivedAudio) {
             hasReceivedAudio = true;
             
             // 创建音频URL
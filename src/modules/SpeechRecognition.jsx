@@ -348,6 +348,7 @@ export const useSpeechRecognition = (options = {}) => {
   
   // 引用（持久化的值）
   const pollingIntervalIdRef = useRef(null);
+  const eventSourceRef = useRef(null); // SSE推送连接
   const recordingTimeoutIdRef = useRef(null);
   const temporarySentenceRef = useRef('');
   const currentSessionIdRef = useRef('');
@@ -364,6 +365,56 @@ export const useSpeechRecognition = (options = {}) => {
     return `session_${Date.now()}_${Math.random().toString(36).substring(2, 9)}`;
   };
   
+  /**
+   * 处理一批识别结果（轮询和SSE推送共用）
+   * @param {Array} results - 结果数组
+   */
+  const processResults = (results) => {
+    console.log(`收到 ${results.length} 条识别结果`);
+    
+    // 记录是否有新的文本结果
+    let hasNewTextResult = false;
+    
+    // 遍历处理每一个结果
+    for (const result of results) {
+      if (!result) {
+        console.warn('结果项为空');
+        continue;
+      }
+      
+      console.log('处理结果:', result);
+      
+      // 如果有文本字段，处理为文本结果
+      if (result.text !== undefined) {
+        // 创建适合handleTextResult处理的对象
+        const textResult = {
+          text: result.text,
+          is_end: result.is_end || false
+        };
+        
+        // 标记有新的文本结果
+        hasNewTextResult = true;
+        
+        // 调用文本处理函数
+        handleTextResult(textResult);
+      } else if (result.type === 'complete') {
+        console.log('语音识别完成信号');
+      } else if (result.type === 'error') {
+        console.error('语音识别错误:', result.error || '未知错误');
+        showNotification(`语音识别错误: ${result.error || '未知错误'}`, 'error');
+      } else {
+        console.log('收到未知类型的结果:', result);
+      }
+    }
+    
+    // 只有当没有新的文本结果时，才考虑增加静音检测计数
+    if (!hasNewTextResult) {
+      // 如果没有识别到任何有效的新文本，则增加静音计数
+      console.log('未检测到新的语音输入，静音计数增加');
+      checkSilence();
+    }
+  };
+  
   /**
    * 获取识别结果
    * @param {string} sessionId - 用于获取结果的会话ID
@@ -436,49 +487,7 @@ export const useSpeechRecognition = (options = {}) => {
       
       // 处理结果
       if (data.results.length > 0) {
-        console.log(`收到 ${data.results.length} 条识别结果`);
-        
-        // 记录是否有新的文本结果
-        let hasNewTextResult = false;
-        
-        // 遍历处理每一个结果
-        for (const result of data.results) {
-          if (!result) {
-            console.warn('结果项为空');
-            continue;
-          }
-          
-          console.log('处理结果:', result);
-          
-          // 如果有文本字段，处理为文本结果
-          if (result.text !== undefined) {
-            // 创建适合handleTextResult处理的对象
-            const textResult = {
-              text: result.text,
-              is_end: result.is_end || false
-            };
-            
-            // 标记有新的文本结果
-            hasNewTextResult = true;
-            
-            // 调用文本处理函数
-            handleTextResult(textResult);
-          } else if (result.type === 'complete') {
-            console.log('语音识别完成信号');
-          } else if (result.type === 'error') {
-            console.error('语音识别错误:', result.error || '未知错误');
-            showNotification(`语音识别错误: ${result.error || '未知错误'}`, 'error');
-          } else {
-            console.log('收到未知类型的结果:', result);
-          }
-        }
-        
-        // 只有当没有新的文本结果时，才考虑增加静音检测计数
-        if (!hasNewTextResult) {
-          // 如果没有识别到任何有效的新文本，则增加静音计数
-          console.log('未检测到新的语音输入，静音计数增加');
-          checkSilence();
-        }
+        processResults(data.results);
       } else {
         // 如果结果为空数组，也视为静音
         console.log('结果为空数组，静音计数增加');
@@ -638,6 +647,90 @@ export const useSpeechRecognition = (options = {}) => {
     }, pollingInterval);
   };
   
+  /**
+   * 关闭SSE推送连接
+   */
+  const closeResultStream = () => {
+    if (eventSourceRef.current) {
+      eventSourceRef.current.close();
+      eventSourceRef.current = null;
+    }
+  };
+  
+  /**
+   * 通过SSE接收识别结果，不支持或连接失败时回退到轮询
+   * @param {string} sessionId - 会话ID
+   */
+  const startStreamingResults = (sessionId) => {
+    if (!sessionId) {
+      console.error('会话ID为空，无法订阅结果');
+      return;
+    }
+    
+    if (typeof EventSource === 'undefined') {
+      console.log('当前环境不支持EventSource，使用轮询获取结果');
+      startPollingResults(sessionId);
+      return;
+    }
+    
+    closeResultStream();
+    
+    // 心跳间隔与轮询间隔保持一致，以沿用原有的静音检测节奏
+    const heartbeat = pollingInterval / 1000;
+    const url = `${API_BASE_URL}/api/speech/stream?session_id=${encodeURIComponent(sessionId)}&heartbeat=${heartbeat}`;
+    console.log(`订阅会话ID=${sessionId}的识别结果推送: ${url}`);
+    
+    const eventSource = new EventSource(url);
+    eventSourceRef.current = eventSource;
+    let hasOpened = false;
+    
+    eventSource.onopen = () => {
+      hasOpened = true;
+    };
+    
+    eventSource.onmessage = (event) => {
+      if (currentSessionIdRef.current !== sessionId) {
+        closeResultStream();
+        return;
+      }
+      
+      let result;
+      try {
+        result = JSON.parse(event.data);
+      } catch (parseError) {
+        console.error('解析推送结果失败:', parseError);
+        return;
+      }
+      
+      processResults([result]);
+      
+      // 识别完成或出错后服务端会结束推送，避免浏览器自动重连
+      if (result.type === 'complete' || result.type === 'error') {
+        closeResultStream();
+      }
+    };
+    
+    // 心跳事件：没有新结果，按静音处理
+    eventSource.addEventListener('heartbeat', () => {
+      if (currentSessionIdRef.current === sessionId) {
+        checkSilence();
+      } else {
+        closeResultStream();
+      }
+    });
+    
+    eventSource.onerror = () => {
+      // 从未连接成功说明服务端不支持推送，回退到轮询；否则由浏览器携带Last-Event-ID自动重连
+      if (!hasOpened && eventSourceRef.current === eventSource) {
+        console.warn('结果推送连接失败，回退到轮询');
+        closeResultStream();
+        if (currentSessionIdRef.current === sessionId) {
+          startPollingResults(sessionId);
+        }
+      }
+    };
+  };
+  
   /**
    * 检查后端服务状态
    * @returns {Promise<boolean>} 服务是否可用
@@ -782,8 +875,8 @@ export const useSpeechRecognition = (options = {}) => {
             return;
           }
           
-          // 开始轮询结果
-          startPollingResults(sessionId);
+          // 订阅结果推送
+          startStreamingResults(sessionId);
           
           // 设置超时定时器
           recordingTimeoutIdRef.current = setTimeout(() => {
@@ -853,6 +946,7 @@ export const useSpeechRecognition = (options = {}) => {
           console.error(`停止录音API返回错误状态: ${response.status} ${response.statusText}`);
           const text = await response.text(); // 尝试获取响应文本以便调试
           console.error(`响应内容: ${text.substring(0, 150)}...`);
+          closeResultStream();
           
           // 400错误通常表示会话已经停止，不需要向用户显示此错误
           if (response.status !== 400) {
@@ -884,8 +978,12 @@ export const useSpeechRecognition = (options = {}) => {
         console.log('获取最后的语音识别结果...');
         await new Promise(resolve => setTimeout(resolve, 500));
         
-        // 调用获取结果函数一次，以获取最后的结果
-        await fetchTranscriptionResultsWithSessionId(sessionId);
+        // 推送模式下最后的结果已经送达，关闭连接；轮询模式下再获取一次
+        if (eventSourceRef.current) {
+          closeResultStream();
+        } else {
+          await fetchTranscriptionResultsWithSessionId(sessionId);
+        }
         
         // 显示录音已结束通知
         showNotification('语音识别已结束', 'success');
@@ -901,6 +999,7 @@ export const useSpeechRecognition = (options = {}) => {
     }
     
     // 重置状态
+    closeResultStream();
     setIsRecording(false);
     currentSessionIdRef.current = '';
     
@@ -944,6 +1043,7 @@ export const useSpeechRecognition = (options = {}) => {
       if (pollingIntervalIdRef.current) {
         clearInterval(pollingIntervalIdRef.current);
       }
+      closeResultStream();
       
       if (recordingTimeoutIdRef.current) {
         clearTimeout(recordingTimeoutIdRef.current);
@@ -969,6 +1069,7 @@ export const useSpeechRecognition = (options = {}) => {
         clearInterval(pollingIntervalIdRef.current);
         pollingIntervalIdRef.current = null;
       }
+      closeResultStream();
       
       if (recordingTimeoutIdRef.current) {
         clearTimeout(recordingTimeoutIdRef.current);
@@ -0,0 +1,257 @@
+# TTS批量合成
+# 把一组文本分配给固定数量的工作线程并行合成，结果写入存储目录，通过任务ID查询每一项的进度
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('speech_server')
+
+ITEM_PENDING = 'pending'
+ITEM_RUNNING = 'running'
+ITEM_DONE = 'done'
+ITEM_FAILED = 'failed'
+ITEM_CANCELLED = 'cancelled'
+
+
+def fix_wav_sizes(data):
+    """流式合成的WAV头中长度字段可能为0，写文件前按实际长度修正"""
+    if len(data) < 44 or data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        return data
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = int.from_bytes(data[offset + 4:offset + 8], 'little')
+        if chunk_id == b'data':
+            data_size = len(data) - offset - 8
+            return (data[:4] + (len(data) - 8).to_bytes(4, 'little') + data[8:offset + 4]
+                    + data_size.to_bytes(4, 'little') + data[offset + 8:])
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return data
+
+
+class BatchItem:
+    def __init__(self, index, text, voice):
+        self.index = index
+        self.text = text
+        self.voice = voice
+        self.state = ITEM_PENDING
+        self.path = None
+        self.bytes = 0
+        self.cached = False
+        self.attempts = 0
+        self.error = None
+        self.elapsed = None
+
+    def info(self):
+        return {
+            'index': self.index,
+            'voice': self.voice,
+            'chars': len(self.text),
+            'state': self.state,
+            'path': self.path,
+            'bytes': self.bytes,
+            'cached': self.cached,
+            'attempts': self.attempts,
+            'error': self.error,
+            'elapsed_ms': self.elapsed * 1000 if self.elapsed is not None else None,
+        }
+
+
+class BatchJob:
+    def __init__(self, job_id, items, output_dir, audio_format=None):
+        self.job_id = job_id
+        self.items = items
+        self.output_dir = output_dir
+        self.audio_format = audio_format  # 输出格式（tts_formats.AudioOutputFormat），None为合成服务的默认格式
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._remaining = len(items)
+
+    @property
+    def done(self):
+        return self._remaining == 0
+
+    def _item_finished(self):
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining == 0:
+                self.finished_at = time.time()
+                return True
+        return False
+
+    def info(self, include_items=True):
+        counts = {}
+        for item in self.items:
+            counts[item.state] = counts.get(item.state, 0) + 1
+        finished = self.finished_at or time.time()
+        info = {
+            'job_id': self.job_id,
+            'output_dir': self.output_dir,
+            'format': self.audio_format.as_dict() if self.audio_format is not None else None,
+            'total': len(self.items),
+            'counts': counts,
+            'done': self.done,
+            'cancelled': self.cancelled,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'elapsed_ms': (finished - self.created_at) * 1000,
+        }
+        if include_items:
+            info['items'] = [item.info() for item in self.items]
+        return info
+
+
+class BatchSynthesisManager:
+    """批量合成任务管理
+
+    synthesize(voice, text, audio_format) 返回按任务的输出格式编码的音频数据；cache 为可选的
+    TtsAudioCache，cache_key(voice, text, audio_format) 返回缓存键。文件扩展名取输出格式的
+    extension，任务未指定格式时为 extension。所有任务共用 max_workers 个工作线程，
+    并发数受该值限制，与提交的任务数无关。
+    """
+
+    def __init__(self, synthesize, max_workers=4, max_items=200, max_jobs=50, retries=1,
+                 cache=None, cache_key=None, extension='.wav'):
+        self.synthesize = synthesize
+        self.max_workers = max_workers
+        self.max_items = max_items
+        self.max_jobs = max_jobs
+        self.retries = retries
+        self.cache = cache  # 可以是返回缓存对象的函数
+        self.cache_key = cache_key
+        self.extension = extension
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts-batch')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self.items_done = 0
+        self.items_failed = 0
+        self.audio_bytes = 0
+
+    def submit(self, items, output_dir, default_voice, audio_format=None):
+        """提交一个任务，items 为 [{'text': ..., 'voice': ...}]，返回任务对象"""
+        if not items:
+            raise ValueError('items不能为空')
+        if len(items) > self.max_items:
+            raise ValueError(f'单个任务最多 {self.max_items} 项')
+        batch_items = []
+        for index, entry in enumerate(items):
+            if not isinstance(entry, dict) or not str(entry.get('text', '')).strip():
+                raise ValueError(f'第 {index} 项缺少文本')
+            batch_items.append(BatchItem(index, str(entry['text']), entry.get('voice') or default_voice))
+
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = os.path.join(output_dir, f'tts_batch_{job_id}')
+        os.makedirs(job_dir, exist_ok=True)
+        job = BatchJob(job_id, batch_items, job_dir, audio_format)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._trim_jobs()
+        for item in batch_items:
+            self._executor.submit(self._run_item, job, item)
+        logger.info(f'已提交TTS批量任务 {job_id}: {len(batch_items)} 项, 输出目录: {job_dir}')
+        return job
+
+    def _trim_jobs(self):
+        # 调用方必须持有 self._lock
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def _get_cache(self):
+        return self.cache() if callable(self.cache) else self.cache
+
+    def _run_item(self, job, item):
+        if job.cancelled:
+            item.state = ITEM_CANCELLED
+            self._finish(job, item)
+            return
+        item.state = ITEM_RUNNING
+        started = time.perf_counter()
+        extension = job.audio_format.extension if job.audio_format is not None else self.extension
+        path = os.path.join(job.output_dir, f'{item.index:04d}{extension}')
+        try:
+            audio = None
+            cache = self._get_cache()
+            key = (self.cache_key(item.voice, item.text, job.audio_format)
+                   if cache is not None and self.cache_key else None)
+            if key is not None:
+                cached_path = cache.lookup(key)
+                if cached_path is not None:
+                    with open(cached_path, 'rb') as f:
+                        audio = f.read()
+                    item.cached = True
+            while audio is None:
+                item.attempts += 1
+                try:
+                    audio = self.synthesize(item.voice, item.text, job.audio_format)
+                except Exception:
+                    if item.attempts > self.retries or job.cancelled:
+                        raise
+                    time.sleep(0.5 * item.attempts)
+            if not audio:
+                raise RuntimeError('合成结果为空')
+            if key is not None and not item.cached:
+                writer = cache.open_writer(extension)
+                writer.write(audio)
+                writer.commit(key)
+            with open(path, 'wb') as f:
+                f.write(fix_wav_sizes(audio))
+            item.path = path
+            item.bytes = len(audio)
+            item.state = ITEM_DONE
+            with self._lock:
+                self.items_done += 1
+                self.audio_bytes += len(audio)
+        except Exception as e:
+            logger.error(f'批量任务 {job.job_id} 第 {item.index} 项合成失败: {e}')
+            item.error = str(e)
+            item.state = ITEM_FAILED
+            with self._lock:
+                self.items_failed += 1
+        finally:
+            item.elapsed = time.perf_counter() - started
+            self._finish(job, item)
+
+    def _finish(self, job, item):
+        if job._item_finished():
+            info = job.info(include_items=False)
+            logger.info(f'TTS批量任务 {job.job_id} 已结束: {info["counts"]}, 耗时 {info["elapsed_ms"]:.0f}ms')
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """取消任务中尚未开始的项，正在合成的项会继续完成"""
+        job = self.get(job_id)
+        if job is not None:
+            job.cancelled = True
+        return job
+
+    def list_jobs(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.info(include_items=False) for job in jobs]
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancelled = True
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'jobs': len(self._jobs),
+                'items_done': self.items_done,
+                'items_failed': self.items_failed,
+                'audio_bytes': self.audio_bytes,
+            }
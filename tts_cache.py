@@ -0,0 +1,222 @@
+# TTS音频缓存
+# 以 (模型, 音色, 格式, 规范化文本) 的哈希为键，把合成得到的音频保存在存储目录中，
+# 重复朗读同一段文本时直接使用本地音频，不再请求合成服务
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger('speech_server')
+
+INDEX_FILE = 'index.json'
+INDEX_SAVE_INTERVAL = 30  # 仅访问顺序变化时，索引最多每隔该秒数写盘一次
+
+_whitespace_re = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """规范化文本：统一全角/半角形式，合并空白"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return _whitespace_re.sub(' ', text).strip()
+
+
+def make_cache_key(model, voice, audio_format, text):
+    payload = json.dumps([model, voice, str(audio_format), normalize_text(text)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CacheWriter:
+    """把一次合成的音频写入临时文件，完成后提交到缓存"""
+
+    def __init__(self, cache, temp_path, extension):
+        self._cache = cache
+        self.temp_path = temp_path
+        self.extension = extension
+        self._file = open(temp_path, 'wb')
+        self.size = 0
+        self.closed = False
+
+    def write(self, data):
+        if not self.closed:
+            self._file.write(data)
+            self.size += len(data)
+
+    def commit(self, key):
+        if self.closed:
+            return False
+        self.closed = True
+        self._file.close()
+        if self.size == 0:
+            os.remove(self.temp_path)
+            return False
+        return self._cache._commit(key, self.temp_path, self.size, self.extension)
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class TtsAudioCache:
+    """容量受限的LRU磁盘缓存，索引保存在缓存目录中，重启后继续有效
+
+    每条音频的文件扩展名由写入时的格式决定并记录在索引中；default_extension 用于
+    未指定扩展名的写入和没有记录扩展名的旧索引条目。
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, default_extension='.wav'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_extension = default_extension
+        self._lock = threading.Lock()
+        # 键 -> {'size': 字节数, 'last_access': 时间戳, 'extension': 扩展名}，按访问顺序排列
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._dirty = False
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def _entry_path(self, key, entry):
+        return self._path(key, entry.get('extension', self.default_extension))
+
+    def _load_index(self):
+        # 清理上次异常退出时残留的临时文件
+        for name in os.listdir(self.directory):
+            if name.endswith('.part'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        entries = {}
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f).get('entries', {})
+            except Exception as e:
+                logger.warning(f'读取TTS缓存索引失败，将重建索引: {e}')
+        # 丢弃文件已不存在的条目，按最后访问时间恢复LRU顺序
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get('last_access', 0)):
+            extension = entry.get('extension', self.default_extension)
+            path = self._path(key, extension)
+            if os.path.exists(path):
+                size = os.path.getsize(path)
+                self._entries[key] = {'size': size, 'last_access': entry.get('last_access', 0),
+                                      'extension': extension}
+                self._total_bytes += size
+        logger.info(f'TTS缓存已加载: {len(self._entries)} 条, {self._total_bytes} 字节, 目录: {self.directory}')
+        self._evict()
+
+    def _save_index(self, force=False):
+        # 调用方必须持有 self._lock
+        now = time.time()
+        if not self._dirty or (not force and now - self._last_save < INDEX_SAVE_INTERVAL):
+            return
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        temp_path = index_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'entries': self._entries}, f)
+            os.replace(temp_path, index_path)
+            self._dirty = False
+            self._last_save = now
+        except Exception as e:
+            logger.warning(f'保存TTS缓存索引失败: {e}')
+
+    def _evict(self):
+        # 调用方必须持有 self._lock（初始化时除外）
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry['size']
+            self.evictions += 1
+            self._dirty = True
+            try:
+                os.remove(self._entry_path(key, entry))
+            except OSError:
+                pass
+
+    def lookup(self, key):
+        """命中时返回音频文件路径并更新访问顺序，否则返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not os.path.exists(self._entry_path(key, entry)):
+                # 文件被外部删除
+                self._entries.pop(key)
+                self._total_bytes -= entry['size']
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry['last_access'] = time.time()
+            self._entries.move_to_end(key)
+            self._dirty = True
+            self._save_index()
+            return self._entry_path(key, entry)
+
+    def open_writer(self, extension=None):
+        """extension 为音频格式的文件扩展名（如 .mp3），未指定时为 default_extension"""
+        temp_path = os.path.join(self.directory, f'.{uuid.uuid4().hex}.part')
+        return CacheWriter(self, temp_path, extension or self.default_extension)
+
+    def _commit(self, key, temp_path, size, extension):
+        if size > self.max_bytes:
+            os.remove(temp_path)
+            return False
+        with self._lock:
+            path = self._path(key, extension)
+            os.replace(temp_path, path)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old['size']
+                old_path = self._entry_path(key, old)
+                if old_path != path:
+                    try:
+                        os.remove(old_path)
+                    except OSError:
+                        pass
+            self._entries[key] = {'size': size, 'last_access': time.time(), 'extension': extension}
+            self._total_bytes += size
+            self.stores += 1
+            self._dirty = True
+            self._evict()
+            self._save_index(force=True)
+        return True
+
+    def flush(self):
+        with self._lock:
+            self._save_index(force=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'directory': self.directory,
+                'entries': len(self._entries),
+                'total_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'stores': self.stores,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,158 @@
+# TTS文本分段
+# 客户端可以按LLM的输出速度逐个片段推送文本，分段器把片段缓冲起来，
+# 在句子或分句边界处合并成大小合适的段落再交给合成器
+import logging
+import threading
+import time
+
+logger = logging.getLogger('speech_server')
+
+SENTENCE_ENDINGS = '。！？；!?;\n…'
+CLAUSE_ENDINGS = '，、：,:—'
+CLOSING_MARKS = '"\'”’」』）)】]'  # 紧跟在句末标点后的引号、括号归入前一段
+
+
+class TextChunker:
+    """单个TTS会话的文本分段器
+
+    - 缓冲区出现句末标点且长度不少于 min_chars 时输出一段（第一段使用 first_min_chars，尽快出声）
+    - 长度达到 clause_chars 时在分句标点处输出
+    - 长度达到 max_chars 时在空白处或直接截断输出
+    - 文本在缓冲区中停留超过 max_delay 秒时由定时器输出，保证延迟有上限
+    sink(text) 在持有分段器的锁时被调用，保证各段按顺序发送。
+    """
+
+    def __init__(self, sink, min_chars=6, first_min_chars=2, clause_chars=20, max_chars=80,
+                 max_delay=0.4, on_error=None):
+        self.sink = sink
+        self.min_chars = min_chars
+        self.first_min_chars = first_min_chars
+        self.clause_chars = clause_chars
+        self.max_chars = max_chars
+        self.max_delay = max_delay
+        self.on_error = on_error  # 定时器输出失败时调用，参数为异常
+        self._lock = threading.RLock()
+        self._buffer = ''
+        self._buffered_at = None
+        self._timer = None
+        self._closed = False
+        self.pieces_received = 0
+        self.segments_sent = 0
+        self.deadline_flushes = 0
+        self.chars_sent = 0
+
+    @property
+    def buffered(self):
+        return len(self._buffer)
+
+    def _find_cut(self, text, min_chars):
+        """返回本次应输出的长度，0表示继续等待"""
+        limit = min(len(text), self.max_chars)
+        for endings, threshold in ((SENTENCE_ENDINGS, min_chars), (CLAUSE_ENDINGS, self.clause_chars)):
+            for index in range(max(threshold, 1) - 1, limit):
+                char = text[index]
+                # 英文句号后面跟空白才算句末，避免切开小数和缩写
+                if char in endings or (char == '.' and endings is SENTENCE_ENDINGS
+                                       and index + 1 < len(text) and text[index + 1].isspace()):
+                    cut = index + 1
+                    while cut < len(text) and text[cut] in CLOSING_MARKS:
+                        cut += 1
+                    return cut
+        if len(text) >= self.max_chars:
+            space = text.rfind(' ', min_chars, self.max_chars)
+            return space + 1 if space > 0 else self.max_chars
+        return 0
+
+    def _emit(self, text):
+        # 调用方必须持有 self._lock
+        self.sink(text)
+        self.segments_sent += 1
+        self.chars_sent += len(text)
+
+    def _drain(self):
+        # 调用方必须持有 self._lock
+        while self._buffer:
+            min_chars = self.first_min_chars if self.segments_sent == 0 else self.min_chars
+            cut = self._find_cut(self._buffer, min_chars)
+            if not cut:
+                break
+            segment, self._buffer = self._buffer[:cut], self._buffer[cut:]
+            self._buffered_at = time.monotonic() if self._buffer else None
+            self._emit(segment)
+
+    def feed(self, text):
+        """放入一段文本，凑够一段时立即在调用线程中输出"""
+        if not text:
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self.pieces_received += 1
+            if not self._buffer:
+                self._buffered_at = time.monotonic()
+            self._buffer += text
+            self._drain()
+            self._schedule()
+
+    def flush(self, text=''):
+        """输出缓冲区中剩余的全部文本（连同 text 作为一段）"""
+        with self._lock:
+            self._cancel_timer()
+            if text and not self._closed:
+                self.pieces_received += 1
+                self._buffer += text
+            if self._buffer:
+                segment, self._buffer = self._buffer, ''
+                self._buffered_at = None
+                self._emit(segment)
+
+    def _schedule(self):
+        # 调用方必须持有 self._lock
+        if not self._buffer or self.max_delay is None:
+            self._cancel_timer()
+            return
+        if self._timer is not None:
+            return
+        delay = max(0.0, self._buffered_at + self.max_delay - time.monotonic())
+        self._timer = threading.Timer(delay, self._on_deadline)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_deadline(self):
+        with self._lock:
+            self._timer = None
+            if self._closed or not self._buffer:
+                return
+            if time.monotonic() - self._buffered_at < self.max_delay:
+                # 期间已输出过一段，按剩余文本的缓冲时间重新计时
+                self._schedule()
+                return
+            self.deadline_flushes += 1
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f'定时输出TTS文本失败: {e}')
+                if self.on_error is not None:
+                    self.on_error(e)
+
+    def close(self):
+        """丢弃未输出的文本并停止定时器"""
+        with self._lock:
+            self._closed = True
+            self._cancel_timer()
+            self._buffer = ''
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pieces_received': self.pieces_received,
+                'segments_sent': self.segments_sent,
+                'deadline_flushes': self.deadline_flushes,
+                'chars_sent': self.chars_sent,
+                'buffered_chars': len(self._buffer),
+            }
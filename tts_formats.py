@@ -0,0 +1,223 @@
+# TTS输出格式
+# 客户端在创建会话时选择格式、采样率和码率。合成服务输出PCM，经逐块的流式编码器转换后
+# 再交给音频流、缓存和文件，三者保存的都是压缩后的数据；本地播放直接使用编码前的PCM。
+# 低码率MP3由 lameenc 在服务端编码（可选依赖），未安装时退回合成服务自带的MP3（码率较高）
+import logging
+import time
+
+from speech_metrics import registry
+
+logger = logging.getLogger('speech_server')
+
+TTS_ENCODE_SECONDS = registry.counter('speech_tts_encode_seconds_total', 'TTS音频编码占用的CPU时间（秒）')
+
+CODEC_WAV = 'wav'
+CODEC_PCM = 'pcm'
+CODEC_MP3 = 'mp3'
+CODECS = (CODEC_WAV, CODEC_PCM, CODEC_MP3)
+
+SAMPLE_RATES = (8000, 16000, 22050, 24000, 44100, 48000)  # 合成服务支持的采样率
+SDK_MP3_BITRATES = {8000: 128, 16000: 128}  # 合成服务自带MP3的码率（kbps），其余采样率为256
+DEFAULT_SAMPLE_RATE = 16000
+DEFAULT_MP3_BITRATE = 24   # 服务端编码MP3的默认码率（kbps），16kHz单声道约为WAV的1/10
+MIN_MP3_BITRATE = 8
+MAX_MP3_BITRATE = 320
+MP3_QUALITY = 5            # LAME编码质量 2（最好、最慢）- 7（最快）
+
+MIMETYPES = {CODEC_WAV: 'audio/wav', CODEC_MP3: 'audio/mpeg'}
+EXTENSIONS = {CODEC_WAV: '.wav', CODEC_PCM: '.pcm', CODEC_MP3: '.mp3'}
+
+_lameenc = None
+
+
+def load_mp3_encoder():
+    """返回 lameenc 模块，未安装时返回None"""
+    global _lameenc
+    if _lameenc is None:
+        try:
+            import lameenc
+        except ImportError:
+            _lameenc = False
+        else:
+            _lameenc = lameenc
+    return _lameenc or None
+
+
+def pcm_mimetype(sample_rate):
+    return f'audio/L16;rate={sample_rate};channels=1'
+
+
+def wav_header(sample_rate, data_size=0):
+    """16位单声道WAV头；流式输出时长度未知，长度字段为0（写文件时由 fix_wav_sizes 修正）"""
+    riff_size = data_size + 36 if data_size else 0
+    return (b'RIFF' + riff_size.to_bytes(4, 'little') + b'WAVE'
+            + b'fmt ' + (16).to_bytes(4, 'little') + (1).to_bytes(2, 'little') + (1).to_bytes(2, 'little')
+            + sample_rate.to_bytes(4, 'little') + (sample_rate * 2).to_bytes(4, 'little')
+            + (2).to_bytes(2, 'little') + (16).to_bytes(2, 'little')
+            + b'data' + data_size.to_bytes(4, 'little'))
+
+
+class AudioOutputFormat:
+    """协商后的输出格式
+
+    server_encoded 为True时向合成服务请求PCM，由服务端编码为目标格式；
+    为False时合成服务直接输出目标格式（只用于MP3，此时没有PCM可供本地播放）。
+    """
+
+    __slots__ = ('codec', 'sample_rate', 'bitrate', 'server_encoded')
+
+    def __init__(self, codec=CODEC_WAV, sample_rate=DEFAULT_SAMPLE_RATE, bitrate=None, server_encoded=True):
+        self.codec = codec
+        self.sample_rate = sample_rate
+        self.bitrate = bitrate
+        self.server_encoded = server_encoded
+
+    def __str__(self):
+        # 用于缓存键，同一格式的字符串相同
+        name = f'{self.codec}_{self.sample_rate}'
+        return f'{name}_{self.bitrate}k' if self.codec == CODEC_MP3 else name
+
+    @property
+    def has_pcm(self):
+        """合成服务输出的是否为PCM（可用于本地播放）"""
+        return self.server_encoded
+
+    @property
+    def source_format(self):
+        """向合成服务请求的格式（SDK中 AudioFormat 的成员名）"""
+        if self.server_encoded:
+            return f'PCM_{self.sample_rate}HZ_MONO_16BIT'
+        return f'MP3_{self.sample_rate}HZ_MONO_{self.bitrate}KBPS'
+
+    @property
+    def mimetype(self):
+        return MIMETYPES.get(self.codec) or pcm_mimetype(self.sample_rate)
+
+    @property
+    def extension(self):
+        return EXTENSIONS[self.codec]
+
+    def create_encoder(self):
+        if not self.server_encoded or self.codec == CODEC_PCM:
+            return PassthroughEncoder()
+        if self.codec == CODEC_WAV:
+            return WavEncoder(self.sample_rate)
+        return Mp3Encoder(self.sample_rate, self.bitrate)
+
+    def encode_all(self, data):
+        """编码一段完整的音频（批量合成使用）"""
+        encoder = self.create_encoder()
+        return encoder.encode(data) + encoder.flush()
+
+    def as_dict(self):
+        return {
+            'format': self.codec,
+            'sample_rate': self.sample_rate,
+            'bitrate': self.bitrate,
+            'encoder': ('lame' if self.codec == CODEC_MP3 else 'server') if self.server_encoded else 'sdk',
+            'mimetype': self.mimetype,
+        }
+
+
+def negotiate_format(codec=None, sample_rate=None, bitrate=None, need_pcm=False, default=None,
+                     mp3_bitrate=DEFAULT_MP3_BITRATE):
+    """按客户端的请求确定输出格式，不支持时抛出ValueError
+
+    未指定的格式和采样率取 default（AudioOutputFormat）的值。need_pcm 为True（本地播放）时
+    必须由服务端编码。MP3未指定码率时使用 mp3_bitrate，服务器未安装编码器时退回合成服务自带的码率。
+    """
+    default = default or AudioOutputFormat()
+    codec = str(codec or default.codec).lower()
+    if codec not in CODECS:
+        raise ValueError(f'不支持的音频格式: {codec}，可选: {", ".join(CODECS)}')
+    try:
+        sample_rate = int(sample_rate or default.sample_rate)
+        bitrate = int(bitrate) if bitrate else None
+    except (TypeError, ValueError):
+        raise ValueError('采样率和码率必须为整数')
+    if sample_rate not in SAMPLE_RATES:
+        raise ValueError(f'不支持的采样率: {sample_rate}，可选: {", ".join(map(str, SAMPLE_RATES))}')
+    if codec != CODEC_MP3:
+        return AudioOutputFormat(codec, sample_rate)
+
+    sdk_bitrate = SDK_MP3_BITRATES.get(sample_rate, 256)
+    if bitrate is None:
+        bitrate = mp3_bitrate
+        if load_mp3_encoder() is None and not need_pcm:
+            bitrate = sdk_bitrate
+    if not MIN_MP3_BITRATE <= bitrate <= MAX_MP3_BITRATE:
+        raise ValueError(f'MP3码率必须在 {MIN_MP3_BITRATE}-{MAX_MP3_BITRATE} kbps 之间')
+    if bitrate == sdk_bitrate and not need_pcm:
+        return AudioOutputFormat(codec, sample_rate, bitrate, server_encoded=False)
+    if load_mp3_encoder() is None:
+        if need_pcm:
+            raise ValueError('本地播放MP3需要在服务端编码，服务器未安装 lameenc')
+        raise ValueError(f'服务器未安装 lameenc，{sample_rate}Hz 的MP3只支持 {sdk_bitrate} kbps')
+    return AudioOutputFormat(codec, sample_rate, bitrate)
+
+
+class PassthroughEncoder:
+    """不转换：目标格式为PCM，或合成服务已直接输出目标格式"""
+
+    def encode(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+
+class WavEncoder:
+    """在PCM流的开头加上WAV头"""
+
+    def __init__(self, sample_rate):
+        self.sample_rate = sample_rate
+        self._started = False
+
+    def encode(self, data):
+        if not data:
+            return b''
+        if not self._started:
+            self._started = True
+            return wav_header(self.sample_rate) + data
+        return data
+
+    def flush(self):
+        return b''
+
+
+class Mp3Encoder:
+    """16位单声道PCM逐块编码为MP3
+
+    LAME内部积累到一帧才输出，encode() 可能返回空字节串，结束时由 flush() 输出剩余数据。
+    不是线程安全的，每个音频流使用独立实例。
+    """
+
+    def __init__(self, sample_rate, bitrate):
+        lameenc = load_mp3_encoder()
+        if lameenc is None:
+            raise RuntimeError('未安装 lameenc，无法编码MP3')
+        self._encoder = lameenc.Encoder()
+        self._encoder.set_in_sample_rate(sample_rate)
+        self._encoder.set_channels(1)
+        self._encoder.set_bit_rate(bitrate)
+        self._encoder.set_quality(MP3_QUALITY)
+        self._odd = b''  # 不足一个样本的尾部字节，留到下一块
+        self._pending = False  # 编码器中是否有尚未输出的数据
+
+    def encode(self, data):
+        data = self._odd + bytes(data)
+        usable = len(data) - len(data) % 2
+        data, self._odd = data[:usable], data[usable:]
+        if not data:
+            return b''
+        started = time.thread_time()
+        result = bytes(self._encoder.encode(data))
+        TTS_ENCODE_SECONDS.inc(time.thread_time() - started)
+        self._pending = True
+        return result
+
+    def flush(self):
+        if not self._pending:
+            return b''
+        self._pending = False
+        return bytes(self._encoder.flush())
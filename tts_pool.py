@@ -0,0 +1,319 @@
+# 预热的TTS合成器池
+# 按 (模型, 音色, 格式) 预先建立好WebSocket连接并启动合成任务，创建TTS会话时直接取用，
+# 省去建立连接和等待任务启动的时间
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger('speech_server')
+
+# SDK兼容层
+# SDK的合成器只在第一次 streaming_call 时建立连接并启动任务，没有公开的提前启动接口。
+# 预热依赖 dashscope SpeechSynthesizer 的私有成员（以下版本范围内已验证），
+# 只在这里访问；成员不存在时不预热，其他版本可以使用但会记录警告
+SDK_TESTED_VERSIONS = ((1, 20), (1, 23))  # 已验证的 dashscope 版本 [最低, 最高)
+_SDK_PRIVATE_START = '_SpeechSynthesizer__start_stream'
+_SDK_PRIVATE_ATTRIBUTES = ('_is_first', '_is_started', 'complete_event')
+_sdk_version_checked = False
+
+
+def _check_sdk_version():
+    global _sdk_version_checked
+    if _sdk_version_checked:
+        return
+    _sdk_version_checked = True
+    version = getattr(sys.modules.get('dashscope.version'), '__version__', None)
+    try:
+        parsed = tuple(int(part) for part in version.split('.')[:2])
+    except (AttributeError, ValueError):
+        parsed = None
+    if parsed is None or not SDK_TESTED_VERSIONS[0] <= parsed < SDK_TESTED_VERSIONS[1]:
+        logger.warning(f'dashscope {version} 不在TTS预热已验证的版本范围内，缺少所需的成员时将不预热')
+
+
+def supports_prestart(synthesizer):
+    """合成器能否在发送文本前启动任务：公开的 start_stream（离线替身），或SDK的私有实现"""
+    if callable(getattr(synthesizer, 'start_stream', None)):
+        return True
+    _check_sdk_version()
+    return (callable(getattr(synthesizer, _SDK_PRIVATE_START, None))
+            and all(hasattr(synthesizer, name) for name in _SDK_PRIVATE_ATTRIBUTES))
+
+
+def start_synthesizer(synthesizer):
+    """建立连接并启动合成任务，调用前应先用 supports_prestart() 检查"""
+    start_stream = getattr(synthesizer, 'start_stream', None)
+    if callable(start_stream):
+        start_stream()
+        return
+    getattr(synthesizer, _SDK_PRIVATE_START)()
+    # 之后的 streaming_call 不再启动任务
+    synthesizer._is_first = False
+
+
+def close_synthesizer(synthesizer):
+    """关闭合成器：任务进行中时取消任务，否则只关闭连接"""
+    complete_event = getattr(synthesizer, 'complete_event', None)
+    if getattr(synthesizer, '_is_started', False) and complete_event is not None and not complete_event.is_set():
+        synthesizer.streaming_cancel()
+    elif getattr(synthesizer, 'ws', None) is not None:
+        synthesizer.close()
+
+
+class PooledCallback:
+    """池中合成器的回调：取用前记录连接状态，取用后把事件转发给会话的回调
+
+    接口与SDK的 ResultCallback 相同（SDK只按方法名调用），不继承以免导入本模块时加载SDK。
+    """
+
+    def __init__(self):
+        self.target = None
+        self.dead = False
+
+    def attach(self, target):
+        self.target = target
+        # 连接在预热时已经打开，SDK不会再触发on_open
+        target.on_open()
+
+    def on_open(self):
+        if self.target is not None:
+            self.target.on_open()
+
+    def on_complete(self):
+        if self.target is not None:
+            self.target.on_complete()
+
+    def on_error(self, message):
+        if self.target is not None:
+            self.target.on_error(message)
+        else:
+            logger.warning(f'预热的TTS连接出错: {message}')
+            self.dead = True
+
+    def on_close(self):
+        if self.target is not None:
+            self.target.on_close()
+        else:
+            self.dead = True
+
+    def on_event(self, message):
+        if self.target is not None:
+            self.target.on_event(message)
+
+    def on_data(self, data):
+        if self.target is not None:
+            self.target.on_data(data)
+
+
+class _PoolEntry:
+    def __init__(self, synthesizer, callback):
+        self.synthesizer = synthesizer
+        self.callback = callback
+        self.created_at = time.monotonic()
+
+
+class SynthesizerPool:
+    """按 (模型, 音色, 格式) 分组保存预热的合成器
+
+    每组最多保留 size 个空闲实例，后台线程负责补充和回收：空闲超过 idle_ttl 秒的连接
+    会被关闭（服务端会断开长时间没有文本的任务），超过 key_ttl 秒没有使用的分组不再补充。
+    有实例因空闲过期的分组暂停补充，直到下一次取用，没有请求时不会反复建立和取消任务。
+    SDK不支持提前启动任务时（见 supports_prestart）不预热，取用时总是新建合成器。
+    """
+
+    def __init__(self, size=1, idle_ttl=300.0, key_ttl=600.0, sweep_interval=1.0, prepare=None, factory=None,
+                 finisher=None):
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self.key_ttl = key_ttl
+        self.sweep_interval = sweep_interval
+        self.prepare = prepare  # 创建合成器前调用（例如设置API密钥）
+        self.factory = factory  # 合成器类，参数与SDK的SpeechSynthesizer相同，未指定时使用SDK的实现
+        self.finisher = finisher  # 提供 submit(合成器, 说明) 时由它关闭过期的连接，否则每次新建线程
+        self._cond = threading.Condition()
+        self._idle = {}       # 分组 -> [_PoolEntry]
+        self._last_used = {}  # 分组 -> 最后一次取用的时间
+        self._warming = set()
+        self._dormant = set()  # 实例空闲过期、等待下一次取用后再补充的分组
+        self.prestart_supported = True
+        self._thread = None
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.warmed = 0
+        self.warm_failures = 0
+        self._consecutive_failures = 0
+        self.expired = 0
+        self.hit_latency_total = 0.0
+        self.hit_latency_max = 0.0
+        self.warm_time_total = 0.0
+
+    def _create(self, key, callback):
+        model, voice, audio_format = key
+        if self.prepare is not None:
+            self.prepare()
+        if self.factory is None:
+            from dashscope.audio.tts_v2 import SpeechSynthesizer
+            self.factory = SpeechSynthesizer
+        return self.factory(model=model, voice=voice, format=audio_format, callback=callback)
+
+    def _ensure_thread(self):
+        # 调用方必须持有 self._cond
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name='tts-pool', daemon=True)
+            self._thread.start()
+
+    def preload(self, model, voice, audio_format):
+        """登记需要保持预热的分组，由后台线程建立连接"""
+        with self._cond:
+            self._last_used[(model, voice, audio_format)] = time.monotonic()
+            self._dormant.discard((model, voice, audio_format))
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def acquire(self, model, voice, audio_format, callback):
+        """取出一个合成器并绑定回调，返回 (合成器, 是否为预热实例)
+
+        池中没有可用实例时创建一个未连接的合成器，连接在第一次发送文本时建立。
+        """
+        started = time.perf_counter()
+        key = (model, voice, audio_format)
+        entry = None
+        with self._cond:
+            self._last_used[key] = time.monotonic()
+            self._dormant.discard(key)
+            entries = self._idle.get(key, [])
+            while entries:
+                candidate = entries.pop()
+                if candidate.callback.dead:
+                    continue
+                entry = candidate
+                break
+            if entry is None:
+                self.misses += 1
+            self._ensure_thread()
+            self._cond.notify_all()
+        if entry is None:
+            return self._create(key, callback), False
+        entry.callback.attach(callback)
+        latency = time.perf_counter() - started
+        with self._cond:
+            self.hits += 1
+            self.hit_latency_total += latency
+            self.hit_latency_max = max(self.hit_latency_max, latency)
+        return entry.synthesizer, True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                self._expire_locked()
+                key = self._next_key_locked()
+                if key is None:
+                    self._cond.wait(self.sweep_interval)
+                    continue
+                self._warming.add(key)
+            try:
+                self._warm(key)
+            finally:
+                with self._cond:
+                    self._warming.discard(key)
+
+    def _next_key_locked(self):
+        """返回需要补充实例的分组"""
+        if not self.prestart_supported:
+            return None
+        now = time.monotonic()
+        for key, last_used in self._last_used.items():
+            if key in self._warming or key in self._dormant or now - last_used > self.key_ttl:
+                continue
+            if len(self._idle.get(key, [])) < self.size:
+                return key
+        return None
+
+    def _expire_locked(self):
+        now = time.monotonic()
+        for key, entries in self._idle.items():
+            keep = []
+            for entry in entries:
+                if entry.callback.dead or now - entry.created_at > self.idle_ttl:
+                    self.expired += 1
+                    self._discard_later(entry)
+                    self._dormant.add(key)
+                else:
+                    keep.append(entry)
+            entries[:] = keep
+
+    def _discard_later(self, entry):
+        if self.finisher is not None:
+            self.finisher.submit(entry.synthesizer, 'tts-pool')
+        else:
+            threading.Thread(target=self._discard, args=(entry,), daemon=True).start()
+
+    def _discard(self, entry):
+        try:
+            close_synthesizer(entry.synthesizer)
+        except Exception as e:
+            logger.debug(f'关闭空闲TTS连接出错: {e}')
+
+    def _warm(self, key):
+        started = time.perf_counter()
+        callback = PooledCallback()
+        try:
+            synthesizer = self._create(key, callback)
+            if not supports_prestart(synthesizer):
+                logger.warning('TTS合成器不支持提前启动任务，不再预热')
+                with self._cond:
+                    self.prestart_supported = False
+                self._discard_later(_PoolEntry(synthesizer, callback))
+                return
+            start_synthesizer(synthesizer)
+        except Exception as e:
+            logger.warning(f'预热TTS连接失败 ({key[0]}, {key[1]}): {e}')
+            with self._cond:
+                self.warm_failures += 1
+                self._consecutive_failures += 1
+                # 连续失败时逐步延长重试间隔（例如API密钥无效或网络不可用）
+                self._cond.wait(min(60.0, self.sweep_interval * 2 ** self._consecutive_failures))
+            return
+        elapsed = time.perf_counter() - started
+        with self._cond:
+            if self._closed:
+                self._discard_later(_PoolEntry(synthesizer, callback))
+                return
+            self._idle.setdefault(key, []).append(_PoolEntry(synthesizer, callback))
+            self.warmed += 1
+            self.warm_time_total += elapsed
+            self._consecutive_failures = 0
+        logger.info(f'已预热TTS连接: 模型={key[0]}, 音色={key[1]}, 耗时 {elapsed * 1000:.0f}ms')
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            entries = [entry for entries in self._idle.values() for entry in entries]
+            self._idle.clear()
+            self._cond.notify_all()
+        for entry in entries:
+            self._discard(entry)
+
+    def stats(self):
+        with self._cond:
+            acquires = self.hits + self.misses
+            return {
+                'size': self.size,
+                'prestart_supported': self.prestart_supported,
+                'idle_ttl': self.idle_ttl,
+                'dormant': len(self._dormant),
+                'idle': {f'{key[0]}/{key[1]}': len(entries) for key, entries in self._idle.items()},
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / acquires if acquires else 0.0,
+                'hit_latency_avg_ms': self.hit_latency_total / self.hits * 1000 if self.hits else 0.0,
+                'hit_latency_max_ms': self.hit_latency_max * 1000,
+                'warmed': self.warmed,
+                'warm_failures': self.warm_failures,
+                'warm_time_avg_ms': self.warm_time_total / self.warmed * 1000 if self.warmed else 0.0,
+                'expired': self.expired,
+            }
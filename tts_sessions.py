@@ -0,0 +1,317 @@
+# TTS会话登记
+# 记录每个会话的合成器、回调和最后活动时间。后台线程关闭空闲超过 idle_ttl 秒的会话，
+# 会话数超过上限时关闭最久未活动的会话，客户端异常退出（例如渲染进程崩溃）后
+# 合成器、连接和播放通道不会一直留在进程里。合成器在固定数量的线程中关闭，长时间运行时线程数不增长
+import logging
+import queue
+import threading
+import time
+
+from tts_pool import close_synthesizer
+
+logger = logging.getLogger('speech_server')
+
+# 会话被关闭的原因
+CLOSE_STOPPED = 'stopped'    # 客户端主动停止
+CLOSE_IDLE = 'idle'          # 空闲超时
+CLOSE_EVICTED = 'evicted'    # 超过会话数上限
+CLOSE_SHUTDOWN = 'shutdown'  # 服务器关闭
+
+
+def force_close_synthesizer(synthesizer):
+    """只关闭连接，不发送结束或取消请求"""
+    if getattr(synthesizer, 'ws', None) is not None:
+        synthesizer.close()
+
+
+class SynthesizerFinisher:
+    """在固定数量的线程中关闭合成器
+
+    关闭可能阻塞在网络上：运行超过 timeout 秒的任务计入 timeouts 并记录警告；
+    排队超过 timeout 秒才轮到的合成器只关闭连接。队列已满时在调用线程中只关闭连接。
+    """
+
+    def __init__(self, workers=2, timeout=10.0, max_pending=256, close=close_synthesizer):
+        self.workers = workers
+        self.timeout = timeout
+        self.close = close
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = {}  # 线程名 -> (说明, 开始时间)
+        self._closed = False
+        self.finished = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.forced = 0
+
+    def _ensure_threads(self):
+        # 调用方必须持有 self._lock
+        while len(self._threads) < self.workers and not self._closed:
+            thread = threading.Thread(target=self._run, name=f'tts-finisher-{len(self._threads)}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(self, synthesizer, label=''):
+        if synthesizer is None:
+            return
+        with self._lock:
+            self._ensure_threads()
+            closed = self._closed
+        if not closed:
+            try:
+                self._queue.put_nowait((synthesizer, label, time.monotonic()))
+                return
+            except queue.Full:
+                logger.warning(f'待关闭的TTS合成器过多，直接关闭连接: {label}')
+        self._force(synthesizer, label)
+
+    def _force(self, synthesizer, label):
+        try:
+            force_close_synthesizer(synthesizer)
+        except Exception as e:
+            logger.debug(f'关闭TTS连接出错: {label}, {e}')
+        with self._lock:
+            self.forced += 1
+
+    def _run(self):
+        name = threading.current_thread().name
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            synthesizer, label, queued_at = item
+            started = time.monotonic()
+            if started - queued_at > self.timeout:
+                self._force(synthesizer, label)
+                continue
+            self._running[name] = (label, started)
+            try:
+                self.close(synthesizer)
+                failed = False
+            except Exception as e:
+                logger.warning(f'关闭TTS合成器出错: {label}, {e}')
+                failed = True
+            finally:
+                self._running.pop(name, None)
+            elapsed = time.monotonic() - started
+            with self._lock:
+                if failed:
+                    self.failed += 1
+                else:
+                    self.finished += 1
+                if elapsed > self.timeout:
+                    self.timeouts += 1
+            if elapsed > self.timeout:
+                logger.warning(f'关闭TTS合成器耗时 {elapsed:.1f} 秒: {label}')
+
+    def stuck(self):
+        """返回运行已超过 timeout 秒的任务说明"""
+        now = time.monotonic()
+        return [label for label, started in list(self._running.values()) if now - started > self.timeout]
+
+    def shutdown(self):
+        """停止接收新任务，工作线程处理完已排队的任务后退出"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            threads = list(self._threads)
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=self.timeout)
+            except queue.Full:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self._queue.qsize(),
+                'running': len(self._running),
+                'stuck': len(self.stuck()),
+                'finished': self.finished,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+                'forced': self.forced,
+                'timeout': self.timeout,
+            }
+
+
+class TtsSessionEntry:
+    __slots__ = ('session_id', 'synthesizer', 'callback', 'created_at', 'last_active')
+
+    def __init__(self, session_id, synthesizer, callback):
+        self.session_id = session_id
+        self.synthesizer = synthesizer
+        self.callback = callback
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+
+    def activity(self):
+        """最后活动时间：客户端请求或收到音频数据，取较晚者"""
+        data_at = getattr(self.callback, 'last_activity', None)
+        return max(self.last_active, data_at) if data_at is not None else self.last_active
+
+
+class TtsSessionRegistry:
+    """TTS会话的登记表
+
+    synthesizers 和 callbacks 为会话ID到合成器/回调的映射，供读取使用；增删会话通过
+    register / pop 完成。会话被登记表关闭（空闲、超过上限、服务器关闭）时调用
+    close_session(会话ID, 条目, 原因)，在登记表的锁之外执行。
+    is_busy(条目) 返回True的会话（例如仍在本地播放）不会因空闲被关闭，超过上限时最后才被关闭。
+    """
+
+    def __init__(self, close_session, idle_ttl=300.0, max_sessions=32, sweep_interval=5.0, is_busy=None):
+        self.close_session = close_session
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self.is_busy = is_busy
+        self._cond = threading.Condition()
+        self._entries = {}
+        self.synthesizers = {}
+        self.callbacks = {}
+        self._thread = None
+        self._closed = False
+        self.registered = 0
+        self.closed_counts = {CLOSE_STOPPED: 0, CLOSE_IDLE: 0, CLOSE_EVICTED: 0, CLOSE_SHUTDOWN: 0}
+
+    def __contains__(self, session_id):
+        return session_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _busy(self, entry):
+        if self.is_busy is None:
+            return False
+        try:
+            return bool(self.is_busy(entry))
+        except Exception:
+            return False
+
+    def _ensure_thread(self):
+        # 调用方必须持有 self._cond
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name='tts-session-reaper', daemon=True)
+            self._thread.start()
+
+    def _remove_locked(self, session_id):
+        entry = self._entries.pop(session_id, None)
+        self.synthesizers.pop(session_id, None)
+        self.callbacks.pop(session_id, None)
+        return entry
+
+    def register(self, session_id, synthesizer, callback):
+        """登记会话（同一ID再次登记时替换合成器和回调，例如会话重建）；超过上限时关闭最久未活动的会话"""
+        evicted = []
+        with self._cond:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                entry = TtsSessionEntry(session_id, synthesizer, callback)
+                self._entries[session_id] = entry
+                self.registered += 1
+            else:
+                entry.synthesizer, entry.callback = synthesizer, callback
+                entry.last_active = time.monotonic()
+            self.synthesizers[session_id] = synthesizer
+            self.callbacks[session_id] = callback
+            overflow = len(self._entries) - max(1, self.max_sessions)
+            if overflow > 0:
+                candidates = sorted((e for e in self._entries.values() if e is not entry),
+                                    key=lambda e: (self._busy(e), e.activity()))
+                for victim in candidates[:overflow]:
+                    evicted.append(self._remove_locked(victim.session_id))
+                    self.closed_counts[CLOSE_EVICTED] += 1
+            self._ensure_thread()
+        for victim in evicted:
+            logger.warning(f'TTS会话数超过上限 ({self.max_sessions})，关闭最久未活动的会话: {victim.session_id}')
+            self._close(victim, CLOSE_EVICTED)
+        return entry
+
+    def touch(self, session_id):
+        """记录客户端活动；会话不存在时返回False"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return False
+        entry.last_active = time.monotonic()
+        return True
+
+    def get(self, session_id):
+        return self._entries.get(session_id)
+
+    def pop(self, session_id, reason=CLOSE_STOPPED):
+        """移除会话并返回其条目，由调用方负责关闭；会话不存在时返回None"""
+        with self._cond:
+            entry = self._remove_locked(session_id)
+            if entry is not None:
+                self.closed_counts[reason] = self.closed_counts.get(reason, 0) + 1
+        return entry
+
+    def _close(self, entry, reason):
+        try:
+            self.close_session(entry.session_id, entry, reason)
+        except Exception as e:
+            logger.error(f'关闭TTS会话 {entry.session_id} 出错: {e}', exc_info=True)
+
+    def reap(self):
+        """关闭空闲超时的会话，返回关闭的会话数"""
+        if self.idle_ttl <= 0:
+            return 0
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            for session_id, entry in list(self._entries.items()):
+                if now - entry.activity() > self.idle_ttl and not self._busy(entry):
+                    expired.append(self._remove_locked(session_id))
+                    self.closed_counts[CLOSE_IDLE] += 1
+        for entry in expired:
+            logger.info(f'TTS会话空闲超过 {self.idle_ttl:.0f} 秒，自动关闭: {entry.session_id}')
+            self._close(entry, CLOSE_IDLE)
+        return len(expired)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                self._cond.wait(self.sweep_interval)
+                if self._closed:
+                    return
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f'清理空闲TTS会话出错: {e}', exc_info=True)
+
+    def list_sessions(self):
+        now = time.monotonic()
+        with self._cond:
+            entries = list(self._entries.values())
+        return [{
+            'session_id': entry.session_id,
+            'age': round(now - entry.created_at, 1),
+            'idle': round(now - entry.activity(), 1),
+            'busy': self._busy(entry),
+        } for entry in entries]
+
+    def close(self):
+        """停止后台线程并关闭所有会话"""
+        with self._cond:
+            self._closed = True
+            entries = [self._remove_locked(session_id) for session_id in list(self._entries)]
+            self.closed_counts[CLOSE_SHUTDOWN] += len(entries)
+            self._cond.notify_all()
+        for entry in entries:
+            self._close(entry, CLOSE_SHUTDOWN)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'sessions': len(self._entries),
+                'max_sessions': self.max_sessions,
+                'idle_ttl': self.idle_ttl,
+                'registered': self.registered,
+                'closed': dict(self.closed_counts),
+            }
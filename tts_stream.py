@@ -0,0 +1,160 @@
+# TTS音频流缓冲
+# 合成回调产生的音频按字节偏移追加到缓冲区，HTTP客户端通过游标拉取或以分块响应持续读取
+import threading
+
+
+def find_wav_data_offset(data):
+    """返回WAV数据块中PCM数据的起始偏移，数据不足以判断时返回None"""
+    if len(data) < 12:
+        return None if b'RIFF'.startswith(data[:4]) else 0
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        return 0
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = int.from_bytes(data[offset + 4:offset + 8], 'little')
+        if chunk_id == b'data':
+            return offset + 8
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+class TtsAudioBuffer:
+    """单个TTS会话的音频缓冲区
+
+    写入方（合成回调）只追加数据，读取方按字节游标读取，多个读取方互不影响。
+    缓冲的数据超过 max_bytes 时丢弃最早的数据，落后的读取方从仍保留的位置继续。
+    audio_format 为数据的格式（tts_formats.AudioOutputFormat），供读取方设置响应类型。
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, audio_format=None):
+        self.max_bytes = max_bytes
+        self.audio_format = audio_format
+        self._cond = threading.Condition()
+        self._chunks = []
+        self._start = 0  # 缓冲区中第一个字节的偏移
+        self._end = 0    # 已写入的总字节数
+        self._header = b''
+        self.pcm_offset = None  # WAV头之后PCM数据的起始偏移
+        self.done = False
+        self.error = None
+        self._listeners = ()  # 有新数据或结束时调用，用于唤醒其他线程或事件循环中的读取方
+
+    @property
+    def size(self):
+        return self._end
+
+    def add_listener(self, listener):
+        with self._cond:
+            self._listeners = self._listeners + (listener,)
+
+    def remove_listener(self, listener):
+        with self._cond:
+            self._listeners = tuple(l for l in self._listeners if l is not listener)
+
+    def _notify_listeners(self):
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception:
+                pass
+
+    def append(self, data):
+        if not data:
+            return
+        with self._cond:
+            if self.done:
+                return
+            if self.pcm_offset is None:
+                # 在流的开头解析WAV头，供读取裸PCM的客户端跳过
+                self._header += data
+                self.pcm_offset = find_wav_data_offset(self._header)
+                if self.pcm_offset is not None or len(self._header) > 4096:
+                    self.pcm_offset = self.pcm_offset or 0
+                    self._header = b''
+            self._chunks.append((self._end, data))
+            self._end += len(data)
+            while self._end - self._start > self.max_bytes and len(self._chunks) > 1:
+                offset, chunk = self._chunks.pop(0)
+                self._start = offset + len(chunk)
+            self._cond.notify_all()
+        self._notify_listeners()
+
+    def finish(self, error=None):
+        with self._cond:
+            if self.done:
+                return
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+        self._notify_listeners()
+
+    def read(self, cursor, max_bytes=None):
+        """从游标处读取已有数据，返回 (数据, 新游标)"""
+        with self._cond:
+            return self._read_locked(cursor, max_bytes)
+
+    def _read_locked(self, cursor, max_bytes=None):
+        cursor = max(cursor, self._start)
+        parts = []
+        size = 0
+        for offset, chunk in self._chunks:
+            if offset + len(chunk) <= cursor:
+                continue
+            part = chunk[cursor - offset:] if offset < cursor else chunk
+            if max_bytes is not None and size + len(part) > max_bytes:
+                part = part[:max_bytes - size]
+            parts.append(part)
+            size += len(part)
+            cursor += len(part)
+            if max_bytes is not None and size >= max_bytes:
+                break
+        return b''.join(parts), cursor
+
+    def wait(self, cursor, timeout):
+        """等待游标之后有新数据或合成结束，返回 (数据, 新游标)"""
+        with self._cond:
+            if cursor >= self._end and not self.done:
+                self._cond.wait(timeout)
+            return self._read_locked(cursor)
+
+    def at_end(self, cursor):
+        return self.done and cursor >= self._end
+
+    def pcm_cursor(self, cursor):
+        """把游标调整到WAV头之后；WAV头尚未完整收到时返回None"""
+        if self.pcm_offset is None:
+            return None
+        return max(cursor, self.pcm_offset)
+
+    def stream(self, cursor=0, timeout=0.5, should_stop=None, skip_header=False):
+        """逐块产生音频数据直到合成结束，供分块HTTP响应使用
+
+        skip_header 为True时跳过WAV头，只输出裸PCM。
+        """
+        while True:
+            if skip_header and self.pcm_offset is None:
+                self.wait(self._end, timeout)
+                if self.pcm_offset is None:
+                    if self.done or (should_stop is not None and should_stop()):
+                        return
+                    continue
+            if skip_header:
+                cursor = max(cursor, self.pcm_offset)
+            data, cursor = self.wait(cursor, timeout)
+            if data:
+                yield data
+            elif self.at_end(cursor):
+                return
+            if should_stop is not None and should_stop():
+                return
+
+    def stats(self):
+        with self._cond:
+            return {
+                'bytes': self._end,
+                'buffered_bytes': self._end - self._start,
+                'pcm_offset': self.pcm_offset,
+                'done': self.done,
+                'error': self.error,
+            }